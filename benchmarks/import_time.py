@@ -0,0 +1,56 @@
+"""
+Measures the startup cost of a Sentrywire client
+
+Each sample runs a fresh interpreter so nothing is cached between samples. "lazy" imports sentrywire and creates a
+client, which is what a short lived tool pays before its first request. "eager" also creates every handler and
+imports requests, which is what creating a client used to cost.
+
+usage:
+    python benchmarks/import_time.py [samples]
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = [
+    ("lazy", "import sentrywire; sentrywire.Sentrywire('192.0.2.1')"),
+    ("eager", "import sentrywire; sw = sentrywire.Sentrywire('192.0.2.1'); import requests; "
+              "[getattr(sw, name) for name in ('activetriggers', 'authentication', 'authorization', 'federation', "
+              "'idsrules', 'precapturefilter', 'searches', 'logs', 'server')]; "
+              "sw.searches.objects; sw.searches.pcaps; sw.searches.watcher; sw.searches.sharded; "
+              "sw.federation.groups; sw.federation.fanout; sw.server.capture; sw.authorization.roles"),
+]
+
+TIMER = """
+import time
+start = time.time()
+%s
+print(time.time() - start)
+"""
+
+CHECK = """
+import sys
+%s
+print(",".join(name for name in ("requests", "json", "zipfile", "concurrent.futures", "sentrywire.v2.search")
+               if name in sys.modules))
+"""
+
+
+def run(code):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.check_output([sys.executable, "-c", code], env=env).decode().strip()
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for name, code in SCENARIOS:
+        times = sorted(float(run(TIMER % code)) * 1000 for _ in range(samples))
+        median = times[len(times) // 2]
+        print("%-8s median %7.2f ms  min %7.2f ms  loaded: %s"
+              % (name, median, times[0], run(CHECK % code) or "-"))
+
+
+if __name__ == "__main__":
+    main()
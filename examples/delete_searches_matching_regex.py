@@ -1,6 +1,7 @@
 import sys
 
 from sentrywire.client import Sentrywire
+from sentrywire.v2 import SearchIndex
 import os
 import re
 
@@ -29,14 +30,23 @@ def delete_searches_matching_regex(pattern):
     sw = Sentrywire(os.getenv("TARGET"), ssl_verify=False)
     sw.authentication.login(os.getenv("SW_USERNAME"), os.getenv("SW_PASSWORD"))
 
-    completed_searches = sw.searches.completed()
+    if os.getenv("INDEX_PATH"):
+        # Only pull searches completed since the last run, and match the pattern locally
+        index = SearchIndex(sw, os.getenv("INDEX_PATH"))
+        index.sync()
+        completed_searches = index.find(pattern=pattern)
+        delete = index.delete
+    else:
+        completed_searches = sw.searches.completed()
+        delete = sw.searches.delete
+
     search_names = []
     for item in completed_searches:
         if re.search(pattern, item["SearchName"]):
             if os.getenv("DEBUG"):
-                print("Deleting " + item["Searchname"])
+                print("Deleting " + item["SearchName"])
             search_names.append(item["SearchName"])
-            sw.searches.delete(item["SearchName"])
+            delete(item["SearchName"])
 
     print(str(search_names))
     return search_names
@@ -47,5 +57,7 @@ if __name__ == "__main__":
     Example: Delete all searches run by continuum. Username and search name are part of the search token
     
     python delete_searches_matching_regex continuum
+
+    Set INDEX_PATH to a file to keep a local index of completed searches between runs
     """
     delete_searches_matching_regex(sys.argv[1])
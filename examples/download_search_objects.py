@@ -1,5 +1,4 @@
 import sys
-import time
 
 from sentrywire.client import Sentrywire
 import os
@@ -32,14 +31,8 @@ def download_search_objects(node_name, search_token, destination_directory):
     sw = Sentrywire(os.getenv("TARGET"), ssl_verify=False)
     sw.authentication.login(os.getenv("SW_USERNAME"), os.getenv("SW_PASSWORD"))
 
-    while True:
-        response = sw.searches.status(node_name, search_token)
-        if "SearchStatus" in response:
-            time.sleep(5)
-        elif "SearchResult" in response:
-            break
-        else:
-            raise Exception("Unexpected search state: " + str(response))
+    # Block until the search shows up in the completed searches
+    sw.searches.watch(search_token).result()
 
     response = sw.searches.objects.get(node_name, search_token, file_name)
 
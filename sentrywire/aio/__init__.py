@@ -0,0 +1 @@
+from sentrywire.aio.client import AsyncSentrywire
@@ -0,0 +1,411 @@
+import asyncio
+import os
+
+import sentrywire.const
+from sentrywire.client import Sentrywire
+from sentrywire.exceptions import ErrorLookupTable, RangeNotSatisfiable, SentrywireException
+from sentrywire.retry import RetryBudget, RetryPolicy
+
+
+class AsyncSentrywire:
+    """
+    Tracks session for an asyncio API connection
+
+    Mirrors the handler tree of sentrywire.client.Sentrywire, but every handler method returns an awaitable and all
+    requests share one pooled aiohttp connector. The handlers are those of sentrywire.v2, only methods that work on
+    the answer of the unit are rewritten as coroutines in sentrywire.aio.v2. Requires the aiohttp library.
+    """
+
+    def __init__(self,
+                 host,
+                 rest_token=None,
+                 session=None,
+                 api_version="2",
+                 ssl_verify=True,
+                 retry_transient_errors=False,
+                 timeout=sentrywire.const.TIMEOUT,
+                 server_port=sentrywire.const.SERVER_PORT,
+                 user_agent=sentrywire.const.USER_AGENT,
+                 pool_maxsize=sentrywire.const.ASYNC_POOL_MAXSIZE,
+                 chunk_size=sentrywire.const.CHUNK_SIZE,
+                 retry_policy=None
+                 ):
+        """
+        Setup the asyncio client handler for the sentrywire API
+        Args:
+            ssl_verify (bool or str): Whether to check the certificate of the unit, or the path of a CA bundle file or
+                                      directory to check it against
+            session (aiohttp.ClientSession): Optional, session to send requests with. If none is given, one is
+                                             created on the first request and closed by close()
+            pool_maxsize (int): Maximum number of simultaneous connections held by the created session
+            chunk_size (int): Default number of bytes held in memory at a time when downloading search results
+            retry_policy (sentrywire.retry.RetryPolicy): Optional, see sentrywire.client.Sentrywire
+        """
+        self.host = host
+        self.server_port = server_port
+
+        self._base_url = Sentrywire._get_base_url(host, server_port)
+        self._api_version = str(api_version)
+        self._url = "%s/v%s" % (self._base_url, self._api_version)
+
+        self.verify = ssl_verify
+        self.timeout = timeout
+        self.retry_transient_errors = retry_transient_errors or retry_policy is not None
+        self.retry_policy = retry_policy or RetryPolicy(budget=RetryBudget())
+        self.pool_maxsize = pool_maxsize
+        self.chunk_size = chunk_size
+
+        self.user_agent = user_agent
+        self.headers = {"User-Agent": user_agent}
+
+        self.rest_token = rest_token
+
+        # The aiohttp session must be created inside a running event loop, so it is created on first use
+        self.session = session
+        self._owns_session = session is None
+
+        # NOTE: Delay import of the handlers to avoid circular imports, as in sentrywire.client
+        import sentrywire.aio.v2
+        objects = sentrywire.aio.v2
+        self._objects = objects
+
+        # Map functions
+        # Active Triggers
+        self.activetriggers = objects.ActiveTriggers(self)
+        # Authentication functionality
+        self.authentication = objects.Authentication(self)
+        self.logout = self.authentication.logout
+        # Authorization functionality
+        self.authorization = objects.Authorization(self)
+        # Federation functionality
+        self.federation = objects.Federation(self)
+        # IDS Rule functionality
+        self.idsrules = objects.IDSRules(self)
+        # Pre-capture filter functions
+        self.precapturefilter = objects.PrecaptureFilter(self)
+        # Search functionality
+        self.searches = objects.Search(self)
+        # Log functionality
+        self.logs = objects.Logs(self)
+        # Server functionality
+        self.server = objects.Server(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if self.rest_token:
+            await self.authentication.logout()
+        await self.close()
+
+    async def login(self, username, password):
+        return await self.authentication.login(username, password)
+
+    async def close(self):
+        """Close the underlying session if it was created by this client"""
+        if self.session is not None and self._owns_session:
+            await self.session.close()
+            self.session = None
+
+    @property
+    def url(self):
+        """The user-provided server URL."""
+        return self._base_url
+
+    @property
+    def api_url(self):
+        """The computed API base URL."""
+        return self._url
+
+    @property
+    def api_version(self):
+        """The API version used: 1"""
+        return self._api_version
+
+    def _get_session(self):
+        if self.session is None:
+            try:
+                import aiohttp
+            except ImportError:
+                raise SentrywireException("AsyncSentrywire requires the aiohttp library")
+            connector = aiohttp.TCPConnector(limit=self.pool_maxsize, ssl=self._ssl_context())
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    def _ssl_context(self):
+        """ssl setting of the connector for ssl_verify, as requests reads its verify argument
+        Returns:
+            None to check certificates against the default CA bundle, False not to check them, or an ssl.SSLContext
+            checking them against the given CA bundle
+        """
+        if self.verify is True:
+            return None
+        if not self.verify:
+            return False
+
+        import ssl
+
+        if os.path.isdir(self.verify):
+            return ssl.create_default_context(capath=self.verify)
+        return ssl.create_default_context(cafile=self.verify)
+
+    async def http_delete(self, path, **kwargs):
+        """Make a DELETE request to the server.
+        Args:
+            path (str): Path to query ('/fmsearch')
+            **kwargs: Extra options to send to the server
+        Returns:
+            The parsed json data, or the response object.
+        """
+        result = await self.http_request("delete", path, **kwargs)
+        return await self._parse(result)
+
+    async def http_get(self, path, raw=False, **kwargs):
+        """Make a GET request to the server.
+        Args:
+            path (str): Path to query ('/fmsearch')
+            raw (bool): If True do not try to parse the output as json
+            **kwargs: Extra options to send to the server
+        Returns:
+            The parsed json data, or the response object.
+        """
+        result = await self.http_request("get", path, **kwargs)
+        if raw:
+            return result
+        return await self._parse(result)
+
+    async def http_download(self, path, file_path, chunk_size=None, resume=False, checksum=None, hash_name="sha256",
+                            **kwargs):
+        """Make a streamed GET request to the server and write the body to a file in fixed size chunks.
+        Resumed downloads and checksums are checked as in sentrywire.client.Sentrywire.http_download
+        Args:
+            path (str): Path to query ('/fmsearch/data')
+            file_path (str): Path to write the response body to
+            chunk_size (int): Bytes to read and write at a time, defaults to the client chunk_size
+            resume (bool): If True and file_path already holds part of the body, only request the remaining bytes.
+                           Falls back to a full download when the server ignores the Range header
+            checksum (str): Optional, expected hex digest of the complete file
+            hash_name (str): hashlib algorithm used for checksum
+            **kwargs: Extra options to send to the server (e.g. params)
+        Returns:
+            The parsed json data if the server answered with a json message instead of a file, else None
+        Raises:
+            IntegrityError: If the written file does not match the announced size or the checksum
+        """
+        chunk_size = chunk_size or self.chunk_size
+        offset = 0
+        if resume and os.path.isfile(file_path):
+            offset = os.path.getsize(file_path)
+
+        result = None
+        if offset:
+            try:
+                result = await self.http_request("get", path, stream=True, headers={"Range": "bytes=%d-" % offset},
+                                                 **kwargs)
+            except RangeNotSatisfiable:
+                # The partial file is at least as long as the body, so it is either complete or stale
+                if checksum and Sentrywire._file_digest(file_path, hash_name, chunk_size) == checksum.lower():
+                    return None
+                offset = 0
+        if result is None:
+            result = await self.http_request("get", path, stream=True, **kwargs)
+
+        try:
+            if result.content_type == "application/json":
+                await result.read()
+                return await self._parse(result)
+
+            offset, expected_size = Sentrywire._body_range(result.status, result.headers, offset)
+            digest = Sentrywire._start_digest(file_path, offset, checksum, hash_name, chunk_size)
+
+            with open(file_path, 'ab' if offset else 'wb+') as file_handler:
+                async for chunk in result.content.iter_chunked(chunk_size):
+                    file_handler.write(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+        finally:
+            result.release()
+
+        Sentrywire._check_download(file_path, expected_size, digest, checksum, hash_name)
+
+    async def http_put(self, path, post_data=None, raw=False, files=None, **kwargs):
+        """Make a PUT request to the server.
+        Args:
+            path (str): Path to query ('/fmsearch')
+            post_data (dict): Data to send in the body (will be converted to json by default)
+            raw (bool): If True, do not convert post_data to json
+            files (dict): The files to send to the server
+            **kwargs: Extra options to send to the server
+        Returns:
+            The parsed json returned by the server.
+        """
+        result = await self.http_request("put", path, post_data=post_data, raw=raw, files=files, **kwargs)
+        try:
+            return await result.json(content_type=None)
+        except Exception:
+            raise SentrywireException("Failed to parse the server message")
+
+    async def http_post(self, path, post_data=None, raw=False, files=None, **kwargs):
+        """Make a POST request to the server.
+        Args:
+            path (str): Path to query ('/fmsearch')
+            post_data (dict): Data to send in the body (will be converted to json by default)
+            raw (bool): If True, do not convert post_data to json
+            files (dict): The files to send to the server
+            **kwargs: Extra options to send to the server
+        Returns:
+            The parsed json returned by the server if json is return, else the response object
+        """
+        result = await self.http_request("post", path, post_data=post_data, raw=raw, files=files, **kwargs)
+        return await self._parse(result)
+
+    async def http_request(
+            self,
+            verb,
+            path,
+            params=None,
+            post_data=None,
+            raw=False,
+            files=None,
+            timeout=None,
+            max_retries=None,
+            stream=False,
+            headers=None,
+            **kwargs
+    ):
+        """Make an HTTP request to the server.
+        Args:
+            verb (str): The HTTP method to call ('get', 'post', 'put', 'delete')
+            path (str): Path to query ('/fmsearch')
+            params (dict): Data to send as query parameters
+            post_data (dict): Data to send in the body (will be converted to json by default)
+            raw (bool): If True, do not convert post_data to json
+            files (dict): The files to send to the server
+            timeout (float): The timeout, in seconds, for the request
+            max_retries (int): Max retries after 429 or transient errors, set to -1 to retry forever.
+                               Defaults to the max_retries of the retry policy.
+            stream (bool): If True, return before reading the body. The caller must release the response
+            headers (dict): Extra headers to send with this request
+        Returns:
+            An aiohttp response object whose body has already been read, unless stream is set.
+        """
+        import aiohttp
+
+        url = self._build_url(path)
+        session = self._get_session()
+
+        if timeout is None:
+            timeout = self.timeout
+
+        # aiohttp refuses None query values, requests silently drops them
+        if params:
+            params = dict((k, v) for k, v in params.items() if v is not None)
+
+        opts = {
+            "headers": dict(self.headers, **(headers or {})),
+            "params": params,
+            "timeout": aiohttp.ClientTimeout(total=timeout)
+        }
+        if files:
+            opts["data"] = self._prepare_form_data(files)
+        elif raw and post_data:
+            opts["data"] = post_data
+        elif post_data is not None:
+            opts["json"] = post_data
+
+        retry_transient_errors = kwargs.get(
+            "retry_transient_errors", self.retry_transient_errors
+        )
+        policy = self.retry_policy if retry_transient_errors else None
+        if policy is not None:
+            policy.on_request()
+
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        cur_retries = 0
+        while True:
+            try:
+                # Reading the body hands the connection back to the pool while keeping the body readable
+                result = await session.request(verb, url, **opts)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                wait_time = None
+                if policy is not None:
+                    wait_time = policy.next_wait(verb, cur_retries, loop.time() - start, connection_error=True,
+                                                 max_retries=max_retries)
+                if wait_time is None:
+                    raise
+                cur_retries += 1
+                await asyncio.sleep(wait_time)
+                continue
+
+            if 200 <= result.status < 300:
+                if not stream:
+                    await result.read()
+                return result
+
+            if policy is not None:
+                wait_time = policy.next_wait(verb, cur_retries, loop.time() - start, status=result.status,
+                                             retry_after=result.headers.get("Retry-After"), max_retries=max_retries)
+                if wait_time is not None:
+                    cur_retries += 1
+                    result.release()
+                    await asyncio.sleep(wait_time)
+                    continue
+
+            error_message = await result.read()
+            try:
+                error_json = await result.json(content_type=None)
+                for k in ("message", "error", "msg"):
+                    if k in error_json:
+                        error_message = error_json[k]
+            except (KeyError, ValueError, TypeError):
+                pass
+
+            if result.status in ErrorLookupTable:
+                if error_message:
+                    raise ErrorLookupTable[result.status](error_message)
+                else:
+                    raise ErrorLookupTable[result.status]()
+
+            raise SentrywireException(error_message)
+
+    @staticmethod
+    async def _parse(result):
+        if result.content_type == "application/json":
+            try:
+                return await result.json()
+            except Exception:
+                raise SentrywireException("Failed to parse the server message")
+        return result
+
+    @staticmethod
+    async def json(result):
+        """Return the json body of a response, or the result itself if it was already parsed"""
+        if isinstance(result, (dict, list)):
+            return result
+        return await result.json(content_type=None)
+
+    @staticmethod
+    def _prepare_form_data(files):
+        """Convert a requests style files dict into aiohttp form data"""
+        import aiohttp
+
+        form = aiohttp.FormData()
+        for name, value in files.items():
+            if isinstance(value, tuple):
+                file_name, content = value[0], value[1]
+                if file_name is None:
+                    form.add_field(name, content)
+                else:
+                    form.add_field(name, content, filename=file_name)
+            else:
+                form.add_field(name, value)
+        return form
+
+    def _build_url(self, path):
+        """Returns the full url from path.
+        Appends path to the stored url.
+        Returns:
+            str: The full URL
+        """
+        return "%s%s" % (self._url, path)
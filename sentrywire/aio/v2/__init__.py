@@ -0,0 +1,8 @@
+from .authentication import *
+from .search import *
+from .server import *
+from .federation import *
+from .idsrules import *
+from .activetriggers import *
+from .precapturefilter import *
+from .authorization import *
@@ -0,0 +1,18 @@
+from sentrywire.v2 import activetriggers
+
+__all__ = ["ActiveTriggers"]
+
+
+class ActiveTriggers(activetriggers.ActiveTriggers):
+    """
+    Active triggers of sentrywire.v2.activetriggers, create and delete return the request of the asyncio client
+    """
+
+    async def list(self, trigger_name=None):
+        """Lists active triggers
+        See sentrywire.v2.activetriggers.ActiveTriggers.list
+        """
+        params = {"rest_token": self.sw.rest_token,
+                  "trigger_name": trigger_name}
+        list_of_triggers = await self.sw.http_get(self.path, params=params)
+        return activetriggers._as_list(list_of_triggers)
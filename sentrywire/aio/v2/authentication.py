@@ -0,0 +1,38 @@
+from sentrywire.exceptions import SentrywireException
+from sentrywire.v2 import authentication
+
+__all__ = ["Authentication"]
+
+
+class Authentication(authentication.Authentication):
+    """
+    Login and logout of sentrywire.v2.authentication, without the token store and token lock of the blocking client
+    """
+
+    async def login(self, username, password):
+        """Create new rest token for current client
+        Args:
+            username (str): Username for Sentrywire system
+            password (str): Password for username in Sentrywire system
+        Returns:
+            (str): rest_token bound to current Sentrywire client
+        """
+        post_data = {"username": username,
+                     "password": password}
+        json = await self.sw.json(await self.sw.http_post(self.path, post_data=post_data))
+        self.sw.rest_token = json["rest_token"]
+        return self.sw.rest_token
+
+    async def logout(self, rest_token=None):
+        """Invalidate current rest_token
+        Args:
+            rest_token (str): Token to invalidate, if none is provided, will use the token in the client
+        """
+        rest_token = rest_token or self.sw.rest_token
+        if not rest_token:
+            raise SentrywireException("No rest token to invalidate")
+
+        params = {"rest_token": rest_token}
+        response = await self.sw.http_put(self.path, params=params)
+        self.sw.rest_token = None
+        return response
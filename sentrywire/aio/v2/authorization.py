@@ -0,0 +1,4 @@
+from sentrywire.v2.authorization import Authorization, Roles
+
+# Every method of these handlers returns the request of the client, which is awaitable on the asyncio client
+__all__ = ["Authorization", "Roles"]
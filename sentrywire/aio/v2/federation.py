@@ -0,0 +1,64 @@
+from sentrywire.lazy import LazyHandler
+from sentrywire.v2 import federation
+from sentrywire.v2.federation import Policy
+
+__all__ = ["Federation", "Groups", "Nodes", "Policy"]
+
+
+class Nodes(federation.Nodes):
+
+    async def create(self, node_address, group_name):
+        """Create a node
+        See sentrywire.v2.federation.Nodes.create
+        """
+        post_data = {"rest_token": self.sw.rest_token,
+                     "nodeaddr": node_address,
+                     "group_name": group_name
+                     }
+        return await self.sw.json(await self.sw.http_post(self.path, post_data=post_data))
+
+    async def delete(self, node_address):
+        """Delete a node
+        See sentrywire.v2.federation.Nodes.delete
+        """
+        params = {"rest_token": self.sw.rest_token,
+                  "nodeaddr": node_address
+                  }
+        return await self.sw.json(await self.sw.http_delete(self.path, params=params))
+
+    add = create
+
+
+class Groups(federation.Groups):
+    """
+    Groups of sentrywire.v2.federation, list returns the request of the asyncio client
+    """
+
+    async def create(self, group_name):
+        """Create a group
+        See sentrywire.v2.federation.Groups.create
+        """
+        post_data = {"rest_token": self.sw.rest_token,
+                     "group_name": group_name
+                     }
+        return await self.sw.json(await self.sw.http_post(self.path, post_data=post_data))
+
+    async def delete(self, group_name):
+        """Delete a group
+        See sentrywire.v2.federation.Groups.delete
+        """
+        params = {"rest_token": self.sw.rest_token,
+                  "group_name": group_name
+                  }
+        return await self.sw.json(await self.sw.http_delete(self.path, params=params))
+
+
+class Federation(federation.Federation):
+    """
+    Group and node endpoints of sentrywire.v2.federation
+    """
+    groups = LazyHandler("groups", "sentrywire.aio.v2.federation", "Groups")
+    nodes = LazyHandler("nodes", "sentrywire.aio.v2.federation", "Nodes")
+    policies = LazyHandler("policies", "sentrywire.aio.v2.federation", "Policy")
+    # Runs searches on threads of the blocking client, use sentrywire.v2.fanout with a Sentrywire client instead
+    fanout = None
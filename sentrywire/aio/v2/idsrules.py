@@ -0,0 +1,49 @@
+from os.path import basename
+
+from sentrywire.v2 import idsrules
+
+__all__ = ["IDSRules"]
+
+
+class IDSRules(idsrules.IDSRules):
+    """
+    IDS rule sets of sentrywire.v2.idsrules, delete, activate and deactivate return the request of the asyncio client
+    """
+
+    async def create(self, file_path):
+        """Upload a rule set. New rules are deactivated by default. Will override an existing rule with the same name.
+        See sentrywire.v2.idsrules.IDSRules.create
+        """
+        with open(file_path, 'rb') as rules_file:
+            files = {"rest_token": (None, self.sw.rest_token),
+                     "fileUploadName": (basename(file_path), rules_file)
+                     }
+            return await self.sw.http_post(self.path, files=files)
+
+    async def list(self, list_type):
+        """Lists rule sets
+        Args:
+            list_type (str): "activated" or "deactivated"
+        See sentrywire.v2.idsrules.IDSRules.list
+        """
+        params = {"rest_token": self.sw.rest_token,
+                  "type": list_type}
+        return await self.sw.json(await self.sw.http_get(self.path, params=params))
+
+    async def get(self, rule_set_name, file_path):
+        params = {
+            "rest_token": self.sw.rest_token,
+            "rulesetname": rule_set_name
+        }
+
+        response = await self.sw.http_get(self.path + "content", params=params, raw=True)
+        content = await response.read()
+
+        with open(file_path, 'wb+') as file_handler:
+            file_handler.write(content)
+
+        return content
+
+    # Aliases for documentation terminology
+    upload = create
+    download = get
@@ -0,0 +1,4 @@
+from sentrywire.v2.precapturefilter import PrecaptureFilter
+
+# Every method of this handler returns the request of the client, which is awaitable on the asyncio client
+__all__ = ["PrecaptureFilter"]
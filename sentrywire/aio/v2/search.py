@@ -0,0 +1,95 @@
+from sentrywire.exceptions import NotFound
+from sentrywire.lazy import LazyHandler
+from sentrywire.v2 import search
+from sentrywire.v2.search import Objects
+
+__all__ = ["Logs", "Objects", "Pcaps", "Search"]
+
+
+class Search(search.Search):
+    """
+    Searches of sentrywire.v2.search, create, delete, status and completed return the request of the asyncio client
+    """
+    objects = LazyHandler("objects", "sentrywire.aio.v2.search", "Objects")
+    pcaps = LazyHandler("pcaps", "sentrywire.aio.v2.search", "Pcaps")
+    logs = LazyHandler("logs", "sentrywire.aio.v2.search", "Logs")
+    # These wait on threads of the blocking client, use sentrywire.v2.search with a Sentrywire client instead
+    watcher = sharded = watch = None
+
+    async def cancel(self, search_token):
+        """Cancel a search in progress
+        See sentrywire.v2.search.Search.cancel
+        """
+        pass
+
+    async def pending(self, count=0):
+        """Get the list of pending searches
+        See sentrywire.v2.search.Search.pending
+        """
+        params = {"rest_token": self.sw.rest_token,
+                  "count": count}
+        response = await self.sw.http_get(self.path + "/pending", params=params)
+        if not response:
+            raise NotFound("No pending searches found")
+        return response
+
+
+class Pcaps(search.Pcaps):
+    """
+    Pcap chunks of sentrywire.v2.search
+    """
+    # These read chunks on threads of the blocking client, use sentrywire.v2.search with a Sentrywire client instead
+    iter_packets = flows = get_all = None
+
+    async def list(self, node_name, search_token):
+        """list pcaps in search
+        See sentrywire.v2.search.Pcaps.list
+        """
+        params = {
+            "rest_token": self.sw.rest_token,
+            "searchname": search_token,
+            "type": "PcapList",
+            "nodename": node_name
+        }
+
+        response = await self.sw.http_get(self.path, params=params, raw=True)
+        return search._chunk_list(await response.read())
+
+    async def get(self, node_name, search_name, index, file_path, chunk_size=None, resume=False, checksum=None):
+        """Download one pcap chunk of a search
+        See sentrywire.v2.search.Pcaps.get
+        """
+        params = {
+            "rest_token": self.sw.rest_token,
+            "searchname": search_name,
+            "type": index,
+            "nodename": node_name
+        }
+
+        response = await self.sw.http_download(self.path, file_path, chunk_size=chunk_size, resume=resume,
+                                               checksum=checksum, params=params)
+
+        if response is not None:
+            raise NotFound("PCAP not found")
+
+
+class Logs(search.Logs):
+
+    async def get(self, node_name, search_name, file_path, chunk_size=None, resume=False):
+        """Download the log data of a search
+        See sentrywire.v2.search.Logs.get
+        """
+        params = {
+            "rest_token": self.sw.rest_token,
+            "searchname": search_name,
+            "type": "LogData",
+            "nodename": node_name
+        }
+
+        response = await self.sw.http_download(self.path, file_path, chunk_size=chunk_size, resume=resume,
+                                               params=params)
+
+        if isinstance(response, dict) and "Exist" in response:
+            raise NotFound("Log not found")
+
+        return response
@@ -0,0 +1,20 @@
+from sentrywire.lazy import LazyHandler
+from sentrywire.v2 import server
+from sentrywire.v2.server import Capture
+
+__all__ = ["Capture", "Server"]
+
+
+class Server(server.Server):
+    """
+    Server status of sentrywire.v2.server, capture start and stop return the request of the asyncio client
+    """
+    capture = LazyHandler("capture", "sentrywire.aio.v2.server", "Capture")
+
+    async def status(self):
+        """Get server status
+        See sentrywire.v2.server.Server.status
+        """
+        params = {"rest_token": self.sw.rest_token}
+        list_of_statuses = await self.sw.http_get(self.path, params=params)
+        return server._decode_status(list_of_statuses)
@@ -0,0 +1,650 @@
+"""
+Local bpf filtering of downloaded pcaps, to narrow a search result without running a new search
+"""
+import binascii
+import re
+import socket
+import struct
+import sys
+
+from sentrywire.exceptions import BpfError, PcapError
+from sentrywire.pcap import PcapHeader, GLOBAL_HEADER_LENGTH, read_records
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+ETHERTYPES = {"ip": 0x0800, "ip6": 0x86dd, "arp": 0x0806, "rarp": 0x8035}
+ETHERTYPE_VLAN = (0x8100, 0x88a8, 0x9100)
+IP_PROTOCOLS = {"icmp": 1, "igmp": 2, "tcp": 6, "udp": 17, "icmp6": 58, "sctp": 132}
+PORT_PROTOCOLS = ("tcp", "udp", "sctp")
+
+# Offsets and values usable in expressions, as in pcap-filter(7)
+CONSTANTS = {
+    "tcpflags": 13, "tcp-fin": 0x01, "tcp-syn": 0x02, "tcp-rst": 0x04, "tcp-push": 0x08, "tcp-ack": 0x10,
+    "tcp-urg": 0x20, "tcp-ece": 0x40, "tcp-cwr": 0x80,
+    "icmptype": 0, "icmpcode": 1, "icmp-echoreply": 0, "icmp-unreach": 3, "icmp-sourcequench": 4,
+    "icmp-redirect": 5, "icmp-echo": 8, "icmp-routeradvert": 9, "icmp-routersolicit": 10, "icmp-timxceed": 11,
+    "icmp-paramprob": 12, "icmp-tstamp": 13, "icmp-tstampreply": 14, "icmp-ireq": 15, "icmp-ireqreply": 16,
+    "icmp-maskreq": 17, "icmp-maskreply": 18,
+    "icmp6type": 0, "icmp6code": 1,
+}
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<address>(?:[0-9A-Fa-f]*:){2,}[0-9A-Fa-f.]*)
+      | (?P<number>0[xX][0-9A-Fa-f]+|\d+(?:\.\d+)*)
+      | (?P<name>\\?[A-Za-z_][A-Za-z0-9_]*(?:-[A-Za-z][A-Za-z0-9_]*)*)
+      | (?P<operator>&&|\|\||==|!=|<=|>=|<<|>>|[()\[\]:!<>=+\-*/%&|^])
+    )""", re.VERBOSE)
+
+_RELATIONS = {
+    "=": lambda a, b: a == b, "==": lambda a, b: a == b, "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b, "<=": lambda a, b: a <= b, ">": lambda a, b: a > b, ">=": lambda a, b: a >= b,
+}
+# Binary operators from the loosest to the tightest binding
+_ARITHMETIC = (
+    {"|": lambda a, b: a | b},
+    {"^": lambda a, b: a ^ b},
+    {"&": lambda a, b: a & b},
+    {"<<": lambda a, b: (a << b) & 0xffffffff, ">>": lambda a, b: a >> b},
+    {"+": lambda a, b: (a + b) & 0xffffffff, "-": lambda a, b: (a - b) & 0xffffffff},
+    {"*": lambda a, b: (a * b) & 0xffffffff, "/": lambda a, b: a // b, "%": lambda a, b: a % b},
+)
+_DIRECTIONS = ("src", "dst")
+_TYPES = ("host", "net", "port", "portrange")
+_PROTOCOLS = ("ether", "ip", "ip6", "arp", "rarp", "tcp", "udp", "sctp", "icmp", "icmp6", "igmp")
+
+
+class _Reject(Exception):
+    """A load outside the packet or from a protocol the packet does not have"""
+
+
+class Frame(object):
+    """
+    A packet being matched, with its headers decoded on first use and shared by every primitive of a filter
+    """
+    __slots__ = ("data", "length", "linktype", "ether", "_layers")
+
+    def __init__(self, data, length=None, linktype=LINKTYPE_ETHERNET):
+        if linktype not in (LINKTYPE_ETHERNET, LINKTYPE_LINUX_SLL, LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+            raise BpfError("Link type %d is not supported" % linktype)
+        if sys.version_info[0] == 2 and not isinstance(data, bytearray):
+            # Indexing str and memoryview gives one byte strings on python 2, layers read header fields as integers
+            data = bytearray(data)
+        self.data = data
+        self.length = len(data) if length is None else length
+        self.linktype = linktype
+        self.ether = 0 if linktype == LINKTYPE_ETHERNET and len(data) >= 14 else None
+        self._layers = {}
+
+    def layer(self, vlans=0):
+        """Headers of the packet read after skipping vlans 802.1Q tags, as the primitives after the vlans-th vlan
+        keyword of a filter see them"""
+        layer = self._layers.get(vlans)
+        if layer is None:
+            layer = self._layers[vlans] = Layer(self.data, self.linktype, vlans)
+        return layer
+
+    def offset(self, protocol, vlans=0):
+        """Start of the header of protocol in data, as used by protocol[offset:size] loads"""
+        if protocol == "ether":
+            base = self.ether
+        else:
+            layer = self.layer(vlans)
+            if protocol == "ip":
+                base = layer.l3 if layer.version == 4 else None
+            elif protocol == "ip6":
+                base = layer.l3 if layer.version == 6 else None
+            elif protocol in ("arp", "rarp"):
+                base = layer.l3 if layer.ethertype == ETHERTYPES[protocol] else None
+            elif protocol == "icmp6":
+                base = layer.l4 if layer.version == 6 and layer.proto == 58 else None
+            elif protocol in ("icmp", "igmp"):
+                base = layer.l4 if layer.version == 4 and layer.proto == IP_PROTOCOLS[protocol] else None
+            else:
+                base = layer.l4 if layer.proto == IP_PROTOCOLS[protocol] else None
+        if base is None:
+            raise _Reject()
+        return base
+
+
+class Layer(object):
+    """
+    Network and transport headers of a packet at a given vlan depth
+
+    As in pcap-filter(7), tags are not skipped on their own: without a vlan keyword in the filter, ip, tcp, host and
+    the like do not match 802.1Q tagged frames, and each vlan keyword moves the following primitives past one tag.
+    """
+    __slots__ = ("ethertype", "vlan", "l3", "version", "proto", "src", "dst", "l4", "sport", "dport")
+
+    def __init__(self, data, linktype, vlans):
+        self.ethertype = self.vlan = self.l3 = self.version = self.proto = None
+        self.src = self.dst = self.l4 = self.sport = self.dport = None
+        size = len(data)
+
+        if linktype == LINKTYPE_ETHERNET:
+            l3 = 14 + 4 * vlans
+            if size < l3:
+                return
+            ethertype = struct.unpack_from("!H", data, l3 - 2)[0]
+            if ethertype in ETHERTYPE_VLAN and size >= l3 + 2:
+                self.vlan = struct.unpack_from("!H", data, l3)[0] & 0xfff
+        elif vlans:
+            return
+        elif linktype == LINKTYPE_LINUX_SLL:
+            if size < 16:
+                return
+            ethertype = struct.unpack_from("!H", data, 14)[0]
+            l3 = 16
+        else:
+            if not size:
+                return
+            ethertype = {4: ETHERTYPES["ip"], 6: ETHERTYPES["ip6"]}.get(data[0] >> 4)
+            l3 = 0
+        self.ethertype = ethertype
+        self.l3 = l3
+
+        if ethertype == ETHERTYPES["ip"] and size >= l3 + 20:
+            self.version = 4
+            self.proto = data[l3 + 9]
+            self.src = bytes(data[l3 + 12:l3 + 16])
+            self.dst = bytes(data[l3 + 16:l3 + 20])
+            if not struct.unpack_from("!H", data, l3 + 6)[0] & 0x1fff:
+                # Later fragments have no transport header
+                self.l4 = l3 + (data[l3] & 0xf) * 4
+        elif ethertype == ETHERTYPES["ip6"] and size >= l3 + 40:
+            self.version = 6
+            self.src = bytes(data[l3 + 8:l3 + 24])
+            self.dst = bytes(data[l3 + 24:l3 + 40])
+            proto = data[l3 + 6]
+            l4 = l3 + 40
+            # Hop-by-hop, routing, fragment and destination options headers
+            while proto in (0, 43, 44, 60) and size >= l4 + 8:
+                if proto == 44:
+                    proto, fragment = data[l4], struct.unpack_from("!H", data, l4 + 2)[0] >> 3
+                    l4 += 8
+                    if fragment:
+                        # Later fragments have no transport header
+                        l4 = None
+                        break
+                else:
+                    proto, l4 = data[l4], l4 + (data[l4 + 1] + 1) * 8
+            self.proto = proto
+            self.l4 = l4
+        elif ethertype in (ETHERTYPES["arp"], ETHERTYPES["rarp"]) and size >= l3 + 8:
+            # Sender and target protocol addresses, after the hardware address of each
+            hardware, protocol = data[l3 + 4], data[l3 + 5]
+            if size >= l3 + 8 + 2 * (hardware + protocol):
+                sender = l3 + 8 + hardware
+                target = sender + protocol + hardware
+                self.src = bytes(data[sender:sender + protocol])
+                self.dst = bytes(data[target:target + protocol])
+
+        if self.l4 is not None and self.proto in (6, 17, 132) and size >= self.l4 + 4:
+            self.sport, self.dport = struct.unpack_from("!HH", data, self.l4)
+
+
+_filters = {}
+
+
+def compile_filter(expression):
+    """Compile a bpf filter expression into a matcher
+    The supported primitives are those of pcap-filter(7) that are used in search filters: host, net (with /len or
+    mask), port and portrange with src/dst and protocol qualifiers, ip, ip6, arp, tcp, udp, sctp, icmp, icmp6,
+    vlan, ether host/proto, ip proto, less and greater, and relations over loads like tcp[20:4] = 0x48545450 or
+    tcp[tcpflags] & tcp-rst != 0. A load past the end of a packet, or from a protocol the packet does not have,
+    makes its relation false. Names are not resolved, hosts must be addresses. arp and rarp host match the sender
+    and target protocol addresses. As in libpcap, 802.1Q tagged frames only match primitives that follow a vlan.
+    Compiled filters are cached by expression.
+    Args:
+        expression (str): bpf filter, e.g. "tcp and port 443", without the bpf/payload/logtext keywords of
+                          Search.create
+    Returns:
+        (callable): matcher(data, length=None, linktype=1) returning True if the packet passes the filter.
+                    data is the captured bytes, length the length on the wire for less and greater
+    Raises:
+        BpfError: If the expression can not be parsed
+    """
+    key = " ".join(expression.split())
+    matcher = _filters.get(key)
+    if matcher is None:
+        predicate = _Parser(key).parse() if key else (lambda frame: True)
+
+        def matcher(data, length=None, linktype=LINKTYPE_ETHERNET):
+            return predicate(Frame(data, length, linktype))
+
+        _filters[key] = matcher
+    return matcher
+
+
+def filter_packets(packets, expression, linktype=LINKTYPE_ETHERNET):
+    """Yield the packets passing a bpf filter
+    Args:
+        packets: iterable of sentrywire.pcap.Packet, e.g. from sentrywire.pcap.iter_packets
+        expression (str): bpf filter, see compile_filter
+        linktype (int): Optional, link type of the capture
+    """
+    matcher = compile_filter(expression)
+    for packet in packets:
+        if matcher(packet.data, packet.origlen, linktype):
+            yield packet
+
+
+def filter_pcap(input_paths, output_path, expression):
+    """Write the packets of pcap files that pass a bpf filter to a new pcap file
+    Use it to narrow the result of a finished search (e.g. add "and port 443") instead of searching again.
+    Args:
+        input_paths (str or list of str): pcap files, e.g. the chunks returned by Pcaps.get_all
+        output_path (str): path of the filtered pcap file, written with the header of the first input
+        expression (str): bpf filter, see compile_filter
+    Returns:
+        (int): number of packets written
+    Raises:
+        BpfError: If the expression can not be parsed
+        PcapError: If an input is not a pcap file or has a different link type
+    """
+    if isinstance(input_paths, str):
+        input_paths = [input_paths]
+    matcher = compile_filter(expression)
+    output_header = None
+    written = 0
+    with open(output_path, 'wb+') as output:
+        for path in input_paths:
+            with open(path, 'rb') as source:
+                first = source.read(GLOBAL_HEADER_LENGTH)
+                if not first:
+                    continue
+                header = PcapHeader.parse(first)
+                if output_header is None:
+                    output_header = header
+                    output.write(header.pack())
+                    record = struct.Struct(header.endian + "IIII")
+                elif output_header.linktype != header.linktype:
+                    raise PcapError("Can not join link type %d with %d" % (header.linktype, output_header.linktype))
+
+                for ts_sec, ts_frac, orig_len, data in read_records(source, header):
+                    if not matcher(data, orig_len, header.linktype):
+                        continue
+                    if header.nanosecond and not output_header.nanosecond:
+                        ts_frac //= 1000
+                    elif output_header.nanosecond and not header.nanosecond:
+                        ts_frac *= 1000
+                    output.write(record.pack(ts_sec, ts_frac, len(data), orig_len))
+                    output.write(data)
+                    written += 1
+        if output_header is None:
+            output.write(PcapHeader().pack())
+    return written
+
+
+class _Parser(object):
+    """Recursive descent parser building a predicate over Frame out of closures"""
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = []
+        position = 0
+        while position < len(expression):
+            match = _TOKEN.match(expression, position)
+            if match is None or match.end() == position:
+                if not expression[position:].strip():
+                    break
+                raise BpfError("Unexpected %r in filter %r" % (expression[position:position + 10], expression))
+            self.tokens.append(match.group(match.lastgroup))
+            position = match.end()
+        self.position = 0
+        # Qualifiers of the last primitive, reused by a bare id as in "port 80 or 443"
+        self.qualifiers = None
+        # vlan keywords read so far, each one moves the following primitives past one more 802.1Q tag
+        self.vlans = 0
+
+    def peek(self, ahead=0):
+        position = self.position + ahead
+        return self.tokens[position] if position < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise BpfError("Unexpected end of filter %r" % self.expression)
+        self.position += 1
+        return token
+
+    def expect(self, token):
+        if self.next() != token:
+            raise BpfError("Expected %r in filter %r" % (token, self.expression))
+
+    def parse(self):
+        predicate = self._or()
+        if self.peek() is not None:
+            raise BpfError("Unexpected %r in filter %r" % (self.peek(), self.expression))
+        return predicate
+
+    def _or(self):
+        """and and or have the same precedence and group from the left, as in pcap-filter(7):
+        "udp or tcp and port 80" is "(udp or tcp) and port 80"
+        """
+        predicate = self._not()
+        while self.peek() in ("and", "&&", "or", "||"):
+            combine = _both if self.next() in ("and", "&&") else _either
+            predicate = combine(predicate, self._not())
+        return predicate
+
+    def _not(self):
+        if self.peek() in ("not", "!"):
+            self.next()
+            term = self._not()
+            return lambda frame: not term(frame)
+        return self._primary()
+
+    def _primary(self):
+        start = self.position
+        try:
+            relation = self._relation()
+        except BpfError:
+            relation = None
+        if relation is not None:
+            return relation
+        self.position = start
+
+        if self.peek() == "(":
+            self.next()
+            predicate = self._or()
+            self.expect(")")
+            return predicate
+        return self._primitive()
+
+    def _relation(self):
+        left = self._arithmetic()
+        operator = self.peek()
+        if operator not in _RELATIONS:
+            return None
+        self.next()
+        right = self._arithmetic()
+        compare = _RELATIONS[operator]
+
+        def relation(frame):
+            try:
+                return compare(left(frame), right(frame))
+            except (_Reject, ZeroDivisionError):
+                return False
+        return relation
+
+    def _arithmetic(self, level=0):
+        if level == len(_ARITHMETIC):
+            return self._operand()
+        operators = _ARITHMETIC[level]
+        left = self._arithmetic(level + 1)
+        while self.peek() in operators:
+            operation = operators[self.next()]
+            right = self._arithmetic(level + 1)
+            left = _combine(operation, left, right)
+        return left
+
+    def _operand(self):
+        token = self.next()
+        if token == "(":
+            value = self._arithmetic()
+            self.expect(")")
+            return value
+        if token == "-":
+            value = self._operand()
+            return lambda frame: -value(frame) & 0xffffffff
+        if token == "len":
+            return lambda frame: frame.length
+        if token in CONSTANTS:
+            constant = CONSTANTS[token]
+            return lambda frame: constant
+        if token in _PROTOCOLS and self.peek() == "[":
+            return self._load(token)
+        number = _number(token)
+        if number is None:
+            raise BpfError("Unexpected %r in filter %r" % (token, self.expression))
+        return lambda frame: number
+
+    def _load(self, protocol):
+        """protocol[offset] or protocol[offset:size]"""
+        self.expect("[")
+        offset = self._arithmetic()
+        size = 1
+        if self.peek() == ":":
+            self.next()
+            size = _number(self.next())
+            if size not in (1, 2, 4):
+                raise BpfError("Load size must be 1, 2 or 4 in filter %r" % self.expression)
+        self.expect("]")
+        unpack = struct.Struct({1: "!B", 2: "!H", 4: "!I"}[size]).unpack_from
+        vlans = self.vlans
+
+        def load(frame):
+            position = frame.offset(protocol, vlans) + offset(frame)
+            if position + size > len(frame.data):
+                raise _Reject()
+            return unpack(frame.data, position)[0]
+        return load
+
+    def _primitive(self):
+        token = self.peek()
+        if token in ("less", "greater"):
+            self.next()
+            limit = _number(self.next())
+            if limit is None:
+                raise BpfError("Expected a length after %s in filter %r" % (token, self.expression))
+            if token == "less":
+                return lambda frame: frame.length <= limit
+            return lambda frame: frame.length >= limit
+        if token == "vlan":
+            self.next()
+            vlans = self.vlans
+            self.vlans += 1
+            vlan = _number(self.peek()) if self.peek() is not None else None
+            if vlan is None:
+                return lambda frame: frame.layer(vlans).vlan is not None
+            self.next()
+            return lambda frame: frame.layer(vlans).vlan == vlan
+
+        protocol = direction = kind = None
+        if token in _PROTOCOLS:
+            protocol = self.next()
+        if self.peek() in _DIRECTIONS:
+            direction = self.next()
+            if self.peek() in ("or", "and") and self.peek(1) in _DIRECTIONS:
+                direction = "%s %s %s" % (direction, self.next(), self.next())
+        if self.peek() in _TYPES:
+            kind = self.next()
+        elif self.peek() == "proto":
+            self.next()
+            return self._proto(protocol)
+
+        if protocol is not None and direction is None and kind is None:
+            # A bare protocol, e.g. "tcp" or "ip6"
+            return _protocol_test(protocol, self.vlans)
+        if protocol is None and direction is None and kind is None:
+            if self.qualifiers is None:
+                raise BpfError("Unexpected %r in filter %r" % (token, self.expression))
+            protocol, direction, kind = self.qualifiers
+        self.qualifiers = (protocol, direction, kind)
+        return self._id(protocol, direction or "src or dst", kind or "host")
+
+    def _proto(self, protocol):
+        """ether proto N, ip proto N, ip6 proto N or proto N"""
+        token = self.next().lstrip("\\")
+        vlans = self.vlans
+        if protocol == "ether":
+            value = ETHERTYPES.get(token, _number(token))
+            if value is None:
+                raise BpfError("Unknown ether protocol %r in filter %r" % (token, self.expression))
+            return lambda frame: frame.layer(vlans).ethertype == value
+        value = IP_PROTOCOLS.get(token, _number(token))
+        if value is None:
+            raise BpfError("Unknown protocol %r in filter %r" % (token, self.expression))
+        version = {"ip": 4, "ip6": 6}.get(protocol)
+
+        def proto(frame):
+            layer = frame.layer(vlans)
+            return layer.proto == value and layer.version is not None and (version is None or layer.version == version)
+        return proto
+
+    def _id(self, protocol, direction, kind):
+        token = self.next()
+        vlans = self.vlans
+        if kind in ("port", "portrange"):
+            if protocol not in (None,) + PORT_PROTOCOLS:
+                raise BpfError("%s %s is not valid in filter %r" % (protocol, kind, self.expression))
+            low = high = _port(token)
+            if kind == "portrange":
+                if "-" in token:
+                    low, high = [_port(part) for part in token.split("-", 1)]
+                else:
+                    self.expect("-")
+                    high = _port(self.next())
+            if low is None or high is None:
+                raise BpfError("Expected a port in filter %r" % self.expression)
+            protocols = tuple(IP_PROTOCOLS[name] for name in ([protocol] if protocol else PORT_PROTOCOLS))
+
+            def port(frame, field):
+                layer = frame.layer(vlans)
+                return layer.proto in protocols and getattr(layer, field) is not None and \
+                    low <= getattr(layer, field) <= high
+            return _directed(direction, lambda frame: port(frame, "sport"), lambda frame: port(frame, "dport"))
+
+        if protocol == "ether":
+            if kind != "host":
+                raise BpfError("ether %s is not valid in filter %r" % (kind, self.expression))
+            address = _mac(token)
+
+            def ether(frame, start):
+                return frame.ether is not None and bytes(frame.data[start:start + 6]) == address
+            return _directed(direction, lambda frame: ether(frame, 6), lambda frame: ether(frame, 0))
+
+        if kind == "net":
+            network, mask, width = self._network(token)
+        else:
+            address = _address(token)
+            if address is None:
+                raise BpfError("Expected an address, got %r in filter %r" % (token, self.expression))
+            network, mask, width = _integer(address), (1 << (len(address) * 8)) - 1, len(address)
+        # Without a protocol, hosts and nets are looked for in IPv4, IPv6, ARP and RARP headers
+        proto_test = None if protocol is None else _protocol_test(protocol, vlans)
+
+        def match(frame, field):
+            address = getattr(frame.layer(vlans), field)
+            return address is not None and len(address) == width and _integer(address) & mask == network and \
+                (proto_test is None or proto_test(frame))
+        return _directed(direction, lambda frame: match(frame, "src"), lambda frame: match(frame, "dst"))
+
+    def _network(self, token):
+        """net 10.0.0.0/8, net 10.0.0.0 mask 255.0.0.0, net 10 or net fe80::/10
+        Returns:
+            (tuple): (network, mask, address length in bytes)
+        """
+        length = None
+        if self.peek() == "/":
+            self.next()
+            length = _number(self.next())
+        elif self.peek() == "mask":
+            self.next()
+            mask = _address(self.next())
+            if mask is None:
+                raise BpfError("Expected a mask in filter %r" % self.expression)
+            return _integer(_address(token) or b"") & _integer(mask), _integer(mask), len(mask)
+
+        address = _address(token)
+        if address is None and re.match(r"^\d+(\.\d+){0,2}$", token):
+            # Abbreviated IPv4 network, "10.1" is 10.1.0.0/16
+            octets = token.split(".")
+            address = _address(".".join(octets + ["0"] * (4 - len(octets))))
+            length = 8 * len(octets) if length is None else length
+        if address is None:
+            raise BpfError("Expected a network, got %r in filter %r" % (token, self.expression))
+        bits = len(address) * 8
+        length = bits if length is None else length
+        if not 0 <= length <= bits:
+            raise BpfError("Invalid prefix length in filter %r" % self.expression)
+        mask = ((1 << length) - 1) << (bits - length)
+        return _integer(address) & mask, mask, len(address)
+
+
+def _combine(operation, left, right):
+    return lambda frame: operation(left(frame), right(frame))
+
+
+def _either(first, second):
+    return lambda frame: first(frame) or second(frame)
+
+
+def _both(first, second):
+    return lambda frame: first(frame) and second(frame)
+
+
+def _directed(direction, source, destination):
+    if direction == "src":
+        return source
+    if direction == "dst":
+        return destination
+    if direction == "src and dst":
+        return _both(source, destination)
+    return _either(source, destination)
+
+
+def _protocol_test(protocol, vlans=0):
+    if protocol == "ether":
+        return lambda frame: frame.ether is not None
+    if protocol in ("ip", "ip6"):
+        version = 4 if protocol == "ip" else 6
+        return lambda frame: frame.layer(vlans).version == version
+    if protocol in ("arp", "rarp"):
+        ethertype = ETHERTYPES[protocol]
+        return lambda frame: frame.layer(vlans).ethertype == ethertype
+    value = IP_PROTOCOLS[protocol]
+    if protocol in ("icmp", "igmp"):
+        return lambda frame: frame.layer(vlans).version == 4 and frame.layer(vlans).proto == value
+    if protocol == "icmp6":
+        return lambda frame: frame.layer(vlans).version == 6 and frame.layer(vlans).proto == value
+    return lambda frame: frame.layer(vlans).version is not None and frame.layer(vlans).proto == value
+
+
+def _number(token):
+    try:
+        return int(token, 16) if token.lower().startswith("0x") else int(token, 8 if token.startswith("0") and
+                                                                          len(token) > 1 else 10)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _port(token):
+    number = _number(token)
+    if number is None:
+        try:
+            number = socket.getservbyname(token.lstrip("\\"))
+        except (socket.error, TypeError):
+            return None
+    return number
+
+
+def _address(token):
+    """Packed IPv4 or IPv6 address, or None"""
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            return socket.inet_pton(family, token)
+        except (socket.error, ValueError, TypeError):
+            pass
+    return None
+
+
+def _mac(token):
+    parts = re.split(r"[:.\-]", token)
+    try:
+        if len(parts) == 6:
+            return bytes(bytearray(int(part, 16) for part in parts))
+        if len(parts) == 3:
+            return b"".join(struct.pack("!H", int(part, 16)) for part in parts)
+    except ValueError:
+        pass
+    raise BpfError("Invalid MAC address %r" % token)
+
+
+def _integer(packed):
+    return int(binascii.hexlify(packed), 16) if packed else 0
@@ -1,16 +1,46 @@
+import os
+import threading
 import time
-
-import requests
+from contextlib import contextmanager
 
 import sentrywire.const
-from sentrywire.exceptions import ErrorLookupTable, SentrywireException
+from sentrywire.const import CONTROL_LANE, DATA_LANE
+from sentrywire.exceptions import ErrorLookupTable, IntegrityError, RangeNotSatisfiable, SentrywireException
+from sentrywire.lazy import LazyHandler
+from sentrywire.limiter import ConcurrencyLimiter
+from sentrywire.responsecache import ResponseCache
+from sentrywire.retry import RetryBudget, RetryPolicy
+from sentrywire.singleflight import SingleFlight
 
 
-class Sentrywire:
+class Sentrywire(object):
     """
     Tracks session for an API connection
+
+    Handlers are created on first use, and requests is only imported by the first request, so creating a client
+    is cheap for short lived tools.
     """
 
+    # Map functions
+    # Active Triggers
+    activetriggers = LazyHandler("activetriggers", "sentrywire.v2.activetriggers", "ActiveTriggers")
+    # Authentication functionality
+    authentication = LazyHandler("authentication", "sentrywire.v2.authentication", "Authentication")
+    # Authorization functionality
+    authorization = LazyHandler("authorization", "sentrywire.v2.authorization", "Authorization")
+    # Federation functionality
+    federation = LazyHandler("federation", "sentrywire.v2.federation", "Federation")
+    # IDS Rule functionality
+    idsrules = LazyHandler("idsrules", "sentrywire.v2.idsrules", "IDSRules")
+    # Pre-capture filter functions
+    precapturefilter = LazyHandler("precapturefilter", "sentrywire.v2.precapturefilter", "PrecaptureFilter")
+    # Search functionality
+    searches = LazyHandler("searches", "sentrywire.v2.search", "Search")
+    # Log functionality
+    logs = LazyHandler("logs", "sentrywire.v2.search", "Logs")
+    # Server functionality
+    server = LazyHandler("server", "sentrywire.v2.server", "Server")
+
     def __init__(self,
                  host,
                  rest_token=None,
@@ -20,10 +50,56 @@ class Sentrywire:
                  retry_transient_errors=False,
                  timeout=sentrywire.const.TIMEOUT,
                  server_port=sentrywire.const.SERVER_PORT,
-                 user_agent=sentrywire.const.USER_AGENT
+                 user_agent=sentrywire.const.USER_AGENT,
+                 chunk_size=sentrywire.const.CHUNK_SIZE,
+                 retry_policy=None,
+                 limiter=None,
+                 data_session=None,
+                 lane_limits=None,
+                 relogin=True,
+                 token_store=None,
+                 pool_connections=sentrywire.const.POOL_CONNECTIONS,
+                 pool_maxsize=sentrywire.const.POOL_MAXSIZE,
+                 pool_block=False,
+                 pool_idle_timeout=None,
+                 coalesce_gets=False,
+                 response_cache=None
                  ):
         """
         Setup the client handler for the sentrywire API
+        Args:
+            chunk_size (int): Default number of bytes held in memory at a time when downloading search results
+            retry_policy (RetryPolicy): Optional, decides which failed requests are retried and when. Giving one
+                                        turns retries on. Defaults to a RetryPolicy with a budget shared by every
+                                        request of this client, used when retry_transient_errors is set
+            limiter (ConcurrencyLimiter or bool): Optional, adapts the number of requests in flight to the load of
+                                                  the unit. True creates one for this client, share one instance
+                                                  between clients talking to the same unit
+            data_session (requests.Session): Optional, session used for search result downloads, so they do not
+                                             take the connections of other calls. Defaults to a new session, or to
+                                             session if one is given
+            lane_limits (dict): Optional, maximum requests in flight per lane e.g. {"data": 4}. Lanes are
+                                sentrywire.const.CONTROL_LANE and sentrywire.const.DATA_LANE, unlimited by default
+            relogin (bool): Log in again with the credentials of the last login when the unit rejects the token
+                            with a 401, then resend the request
+            token_store (TokenStore): Optional, file of tokens shared between processes. When no rest_token is
+                                      given, a saved token for this unit is used, and login reuses a saved token
+                                      of the same user instead of creating a new one
+            pool_connections (int): Number of hosts whose connection pools are kept by each session
+            pool_maxsize (int): Connections kept per host by each session. Requests beyond this many at the same
+                                time open connections that are closed after use, unless pool_block is set
+            pool_block (bool): Wait for a pooled connection instead of opening an extra one
+            pool_idle_timeout (float): Optional, seconds without a request after which the pooled connections of a
+                                       lane are closed instead of reused, for units that drop idle connections
+            coalesce_gets (bool): Identical GET requests made at the same time by several threads share one request
+                                  to the unit and its result
+            response_cache (ResponseCache or bool): Optional, keeps the answers of read-mostly endpoints such as
+                                                    /fmping for a few seconds. True creates one with the default
+                                                    TTLs. Writes through this client invalidate the cached answers
+
+        One client can be shared by many threads. The token is swapped atomically, a rejected token leads to a
+        single login for every thread that hit it, and the session connection pools are thread safe. Do not change
+        the session (headers, cookies, adapters) while other threads are sending requests.
         """
         self.host = host
         self.server_port = server_port
@@ -34,51 +110,231 @@ class Sentrywire:
 
         self.verify = ssl_verify
         self.timeout = timeout
-        self.retry_transient_errors = retry_transient_errors
+        self.retry_transient_errors = retry_transient_errors or retry_policy is not None
+        self.retry_policy = retry_policy or RetryPolicy(budget=RetryBudget())
+        self.limiter = ConcurrencyLimiter() if limiter is True else limiter or None
+        self.chunk_size = chunk_size
 
         self.user_agent = user_agent
         self.headers = {"User-Agent": user_agent}
 
-        self.rest_token = rest_token
+        # Logins and logouts swap the token under this lock, so threads sharing the client see one token at a time
+        self._token_lock = threading.RLock()
+        self._credentials = None
+        self.relogin = relogin
+        self.token_store = token_store
+        if rest_token is None and token_store is not None:
+            rest_token = token_store.get(self._url)
+        self._rest_token = rest_token
 
         # Create a session object for requests
-        self.session = session or requests.Session()
-
-        # NOTE: We must delay import of sentrywire.v2 objects until now or
-        # otherwise it will cause circular import errors
-        import sentrywire.v2
-        objects = sentrywire.v2
-        self._objects = objects
-
-        # Map functions
-        # Active Triggers
-        self.activetriggers = objects.ActiveTriggers(self)
-        # Authentication functionality
-        self.authentication = objects.Authentication(self)
-        self.login = self.authentication.login
-        self.logout = self.authentication.logout
-        # Authorization functionality
-        self.authorization = objects.Authorization(self)
-        # Federation functionality
-        self.federation = objects.Federation(self)
-        # IDS Rule functionality
-        self.idsrules = objects.IDSRules(self)
-        # Pre-capture filter functions
-        self.precapturefilter = objects.PrecaptureFilter(self)
-        # Search functionality
-        self.searches = objects.Search(self)
-        # Log functionality
-        self.logs = objects.Logs(self)
-        # Server functionality
-        self.server = objects.Server(self)
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.pool_idle_timeout = pool_idle_timeout
+        # Sessions are created on first use. Downloads get their own session and connection pool so they never
+        # hold up status calls
+        self._session_lock = threading.Lock()
+        self._session = session
+        self._data_session = data_session
+        self._shared_session = session is not None and data_session is None
+        self._lane_slots = dict((lane, threading.BoundedSemaphore(limit))
+                                for lane, limit in (lane_limits or {}).items() if limit)
+        self._keepalive = None
+        self._last_used = {}
+        self.coalesce_gets = coalesce_gets
+        self._get_flights = SingleFlight()
+        self.response_cache = ResponseCache() if response_cache is True else response_cache or None
+
+    @property
+    def rest_token(self):
+        """The rest token sent with every request"""
+        return self._rest_token
+
+    @rest_token.setter
+    def rest_token(self, rest_token):
+        with self._token_lock:
+            self._rest_token = rest_token
+
+    def _swap_token(self, expected, rest_token):
+        """Replace the token only if it is still expected
+        Returns:
+            (bool): True if the token was replaced
+        """
+        with self._token_lock:
+            if self._rest_token != expected:
+                return False
+            self._rest_token = rest_token
+            return True
+
+    @property
+    def session(self):
+        """Session of the control lane"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._new_session()
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
+    @property
+    def data_session(self):
+        """Session of the data lane"""
+        if self._data_session is None:
+            session = self.session if self._shared_session else None
+            with self._session_lock:
+                if self._data_session is None:
+                    self._data_session = session or self._new_session()
+        return self._data_session
+
+    @data_session.setter
+    def data_session(self, session):
+        self._data_session = session
+
+    def _lane_session(self, lane):
+        return self.data_session if lane == DATA_LANE else self.session
 
     def __exit__(self):
+        self.stop_keepalive()
         if self.rest_token:
             self.authentication.logout()
-        self.session.close()
+        for session in (self._session, self._data_session):
+            if session is not None:
+                session.close()
 
     def login(self, username, password):
-        self.rest_token = self.authentication.login(username, password)
+        """See Authentication.login"""
+        return self.authentication.login(username, password)
+
+    def logout(self, rest_token=None):
+        """See Authentication.logout"""
+        return self.authentication.logout(rest_token)
+
+    def _new_session(self):
+        """A session whose https connection pool follows the pool settings of the client"""
+        import requests
+        import requests.adapters
+
+        session = requests.Session()
+        session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=self.pool_connections,
+                                                               pool_maxsize=self.pool_maxsize,
+                                                               pool_block=self.pool_block))
+        return session
+
+    def pool_stats(self):
+        """Usage of the connection pool of each lane for this unit
+        A num_connections close to num_requests means connections are being opened and closed instead of reused,
+        raise pool_maxsize
+        Returns:
+            (dict): stats by lane
+            Example
+            {
+                "control": {"maxsize": 32, "idle": 2, "in_use": 1, "num_connections": 3, "num_requests": 120},
+                "data": {"maxsize": 32, "idle": 4, "in_use": 4, "num_connections": 8, "num_requests": 16}
+            }
+        """
+        stats = {}
+        for lane in (CONTROL_LANE, DATA_LANE):
+            session = self._lane_session(lane)
+            adapter = session.get_adapter(self._base_url)
+            pool = adapter.poolmanager.connection_from_url(self._base_url)
+            # The queue holds idle connections and a None for each connection that has not been opened yet
+            queued = list(pool.pool.queue) if pool.pool is not None else []
+            stats[lane] = {
+                "maxsize": pool.pool.maxsize if pool.pool is not None else 0,
+                "idle": sum(1 for conn in queued if conn is not None),
+                "in_use": max(0, pool.pool.maxsize - len(queued)) if pool.pool is not None else 0,
+                "num_connections": pool.num_connections,
+                "num_requests": pool.num_requests
+            }
+        return stats
+
+    def _close_idle(self, lane, session):
+        """Drop the pooled connections of a lane that has not sent a request for pool_idle_timeout seconds"""
+        now = time.time()
+        last_used, self._last_used[lane] = self._last_used.get(lane), now
+        if last_used is not None and now - last_used > self.pool_idle_timeout:
+            session.get_adapter(self._base_url).poolmanager.clear()
+
+    def warmup(self, n_connections=1, lane=CONTROL_LANE):
+        """Open connections to the unit ahead of the requests that need them
+        Sends n_connections /fmping requests at the same time, so each one holds its own connection, and returns
+        every connection to the pool of the lane. Idle connections already in the pool are reused, which also keeps
+        them from being dropped. Keep n_connections at or below the pool size of the session.
+        Each request holds a slot of the lane while it is sent, so a limited lane is never exceeded.
+        Args:
+            n_connections (int): connections to open, nothing is sent if it is below 1
+            lane (str): lane whose pool is warmed, see lane_limits
+        Returns:
+            (int): connections that answered
+        """
+        if n_connections < 1:
+            return 0
+
+        from concurrent.futures import ThreadPoolExecutor
+        import requests
+
+        params = {"rest_token": self.rest_token}
+
+        def open_connection(_):
+            # Streamed requests do not take the lane slot themselves. A streamed response keeps its connection out
+            # of the pool until the body is read, so connections opened after the slot is released are new ones
+            with self._lane_slot(lane):
+                return self.http_request("get", "/fmping", params=params, stream=True, lane=lane,
+                                         retry_transient_errors=False, relogin=False)
+
+        results = []
+        with ThreadPoolExecutor(max_workers=n_connections) as executor:
+            futures = [executor.submit(open_connection, index) for index in range(n_connections)]
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except (SentrywireException, requests.exceptions.RequestException):
+                    pass
+        for result in results:
+            # Reading the whole body hands the connection back to the pool instead of closing it
+            result.content
+            result.close()
+        return len(results)
+
+    def start_keepalive(self, interval=sentrywire.const.KEEPALIVE_INTERVAL, n_connections=1):
+        """Ping the unit in the background to keep pooled connections and the rest token from expiring
+        A rejected token is replaced by a new login, see relogin.
+        Args:
+            interval (float): seconds between pings
+            n_connections (int): pooled connections kept open, see warmup
+        """
+        import requests
+
+        self.stop_keepalive()
+        stop = threading.Event()
+
+        def keepalive():
+            while not stop.wait(interval):
+                try:
+                    self.server.status()
+                    if n_connections > 1:
+                        self.warmup(n_connections)
+                except (SentrywireException, requests.exceptions.RequestException):
+                    # The next ping tries again
+                    pass
+
+        thread = threading.Thread(target=keepalive, name="sentrywire-keepalive")
+        thread.daemon = True
+        thread.start()
+        self._keepalive = (stop, thread)
+
+    def stop_keepalive(self):
+        """Stop the background pings started by start_keepalive"""
+        keepalive, self._keepalive = self._keepalive, None
+        if keepalive is not None:
+            stop, thread = keepalive
+            stop.set()
+            if thread is not threading.current_thread():
+                thread.join()
 
     @staticmethod
     def _get_base_url(host, port):
@@ -153,6 +409,29 @@ class Sentrywire:
             GitlabHttpError: When the return code is not 2xx
             GitlabParsingError: If the json data could not be parsed
         """
+        if kwargs.get("stream"):
+            return self._http_get(path, query_data, raw, **kwargs)
+
+        import json
+
+        key = (path, raw, json.dumps([query_data, kwargs], sort_keys=True, default=str))
+        cache = self.response_cache
+        if cache is None or cache.ttl(path) is None:
+            return self._coalesced_get(key, path, query_data, raw, **kwargs)
+
+        found, result = cache.get(key)
+        if not found:
+            generation = cache.generation(path)
+            result = self._coalesced_get(key, path, query_data, raw, **kwargs)
+            cache.put(key, path, result, generation)
+        return result
+
+    def _coalesced_get(self, key, path, query_data, raw, **kwargs):
+        if self.coalesce_gets:
+            return self._get_flights.do(key, self._http_get, path, query_data, raw, **kwargs)
+        return self._http_get(path, query_data, raw, **kwargs)
+
+    def _http_get(self, path, query_data, raw, **kwargs):
         query_data = query_data or {}
         result = self.http_request(
             "get", path, query_data=query_data, **kwargs
@@ -169,6 +448,128 @@ class Sentrywire:
             else:
                 return result
 
+    def http_download(self, path, file_path, chunk_size=None, resume=False, checksum=None, hash_name="sha256",
+                      **kwargs):
+        """Make a streamed GET request to the server and write the body to a file.
+        The body is written in fixed size chunks, so memory use does not grow with the size of the download.
+        The download is sent on the data lane and holds its slot until the file is written.
+        Args:
+            path (str): Path or full URL to query ('/projects' or
+                        'http://whatever/v4/api/projecs')
+            file_path (str): Path to write the response body to
+            chunk_size (int): Bytes to read and write at a time, defaults to the client chunk_size
+            resume (bool): If True and file_path already holds part of the body, only request the remaining bytes.
+                           Falls back to a full download when the server ignores the Range header
+            checksum (str): Optional, expected hex digest of the complete file
+            hash_name (str): hashlib algorithm used for checksum
+            **kwargs: Extra options to send to the server (e.g. params)
+        Returns:
+            The parsed json data if the server answered with a json message instead of a file, else None
+        Raises:
+            SentrywireException: If the json message could not be parsed
+            IntegrityError: If the written file does not match the announced size or the checksum
+        """
+        with self._lane_slot(DATA_LANE):
+            return self._download(path, file_path, chunk_size, resume, checksum, hash_name, **kwargs)
+
+    def _download(self, path, file_path, chunk_size, resume, checksum, hash_name, **kwargs):
+        chunk_size = chunk_size or self.chunk_size
+        offset = 0
+        if resume and os.path.isfile(file_path):
+            offset = os.path.getsize(file_path)
+
+        result = None
+        if offset:
+            try:
+                result = self.http_request("get", path, stream=True, headers={"Range": "bytes=%d-" % offset},
+                                           lane=DATA_LANE, **kwargs)
+            except RangeNotSatisfiable:
+                # The partial file is at least as long as the body, so it is either complete or stale
+                if checksum and self._file_digest(file_path, hash_name, chunk_size) == checksum.lower():
+                    return None
+                offset = 0
+        if result is None:
+            result = self.http_request("get", path, stream=True, lane=DATA_LANE, **kwargs)
+
+        try:
+            if result.headers.get("Content-Type", None) == "application/json":
+                try:
+                    return result.json()
+                except Exception:
+                    raise sentrywire.exceptions.SentrywireException("Failed to parse the server message")
+
+            offset, expected_size = self._body_range(result.status_code, result.headers, offset)
+            digest = self._start_digest(file_path, offset, checksum, hash_name, chunk_size)
+
+            with open(file_path, 'ab' if offset else 'wb+') as file_handler:
+                for chunk in result.iter_content(chunk_size=chunk_size):
+                    file_handler.write(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+        finally:
+            result.close()
+
+        self._check_download(file_path, expected_size, digest, checksum, hash_name)
+
+    @staticmethod
+    def _body_range(status_code, headers, offset):
+        """Where the body of a download goes in the file, and the size of the complete file
+        Returns:
+            (int, int): offset to write the body at, 0 if the server ignored the Range header, and the size the file
+                        must have once written, or None if the server did not announce it
+        Raises:
+            SentrywireException: If the server resumed from another offset than the one asked for
+        """
+        if status_code == 206:
+            content_range = headers.get("Content-Range", "")
+            if not content_range.startswith("bytes %d-" % offset):
+                raise SentrywireException("Server resumed from an unexpected offset: %s" % content_range)
+            total = content_range.rsplit("/", 1)[-1]
+            return offset, int(total) if total.isdigit() else None
+        # The server ignored the Range header and sent the whole body
+        if "Content-Length" in headers and "Content-Encoding" not in headers:
+            return 0, int(headers["Content-Length"])
+        return 0, None
+
+    @classmethod
+    def _start_digest(cls, file_path, offset, checksum, hash_name, chunk_size):
+        """Hash of the part of the file kept by a resumed download, or None if there is no checksum to check"""
+        import hashlib
+
+        if not checksum:
+            return None
+        digest = hashlib.new(hash_name)
+        if offset:
+            cls._file_digest(file_path, hash_name, chunk_size, digest)
+        return digest
+
+    @staticmethod
+    def _check_download(file_path, expected_size, digest, checksum, hash_name):
+        """Compare a written file to the announced size and the checksum
+        Raises:
+            IntegrityError: If either does not match, the file is removed on a checksum mismatch
+        """
+        if expected_size is not None and os.path.getsize(file_path) != expected_size:
+            raise IntegrityError("Downloaded %d of %d bytes" % (os.path.getsize(file_path), expected_size))
+        if digest is not None and digest.hexdigest() != checksum.lower():
+            # A corrupt prefix would poison every later resume, so start over next time
+            os.remove(file_path)
+            raise IntegrityError("%s checksum mismatch for %s" % (hash_name, file_path))
+
+    @staticmethod
+    def _file_digest(file_path, hash_name, chunk_size, digest=None):
+        """Hash a file in chunk_size pieces
+        Returns:
+            str: The hex digest
+        """
+        import hashlib
+
+        digest = digest or hashlib.new(hash_name)
+        with open(file_path, 'rb') as file_handler:
+            for chunk in iter(lambda: file_handler.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
     def http_put(
             self,
             path,
@@ -265,7 +666,10 @@ class Sentrywire:
             raw=False,
             files=None,
             timeout=None,
-            max_retries=10,
+            max_retries=None,
+            stream=False,
+            headers=None,
+            lane=None,
             **kwargs
     ):
         """Make an HTTP request to the server.
@@ -281,20 +685,120 @@ class Sentrywire:
             files (dict): The files to send to the server
             timeout (float): The timeout, in seconds, for the request
             max_retries (int): Max retries after 429 or transient errors,
-                               set to -1 to retry forever. Defaults to 10.
+                               set to -1 to retry forever. Defaults to the max_retries of the retry policy.
+            stream (bool): If True, do not download the body until it is read from the result
+            headers (dict): Extra headers to send with this request
+            lane (str): Lane to send the request on, see lane_limits. Defaults to the data lane for streamed
+                        requests and the control lane otherwise. The lane slot of a streamed request is held by
+                        http_download until the body is read, other requests hold it until they return
         Returns:
             A requests result object.
         Raises:
             -
         """
-        url = self._build_url(path)
-
-        opts = self._get_session_opts()
+        import requests
 
         # If timeout was defined, allow it to override the default
         if timeout is None:
             timeout = self.timeout
 
+        if lane is None:
+            lane = DATA_LANE if stream else CONTROL_LANE
+        session = self._lane_session(lane)
+        if self.pool_idle_timeout is not None:
+            self._close_idle(lane, session)
+
+        prepped, settings = self._prepare_request(session, verb, path, params, post_data, raw, files, headers, stream)
+
+        retry_transient_errors = kwargs.get(
+            "retry_transient_errors", self.retry_transient_errors
+        )
+        policy = self.retry_policy if retry_transient_errors else None
+        if policy is not None:
+            policy.on_request()
+
+        # Writes drop cached answers even when they fail, they may have been applied before failing
+        invalidate = self.response_cache is not None and verb.lower() != "get"
+        try:
+            start = time.time()
+            cur_retries = 0
+            relogged = False
+            while True:
+                try:
+                    if stream:
+                        result = self._send(session, prepped, path, timeout, settings)
+                    else:
+                        with self._lane_slot(lane):
+                            result = self._send(session, prepped, path, timeout, settings)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    wait_time = None
+                    if policy is not None:
+                        wait_time = policy.next_wait(verb, cur_retries, time.time() - start, connection_error=True,
+                                                     max_retries=max_retries)
+                    if wait_time is None:
+                        raise
+                    cur_retries += 1
+                    time.sleep(wait_time)
+                    continue
+
+                if 200 <= result.status_code < 300:
+                    return result
+
+                if result.status_code == 401 and not relogged and kwargs.get("relogin", self.relogin):
+                    # The token expired, log in again and send the request with the new token
+                    stale_token = self._sent_token(params, post_data)
+                    rest_token = self._relogin(stale_token)
+                    if rest_token is not None:
+                        relogged = True
+                        params = self._replace_token(params, stale_token, rest_token)
+                        post_data = self._replace_token(post_data, stale_token, rest_token)
+                        prepped, settings = self._prepare_request(session, verb, path, params, post_data, raw, files,
+                                                                  headers, stream)
+                        result.close()
+                        continue
+
+                if policy is not None:
+                    wait_time = policy.next_wait(verb, cur_retries, time.time() - start, status=result.status_code,
+                                                 retry_after=result.headers.get("Retry-After"), max_retries=max_retries)
+                    if wait_time is not None:
+                        cur_retries += 1
+                        result.close()
+                        time.sleep(wait_time)
+                        continue
+
+                error_message = result.content
+                try:
+                    error_json = result.json()
+                    for k in ("message", "error", "msg"):
+                        if k in error_json:
+                            error_message = error_json[k]
+                except (KeyError, ValueError, TypeError):
+                    pass
+
+                if result.status_code in ErrorLookupTable:
+                    if error_message:
+                        raise ErrorLookupTable[result.status_code](error_message)
+                    else:
+                        raise ErrorLookupTable[result.status_code]()
+
+                raise SentrywireException(error_message)
+        finally:
+            if invalidate:
+                self.response_cache.invalidate(path)
+
+    def _prepare_request(self, session, verb, path, params, post_data, raw, files, headers, stream):
+        """Build the request to send
+        Returns:
+            (requests.PreparedRequest, dict): The request and the settings to send it with
+        """
+        import requests
+
+        url = self._build_url(path)
+
+        opts = self._get_session_opts()
+        if headers:
+            opts["headers"].update(headers)
+
         # We need to deal with json vs. data when uploading files
         json, data, content_type = self._prepare_send_data(files, post_data, raw)
 
@@ -306,46 +810,70 @@ class Sentrywire:
         else:
             req = requests.Request(verb, url, json=json, data=data, params=params, **opts)
 
-        prepped = self.session.prepare_request(req)
-        settings = self.session.merge_environment_settings(
-            prepped.url, {}, None, self.verify, None
+        prepped = session.prepare_request(req)
+        settings = session.merge_environment_settings(
+            prepped.url, {}, stream, self.verify, None
         )
+        return prepped, settings
 
-        cur_retries = 0
-        while True:
-            result = self.session.send(prepped, timeout=timeout, **settings)
-
-            if 200 <= result.status_code < 300:
-                return result
-
-            retry_transient_errors = kwargs.get(
-                "retry_transient_errors", self.retry_transient_errors
-            )
-            if result.status_code in [500, 502, 503, 504] and retry_transient_errors:
-                if max_retries == -1 or cur_retries < max_retries:
-                    wait_time = 2 ** cur_retries * 0.1
-                    if "Retry-After" in result.headers:
-                        wait_time = int(result.headers["Retry-After"])
-                    cur_retries += 1
-                    time.sleep(wait_time)
-                    continue
-
-            error_message = result.content
-            try:
-                error_json = result.json()
-                for k in ("message", "error", "msg"):
-                    if k in error_json:
-                        error_message = error_json[k]
-            except (KeyError, ValueError, TypeError):
-                pass
-
-            if result.status_code in ErrorLookupTable:
-                if error_message:
-                    raise ErrorLookupTable[result.status_code](error_message)
-                else:
-                    raise ErrorLookupTable[result.status_code]()
+    @staticmethod
+    def _sent_token(params, post_data):
+        """The rest token a request was sent with, if any"""
+        for data in (params, post_data):
+            if isinstance(data, dict) and data.get("rest_token"):
+                return data["rest_token"]
+        return None
 
-            raise SentrywireException(error_message)
+    @staticmethod
+    def _replace_token(data, stale_token, rest_token):
+        if isinstance(data, dict) and data.get("rest_token") == stale_token:
+            data = dict(data)
+            data["rest_token"] = rest_token
+        return data
+
+    def _relogin(self, stale_token):
+        """Log in again after the unit rejected stale_token
+        Threads that hit the same expired token wait for a single login and all reuse its token.
+        Returns:
+            (str): The new rest token, or None if the client has no credentials to log in with
+        """
+        if stale_token is None:
+            return None
+        with self._token_lock:
+            if self._rest_token and self._rest_token != stale_token:
+                # Another thread already logged in
+                return self._rest_token
+            if self.token_store is not None:
+                # Keep login and other processes from reusing the rejected token, a token saved by another process is
+                # still reused
+                self.token_store.discard(self._url, stale_token)
+            if self._credentials is None:
+                return None
+            return self.authentication.login(*self._credentials)
+
+    @contextmanager
+    def _lane_slot(self, lane):
+        """Hold one of the slots of a lane, if the lane is limited"""
+        slots = self._lane_slots.get(lane)
+        if slots is None:
+            yield
+            return
+        with slots:
+            yield
+
+    def _send(self, session, prepped, path, timeout, settings):
+        """Send one attempt of a request, holding a limiter slot until the response headers arrive"""
+        if self.limiter is None:
+            return session.send(prepped, timeout=timeout, **settings)
+
+        started = self.limiter.acquire()
+        overloaded = True
+        try:
+            result = session.send(prepped, timeout=timeout, **settings)
+            overloaded = result.status_code == 429 or result.status_code >= 500
+            return result
+        finally:
+            self.limiter.release(started, overloaded, key=path)
 
     @staticmethod
     def _prepare_send_data(
@@ -378,6 +906,7 @@ class Sentrywire:
     def enable_debug():
         import logging
         import sys
+        import requests
         if sys.version_info[0] == 3:
             from http.client import HTTPConnection
             from requests.packages.urllib3.exceptions import InsecureRequestWarning
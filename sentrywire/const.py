@@ -2,5 +2,66 @@ from sentrywire.__about__ import __title__, __version__
 
 SERVER_PORT = 41395
 TIMEOUT = 500
+# Bytes held in memory at a time when downloading search results
+CHUNK_SIZE = 1024 * 1024
+# Chunks downloaded at the same time by Pcaps.get_all
+PCAP_WORKERS = 4
 
 USER_AGENT = "{}/{}".format(__title__, __version__)
+
+# Simultaneous connections held by an AsyncSentrywire session
+ASYNC_POOL_MAXSIZE = 100
+
+# Bounds in seconds for the SearchWatcher poll interval
+WATCH_MIN_INTERVAL = 1
+WATCH_MAX_INTERVAL = 30
+
+# Search shards submitted to a unit at the same time
+SHARD_SUBMIT_CONCURRENCY = 4
+
+# Size a ResultCache is trimmed to
+RESULT_CACHE_MAX_BYTES = 10 * 1024 ** 3
+
+# Seconds behind now an IncrementalSearch stops and a ResultCache window is still open, packets still being written
+# to disk by the unit are not searched yet
+INCREMENTAL_CAPTURE_LAG = 10
+
+# Bounds on the requests a ConcurrencyLimiter lets run at the same time
+LIMITER_INITIAL = 4
+LIMITER_MAX = 64
+
+# Request lanes, each with its own connection pool: calls answered from the unit state, and search result downloads
+CONTROL_LANE = "control"
+DATA_LANE = "data"
+
+# Seconds a rest token saved in a TokenStore is reused before logging in again
+TOKEN_MAX_AGE = 3600
+
+# Seconds between the /fmping requests of the client keepalive
+KEEPALIVE_INTERVAL = 60
+
+# Connection pools of a client session: hosts kept, connections kept per host
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 32
+
+# Seconds a ResponseCache keeps the answer of each endpoint, endpoints not listed are not cached. Only json control
+# endpoints are listed, file downloads such as /idsrulesetcontent are never kept in memory
+CACHE_TTLS = {
+    "/fmping": 5,
+    "/fmgroup": 60,
+    "/authorization": 60,
+    "/idsruleset": 60,
+    "/activetriggers": 30,
+    "/precapturefilters": 60
+}
+# Cached endpoints whose answer changes when another endpoint is written to
+CACHE_DEPENDENTS = {
+    "/fmnode": ("/fmping", "/fmgroup"),
+    "/fmgroup": ("/fmping",),
+    "/fmcapture": ("/fmping",)
+}
+# Answers kept by a ResponseCache
+CACHE_MAX_ENTRIES = 256
+
+# Packets decoded together by sentrywire.flows.summarize
+FLOW_BATCH_SIZE = 65536
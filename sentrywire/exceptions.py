@@ -22,6 +22,30 @@ class NotFound(SentrywireException):
     """
 
 
+class RangeNotSatisfiable(SentrywireException):
+    """
+    A 416 error, the requested byte range is past the end of the file
+    """
+
+
+class IntegrityError(SentrywireException):
+    """
+    A downloaded file does not match its expected size or checksum
+    """
+
+
+class PcapError(SentrywireException):
+    """
+    A pcap file could not be parsed
+    """
+
+
+class BpfError(SentrywireException):
+    """
+    A bpf filter expression could not be compiled
+    """
+
+
 class TooManyRequests(SentrywireException):
     """
     Server is likely full or busy
@@ -39,6 +63,7 @@ ErrorLookupTable = {
     401: InvalidAuthentication,
     403: InvalidAuthentication,
     404: NotFound,
+    416: RangeNotSatisfiable,
     429: TooManyRequests,
     500: ServerError
 }
@@ -0,0 +1,178 @@
+"""
+Flow summaries of pcap packets, requires the numpy library
+"""
+import socket
+import struct
+
+import sentrywire.const
+from sentrywire.exceptions import SentrywireException
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPE_VLAN = (0x8100, 0x88a8)
+# IPv6 hop-by-hop, routing, fragment and destination options headers
+IPV6_EXTENSIONS = (0, 43, 44, 60)
+PORT_PROTOCOLS = (6, 17, 132)
+
+KEY_FIELDS = ("family", "src_hi", "src_lo", "dst_hi", "dst_lo", "proto", "sport", "dport")
+_BATCH_DTYPE = [("family", "u1"), ("src_hi", "u8"), ("src_lo", "u8"), ("dst_hi", "u8"), ("dst_lo", "u8"),
+                ("proto", "u1"), ("sport", "u2"), ("dport", "u2"),
+                ("packets", "i8"), ("bytes", "i8"), ("first", "f8"), ("last", "f8")]
+FLOW_DTYPE = [("src", "U39"), ("dst", "U39"), ("proto", "u1"), ("sport", "u2"), ("dport", "u2"),
+              ("packets", "i8"), ("bytes", "i8"), ("first", "f8"), ("last", "f8")]
+
+
+def summarize(packets, linktype=LINKTYPE_ETHERNET, batch_size=sentrywire.const.FLOW_BATCH_SIZE):
+    """Aggregate packets into one row per 5-tuple flow
+    Packets are decoded batch_size at a time: their bytes are joined into one numpy buffer and every header field
+    is read for the whole batch at once, then the batch is grouped by flow and folded into the running table.
+    Packets that are not IPv4 or IPv6 are skipped. Flows are one way, each direction of a connection is its own row.
+    Args:
+        packets: iterable of sentrywire.pcap.Packet, e.g. from sentrywire.pcap.iter_packets or Pcaps.iter_packets
+        linktype (int): Optional, link type of the capture: Ethernet (1, with 802.1Q/802.1ad tags), Linux cooked
+                        (113) or raw IP (101, 228, 229)
+        batch_size (int): Optional, packets decoded at a time
+    Returns:
+        (numpy.ndarray): structured array of FLOW_DTYPE, sorted by first seen time
+            Example
+            [('10.0.0.1', '10.0.0.2', 17, 1000, 53, 17, 1054, 1000.0, 1048.0), ...]
+            with fields src, dst, proto, sport, dport, packets, bytes (on the wire), first, last (seconds)
+    Raises:
+        SentrywireException: If numpy is not installed or the link type is not supported
+    """
+    np = _numpy()
+    if linktype not in (LINKTYPE_ETHERNET, LINKTYPE_RAW, LINKTYPE_LINUX_SLL, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        raise SentrywireException("Flow summaries do not support link type %d" % linktype)
+
+    table = np.zeros(0, dtype=_BATCH_DTYPE)
+    batch = []
+    for packet in packets:
+        batch.append(packet)
+        if len(batch) >= batch_size:
+            table = _reduce(np, np.concatenate((table, _decode(np, batch, linktype))))
+            batch = []
+    if batch:
+        table = _reduce(np, np.concatenate((table, _decode(np, batch, linktype))))
+
+    flows = np.zeros(len(table), dtype=FLOW_DTYPE)
+    for name in ("proto", "sport", "dport", "packets", "bytes", "first", "last"):
+        flows[name] = table[name]
+    flows["src"] = [_address(row["family"], row["src_hi"], row["src_lo"]) for row in table]
+    flows["dst"] = [_address(row["family"], row["dst_hi"], row["dst_lo"]) for row in table]
+    return flows[np.argsort(flows["first"], kind="stable")]
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise SentrywireException("Flow summaries require the numpy library")
+    return numpy
+
+
+def _decode(np, batch, linktype):
+    """Decode the headers of a batch of packets
+    Returns:
+        (numpy.ndarray): one row of _BATCH_DTYPE per IP packet
+    """
+    caplens = np.fromiter((packet.caplen for packet in batch), dtype=np.int64, count=len(batch))
+    starts = np.zeros(len(batch), dtype=np.int64)
+    np.cumsum(caplens[:-1], out=starts[1:])
+    # Reads past the end of a packet land in the next one or in the padding, and are masked out by caplen
+    buf = np.frombuffer(b"".join([packet.data for packet in batch]) + b"\0" * 64, dtype=np.uint8)
+    last = len(buf) - 1
+
+    def u8(offsets):
+        return buf[np.minimum(starts + offsets, last)].astype(np.uint64)
+
+    def u16(offsets):
+        return (u8(offsets) << np.uint64(8)) | u8(offsets + 1)
+
+    def u32(offsets):
+        return (u16(offsets) << np.uint64(16)) | u16(offsets + 2)
+
+    def u64(offsets):
+        return (u32(offsets) << np.uint64(32)) | u32(offsets + 4)
+
+    zero = np.zeros(len(batch), dtype=np.int64)
+    if linktype == LINKTYPE_ETHERNET:
+        l3 = zero + 14
+        ethertype = u16(zero + 12)
+        for _ in range(2):
+            tagged = np.isin(ethertype, ETHERTYPE_VLAN)
+            ethertype = np.where(tagged, u16(l3 + 2), ethertype)
+            l3 = np.where(tagged, l3 + 4, l3)
+    elif linktype == LINKTYPE_LINUX_SLL:
+        l3 = zero + 16
+        ethertype = u16(zero + 14)
+    else:
+        l3 = zero
+        version = u8(zero) >> np.uint64(4)
+        ethertype = np.where(version == 4, ETHERTYPE_IPV4, np.where(version == 6, ETHERTYPE_IPV6, 0))
+
+    ipv4 = (ethertype == ETHERTYPE_IPV4) & (caplens >= l3 + 20)
+    ipv6 = (ethertype == ETHERTYPE_IPV6) & (caplens >= l3 + 40)
+
+    # IPv6 extension headers are followed, a fragment header with a non zero offset means no transport header
+    next_header = u8(l3 + 6)
+    l4_v6 = l3 + 40
+    fragment_v6 = np.zeros(len(batch), dtype=bool)
+    for _ in range(4):
+        extension = ipv6 & np.isin(next_header, IPV6_EXTENSIONS)
+        fragment_v6 |= extension & (next_header == 44) & ((u16(l4_v6 + 2) >> np.uint64(3)) != 0)
+        length = np.where(next_header == 44, 8, (u8(l4_v6 + 1).astype(np.int64) + 1) * 8)
+        next_header = np.where(extension, u8(l4_v6), next_header)
+        l4_v6 = np.where(extension, l4_v6 + length, l4_v6)
+
+    proto = np.where(ipv4, u8(l3 + 9), next_header)
+    l4 = np.where(ipv4, l3 + (u8(l3) & np.uint64(0xf)).astype(np.int64) * 4, l4_v6)
+    fragment = np.where(ipv4, (u16(l3 + 6) & np.uint64(0x1fff)) != 0, fragment_v6)
+    ports = np.isin(proto, PORT_PROTOCOLS) & ~fragment & (caplens >= l4 + 4)
+
+    rows = np.zeros(len(batch), dtype=_BATCH_DTYPE)
+    rows["family"] = np.where(ipv4, 4, 6)
+    # IPv4 addresses are kept as IPv4 mapped IPv6 addresses, so both families share the key columns
+    rows["src_hi"] = np.where(ipv4, 0, u64(l3 + 8))
+    rows["src_lo"] = np.where(ipv4, u32(l3 + 12) | np.uint64(0xffff00000000), u64(l3 + 16))
+    rows["dst_hi"] = np.where(ipv4, 0, u64(l3 + 24))
+    rows["dst_lo"] = np.where(ipv4, u32(l3 + 16) | np.uint64(0xffff00000000), u64(l3 + 32))
+    rows["proto"] = proto
+    rows["sport"] = np.where(ports, u16(l4), 0)
+    rows["dport"] = np.where(ports, u16(l4 + 2), 0)
+    rows["packets"] = 1
+    rows["bytes"] = [packet.origlen for packet in batch]
+    # Packets without a timestamp (pcapng simple packet blocks) are ignored by fmin and fmax in _reduce
+    rows["first"] = [np.nan if packet.timestamp is None else packet.timestamp for packet in batch]
+    rows["last"] = rows["first"]
+    return rows[ipv4 | ipv6]
+
+
+def _reduce(np, table):
+    """Merge the rows of table that share a flow key"""
+    if not len(table):
+        return table
+    table = table[np.lexsort([table[name] for name in reversed(KEY_FIELDS)])]
+    changed = np.zeros(len(table), dtype=bool)
+    changed[0] = True
+    for name in KEY_FIELDS:
+        changed[1:] |= table[name][1:] != table[name][:-1]
+    starts = np.flatnonzero(changed)
+
+    flows = table[starts]
+    flows["packets"] = np.add.reduceat(table["packets"], starts)
+    flows["bytes"] = np.add.reduceat(table["bytes"], starts)
+    flows["first"] = np.fmin.reduceat(table["first"], starts)
+    flows["last"] = np.fmax.reduceat(table["last"], starts)
+    return flows
+
+
+def _address(family, high, low):
+    if family == 4:
+        return socket.inet_ntoa(struct.pack("!I", int(low) & 0xffffffff))
+    return socket.inet_ntop(socket.AF_INET6, struct.pack("!QQ", int(high), int(low)))
@@ -0,0 +1,40 @@
+"""
+Handlers created on first use
+"""
+import importlib
+import threading
+
+_lock = threading.RLock()
+
+
+class LazyHandler(object):
+    """
+    Class attribute that creates a handler the first time it is read from an instance
+
+    The handler is stored on the instance under the same name, so later reads are plain attribute lookups. The
+    module of the handler is only imported then, which keeps client construction and `import sentrywire` cheap.
+    """
+
+    def __init__(self, name, module, class_name):
+        """Lazy handler
+        Args:
+            name (str): attribute name the descriptor is assigned to
+            module (str): module defining the handler e.g. "sentrywire.v2.search"
+            class_name (str): handler class, created with the client of the instance
+        """
+        self.name = name
+        self.module = module
+        self.class_name = class_name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        with _lock:
+            # Another thread may have created it while this one waited
+            handler = instance.__dict__.get(self.name)
+            if handler is None:
+                handler_class = getattr(importlib.import_module(self.module), self.class_name)
+                # Sub-handlers are created with the client of their parent handler
+                handler = handler_class(getattr(instance, "sw", instance))
+                instance.__dict__[self.name] = handler
+        return handler
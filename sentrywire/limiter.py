@@ -0,0 +1,99 @@
+"""
+Adaptive limit on the requests a client sends at the same time
+"""
+import threading
+import time
+
+import sentrywire.const
+
+
+class ConcurrencyLimiter(object):
+    """
+    Additive increase, multiplicative decrease (AIMD) limit on in-flight requests
+
+    Every healthy response raises the limit by about one request per round trip. A 429, a 5xx, a connection error
+    or responses to the same path getting much slower than their long run average cut the limit by `decrease`.
+    Only requests sent after the last cut can cut it again, so one overload episode is answered once and not by
+    every request in flight.
+    A single limiter is safe to share between threads and clients.
+    """
+
+    def __init__(self,
+                 initial=sentrywire.const.LIMITER_INITIAL,
+                 minimum=1,
+                 maximum=sentrywire.const.LIMITER_MAX,
+                 decrease=0.5,
+                 latency_tolerance=2.0,
+                 min_latency=0.05):
+        """Concurrency limiter
+        Args:
+            initial (int): requests allowed in flight at first
+            minimum (int): lower bound of the limit
+            maximum (int): upper bound of the limit
+            decrease (float): factor applied to the limit on overload
+            latency_tolerance (float): a response slower than this many times the baseline latency counts as overload
+            min_latency (float): seconds under which a response never counts as slow, to ignore jitter on fast calls
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.min_latency = min_latency
+        self._limit = float(max(minimum, min(maximum, initial)))
+        self._in_flight = 0
+        self._latencies = {}
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        """Requests currently allowed in flight"""
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        """Requests currently in flight"""
+        return self._in_flight
+
+    def acquire(self):
+        """Wait for a free slot
+        Returns:
+            (float): time the slot was taken, to pass back to release
+        """
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+            return time.time()
+
+    def release(self, started, overloaded=False, key=None):
+        """Give back a slot and adjust the limit
+        Args:
+            started (float): value returned by acquire
+            overloaded (bool): the unit answered 429 or 5xx, or the request failed to connect
+            key (str): Optional, what the request was e.g. its path. Latency is only compared between requests
+                       with the same key, since a search takes longer than a ping even on an idle unit
+        """
+        now = time.time()
+        latency = now - started
+        with self._condition:
+            saturated = self._in_flight >= int(self._limit)
+            self._in_flight -= 1
+
+            # A fast moving average of latency is compared to a slow one, so neither a single slow response nor
+            # a unit that has become slower for good keeps cutting the limit
+            baseline, average = self._latencies.get(key, (latency, latency))
+            average += (latency - average) * 0.2
+            baseline += (latency - baseline) * 0.02
+            self._latencies[key] = (baseline, average)
+            if not overloaded and average > self.min_latency:
+                overloaded = average > baseline * self.latency_tolerance
+
+            if overloaded:
+                if started >= self._last_decrease:
+                    self._limit = max(self.minimum, self._limit * self.decrease)
+                    self._last_decrease = now
+            elif saturated:
+                # Only grow while the limit is what holds requests back
+                self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+            self._condition.notify_all()
@@ -0,0 +1,447 @@
+"""
+Helpers for the pcap files returned by Pcaps.get
+"""
+import shutil
+import struct
+from collections import namedtuple
+
+from sentrywire.exceptions import PcapError
+
+MAGIC_USEC = 0xa1b2c3d4
+MAGIC_NSEC = 0xa1b23c4d
+
+GLOBAL_HEADER_LENGTH = 24
+RECORD_HEADER_LENGTH = 16
+
+# pcapng block types
+BLOCK_SECTION_HEADER = 0x0a0d0d0a
+BLOCK_INTERFACE = 0x00000001
+BLOCK_PACKET = 0x00000002
+BLOCK_SIMPLE_PACKET = 0x00000003
+BLOCK_ENHANCED_PACKET = 0x00000006
+BYTE_ORDER_MAGIC = 0x1a2b3c4d
+
+# Larger records are taken as a corrupt file rather than waited for
+MAX_RECORD_LENGTH = 64 * 1024 * 1024
+
+# Types of a path given to iter_packets
+try:
+    _TEXT_TYPES = (basestring,)
+except NameError:
+    _TEXT_TYPES = (str,)
+
+
+class Packet(namedtuple("Packet", ("timestamp", "caplen", "origlen", "data"))):
+    """
+    A captured packet
+
+    timestamp (float): seconds since the epoch, None for pcapng simple packet blocks which have no timestamp
+    caplen (int): bytes captured
+    origlen (int): length of the packet on the wire
+    data (memoryview): the captured bytes, a view into the buffer they were read into
+    """
+    __slots__ = ()
+
+
+class PcapHeader(object):
+    """
+    The global header of a pcap file
+    """
+
+    def __init__(self, endian="<", nanosecond=False, snaplen=65535, linktype=1, version=(2, 4)):
+        self.endian = endian
+        self.nanosecond = nanosecond
+        self.snaplen = snaplen
+        self.linktype = linktype
+        self.version = version
+
+    @classmethod
+    def parse(cls, data):
+        """Parse the first 24 bytes of a pcap file
+        Raises:
+            PcapError: If data is not a pcap global header
+        """
+        if len(data) < GLOBAL_HEADER_LENGTH:
+            raise PcapError("Truncated pcap header")
+        for endian in ("<", ">"):
+            magic = struct.unpack(endian + "I", data[:4])[0]
+            if magic in (MAGIC_USEC, MAGIC_NSEC):
+                major, minor, _, _, snaplen, linktype = struct.unpack(endian + "HHiIII", data[4:GLOBAL_HEADER_LENGTH])
+                return cls(endian, magic == MAGIC_NSEC, snaplen, linktype, (major, minor))
+        raise PcapError("Not a pcap file")
+
+    def pack(self):
+        magic = MAGIC_NSEC if self.nanosecond else MAGIC_USEC
+        return struct.pack(self.endian + "IHHiIII", magic, self.version[0], self.version[1], 0, 0,
+                           self.snaplen, self.linktype)
+
+    def compatible(self, other):
+        """Whether records of other can be copied byte for byte into a file with this header"""
+        return (self.endian, self.nanosecond, self.linktype) == (other.endian, other.nanosecond, other.linktype)
+
+
+def read_header(file_handler):
+    """Read and parse the global header at the start of an open pcap file"""
+    return PcapHeader.parse(file_handler.read(GLOBAL_HEADER_LENGTH))
+
+
+def read_records(file_handler, header):
+    """Yield (ts_sec, ts_frac, orig_len, data) for each record after the global header of an open pcap file"""
+    record = struct.Struct(header.endian + "IIII")
+    while True:
+        raw = file_handler.read(RECORD_HEADER_LENGTH)
+        if not raw:
+            return
+        if len(raw) < RECORD_HEADER_LENGTH:
+            raise PcapError("Truncated pcap record header")
+        ts_sec, ts_frac, caplen, orig_len = record.unpack(raw)
+        data = file_handler.read(caplen)
+        if len(data) < caplen:
+            raise PcapError("Truncated pcap record")
+        yield ts_sec, ts_frac, orig_len, data
+
+
+def concatenate(input_paths, output_path, chunk_size=1024 * 1024):
+    """Join pcap files into one, in the order given
+    Files whose header matches the first file are copied without parsing their records. Others are rewritten with
+    the byte order and timestamp resolution of the first file.
+    Args:
+        input_paths (list of str): pcap files to join
+        output_path (str): path of the joined pcap file
+        chunk_size (int): bytes copied at a time
+    Returns:
+        (int): number of input files written
+    Raises:
+        PcapError: If an input is not a pcap file or has a different link type
+    """
+    output_header = None
+    written = 0
+    with open(output_path, 'wb+') as output:
+        for path in input_paths:
+            with open(path, 'rb') as source:
+                first = source.read(GLOBAL_HEADER_LENGTH)
+                if not first:
+                    # Empty chunk, nothing was captured for it
+                    continue
+                header = PcapHeader.parse(first)
+                if output_header is None:
+                    output_header = header
+                    output.write(header.pack())
+
+                if output_header.compatible(header):
+                    shutil.copyfileobj(source, output, chunk_size)
+                elif output_header.linktype != header.linktype:
+                    raise PcapError("Can not join link type %d with %d" % (header.linktype, output_header.linktype))
+                else:
+                    _rewrite_records(source, header, output, output_header)
+            written += 1
+
+    if output_header is None:
+        with open(output_path, 'wb+') as output:
+            output.write(PcapHeader().pack())
+    return written
+
+
+def merge(input_paths, output_path, dedupe=False, chunk_size=1024 * 1024):
+    """Merge pcap files that are each in time order into one time ordered file, in a single pass
+    Only the next record of every input is held in memory, so the size of the inputs does not matter. Records are
+    written with the byte order and timestamp resolution of the first file. Records with the same timestamp keep
+    the order of input_paths.
+    Args:
+        input_paths (list of str): pcap files to merge, e.g. the chunks of a search from several nodes
+        output_path (str): path of the merged pcap file
+        dedupe (bool): Optional, drop records with the same timestamp, length and bytes as an earlier record,
+                       as captured twice by overlapping search windows
+        chunk_size (int): bytes buffered for the output, and shared by the inputs for reading
+    Returns:
+        (int): number of packets written
+    Raises:
+        PcapError: If an input is not a pcap file, is truncated or has a different link type
+    """
+    import heapq
+
+    buffer_size = max(64 * 1024, chunk_size // max(1, len(input_paths)))
+    sources = []
+    headers = []
+    output_header = None
+    try:
+        for path in input_paths:
+            source = open(path, 'rb', buffer_size)
+            sources.append(source)
+            first = source.read(GLOBAL_HEADER_LENGTH)
+            if not first:
+                # Empty chunk, nothing was captured for it
+                continue
+            header = PcapHeader.parse(first)
+            if output_header is None:
+                output_header = header
+            elif output_header.linktype != header.linktype:
+                raise PcapError("Can not join link type %d with %d" % (header.linktype, output_header.linktype))
+            headers.append((source, header))
+
+        output_header = output_header or PcapHeader()
+        inputs = [_timed_records(source, header, output_header, order)
+                  for order, (source, header) in enumerate(headers)]
+        record = struct.Struct(output_header.endian + "IIII")
+        written = 0
+        with open(output_path, 'wb+', chunk_size) as output:
+            output.write(output_header.pack())
+            last_time = None
+            seen = set()
+            # Records are (nanoseconds, input order, ...), so ties are broken by the order of the inputs and the
+            # record bytes are never compared
+            for _, _, ts_sec, ts_frac, orig_len, data in heapq.merge(*inputs):
+                if dedupe:
+                    # Duplicates share a timestamp, so only the records of the current timestamp are remembered
+                    if (ts_sec, ts_frac) != last_time:
+                        last_time = (ts_sec, ts_frac)
+                        seen.clear()
+                    if (orig_len, data) in seen:
+                        continue
+                    seen.add((orig_len, data))
+                output.write(record.pack(ts_sec, ts_frac, len(data), orig_len))
+                output.write(data)
+                written += 1
+    finally:
+        for source in sources:
+            source.close()
+    return written
+
+
+def _timed_records(source, header, output_header, order):
+    """Yield (nanoseconds, order, ts_sec, ts_frac, orig_len, data) for each record of an open pcap file, with ts_frac
+    in the resolution of output_header
+    """
+    scale = 1 if header.nanosecond else 1000
+    for ts_sec, ts_frac, orig_len, data in read_records(source, header):
+        nanoseconds = ts_sec * 1000000000 + ts_frac * scale
+        if header.nanosecond and not output_header.nanosecond:
+            ts_frac //= 1000
+        elif output_header.nanosecond and not header.nanosecond:
+            ts_frac *= 1000
+        yield nanoseconds, order, ts_sec, ts_frac, orig_len, data
+
+
+def _rewrite_records(source, header, output, output_header):
+    record = struct.Struct(output_header.endian + "IIII")
+    for ts_sec, ts_frac, orig_len, data in read_records(source, header):
+        if header.nanosecond and not output_header.nanosecond:
+            ts_frac //= 1000
+        elif output_header.nanosecond and not header.nanosecond:
+            ts_frac *= 1000
+        output.write(record.pack(ts_sec, ts_frac, len(data), orig_len))
+        output.write(data)
+
+
+def iter_packets(source, chunk_size=1024 * 1024, linktypes=None):
+    """Parse the packets of a pcap or pcapng capture as it is read
+    Records are read chunk_size bytes at a time and handed out as memoryview slices of the chunk they were read in,
+    so packets are never copied one by one. A record split between two chunks is completed with the head of the
+    next chunk, so only the bytes of that record are copied.
+    Args:
+        source: path of a capture file, a binary file object, or an iterable of bytes such as
+                requests.Response.iter_content()
+        chunk_size (int): bytes read at a time from a path or file object
+        linktypes (list): Optional, the link type of the capture is appended to it once its header is read, as
+                          well as that of every other interface of a pcapng capture
+    Returns:
+        (generator of Packet): the packets in file order. An empty source yields nothing
+    Raises:
+        PcapError: If the source is not a pcap or pcapng capture, or ends inside a record
+    """
+    if isinstance(source, _TEXT_TYPES):
+        with open(source, 'rb') as file_handler:
+            for packet in iter_packets(file_handler, chunk_size, linktypes):
+                yield packet
+        return
+    if hasattr(source, "read"):
+        source = iter(lambda read=source.read: read(chunk_size), b"")
+
+    parser = None
+    pending = b""
+    for chunk in source:
+        view = memoryview(chunk)
+        while pending and len(view):
+            # Move just enough of the chunk into pending to complete its record
+            wanted = 4 if parser is None else parser.wanted(memoryview(pending))
+            take = wanted - len(pending)
+            pending += view[:take].tobytes()
+            view = view[take:]
+            if len(pending) < wanted:
+                break
+            if parser is None:
+                parser = _parser(pending, linktypes)
+                continue
+            pending_view = memoryview(pending)
+            for packet in parser.parse(pending_view):
+                yield packet
+            pending = pending_view[parser.offset:].tobytes()
+
+        if pending or not len(view):
+            continue
+        if parser is None:
+            if len(view) < 4:
+                pending = view.tobytes()
+                continue
+            parser = _parser(view, linktypes)
+        for packet in parser.parse(view):
+            yield packet
+        # Only the incomplete record at the end of the chunk is kept for the next one
+        pending = view[parser.offset:].tobytes()
+
+    if pending:
+        raise PcapError("Capture ends inside a record")
+
+
+def _parser(data, linktypes=None):
+    if data[:4] == struct.pack("<I", BLOCK_SECTION_HEADER):
+        return _PcapngParser(linktypes)
+    for endian in ("<", ">"):
+        if struct.unpack(endian + "I", data[:4])[0] in (MAGIC_USEC, MAGIC_NSEC):
+            return _PcapParser(linktypes)
+    raise PcapError("Not a pcap or pcapng file")
+
+
+class _PcapParser(object):
+    """Parses the records of a pcap file, one buffer at a time"""
+
+    def __init__(self, linktypes=None):
+        self.header = None
+        self.offset = 0
+        self.linktypes = linktypes
+
+    def parse(self, view):
+        """Yield the complete records in view, then set offset to the end of the last one"""
+        pos = 0
+        end = len(view)
+        if self.header is None:
+            if end < GLOBAL_HEADER_LENGTH:
+                self.offset = 0
+                return
+            self.header = PcapHeader.parse(view[:GLOBAL_HEADER_LENGTH].tobytes())
+            if self.linktypes is not None:
+                self.linktypes.append(self.header.linktype)
+            self._record = struct.Struct(self.header.endian + "IIII")
+            self._scale = 1e-9 if self.header.nanosecond else 1e-6
+            pos = GLOBAL_HEADER_LENGTH
+
+        unpack_from = self._record.unpack_from
+        scale = self._scale
+        while pos + RECORD_HEADER_LENGTH <= end:
+            ts_sec, ts_frac, caplen, origlen = unpack_from(view, pos)
+            if caplen > MAX_RECORD_LENGTH:
+                raise PcapError("Corrupt pcap record of %d bytes" % caplen)
+            start = pos + RECORD_HEADER_LENGTH
+            if start + caplen > end:
+                break
+            yield Packet(ts_sec + ts_frac * scale, caplen, origlen, view[start:start + caplen])
+            pos = start + caplen
+        self.offset = pos
+
+    def wanted(self, view):
+        """Bytes view must hold for the global header or its first record to be complete"""
+        if self.header is None:
+            return GLOBAL_HEADER_LENGTH
+        if len(view) < RECORD_HEADER_LENGTH:
+            return RECORD_HEADER_LENGTH
+        caplen = self._record.unpack_from(view)[2]
+        if caplen > MAX_RECORD_LENGTH:
+            raise PcapError("Corrupt pcap record of %d bytes" % caplen)
+        return RECORD_HEADER_LENGTH + caplen
+
+
+class _PcapngParser(object):
+    """Parses the packet blocks of a pcapng file, one buffer at a time"""
+
+    def __init__(self, linktypes=None):
+        self.endian = "<"
+        self.interfaces = []
+        self.offset = 0
+        self.linktypes = linktypes
+
+    def parse(self, view):
+        """Yield the packets of the complete blocks in view, then set offset to the end of the last one"""
+        pos = 0
+        end = len(view)
+        while pos + 12 <= end:
+            block_type, length = self._block(view, pos)
+            if pos + length > end:
+                break
+
+            if block_type == BLOCK_SECTION_HEADER:
+                self.interfaces = []
+            elif block_type == BLOCK_INTERFACE:
+                self.interfaces.append(self._interface(view, pos, length))
+            elif block_type == BLOCK_ENHANCED_PACKET:
+                interface, high, low, caplen, origlen = struct.unpack_from(self.endian + "IIIII", view, pos + 8)
+                if caplen > length - 32:
+                    raise PcapError("Corrupt pcapng packet of %d bytes in a block of %d" % (caplen, length))
+                yield Packet(((high << 32) | low) * self._scale(interface), caplen, origlen,
+                             view[pos + 28:pos + 28 + caplen])
+            elif block_type == BLOCK_SIMPLE_PACKET:
+                origlen = struct.unpack_from(self.endian + "I", view, pos + 8)[0]
+                caplen = min(origlen, length - 16)
+                if self.interfaces and self.interfaces[0][1]:
+                    caplen = min(caplen, self.interfaces[0][1])
+                yield Packet(None, caplen, origlen, view[pos + 12:pos + 12 + caplen])
+            elif block_type == BLOCK_PACKET:
+                interface, _, high, low, caplen, origlen = struct.unpack_from(self.endian + "HHIIII", view, pos + 8)
+                if caplen > length - 32:
+                    raise PcapError("Corrupt pcapng packet of %d bytes in a block of %d" % (caplen, length))
+                yield Packet(((high << 32) | low) * self._scale(interface), caplen, origlen,
+                             view[pos + 28:pos + 28 + caplen])
+            # Other blocks (name resolution, statistics, ...) carry no packets
+            pos += length
+        self.offset = pos
+
+    def wanted(self, view):
+        """Bytes view must hold for its first block to be complete"""
+        if len(view) < 12:
+            return 12
+        return self._block(view, 0)[1]
+
+    def _block(self, view, pos):
+        """Read the type and total length of the block at pos
+        Returns:
+            (tuple): (block type, length)
+        """
+        if struct.unpack_from("<I", view, pos)[0] == BLOCK_SECTION_HEADER:
+            # Each section sets its own byte order, read from the magic after the block length
+            magic = struct.unpack_from("<I", view, pos + 8)[0]
+            if magic == BYTE_ORDER_MAGIC:
+                self.endian = "<"
+            elif magic == struct.unpack(">I", struct.pack("<I", BYTE_ORDER_MAGIC))[0]:
+                self.endian = ">"
+            else:
+                raise PcapError("Corrupt pcapng section header")
+        block_type, length = struct.unpack_from(self.endian + "II", view, pos)
+        if length < 12 or length % 4 or length > MAX_RECORD_LENGTH:
+            raise PcapError("Corrupt pcapng block of %d bytes" % length)
+        return block_type, length
+
+    def _interface(self, view, pos, length):
+        """Read the timestamp resolution and snap length of an interface description block, and record its link type
+        Returns:
+            (tuple): (seconds per timestamp unit, snaplen)
+        """
+        linktype, _, snaplen = struct.unpack_from(self.endian + "HHI", view, pos + 8)
+        if self.linktypes is not None:
+            self.linktypes.append(linktype)
+        scale = 1e-6
+        option = pos + 16
+        while option + 4 <= pos + length - 4:
+            code, option_length = struct.unpack_from(self.endian + "HH", view, option)
+            if code == 0:
+                break
+            if code == 9 and option_length >= 1:
+                # if_tsresol: a negative power of 10, or of 2 when the high bit is set
+                resolution = view[option + 4]
+                resolution = resolution if isinstance(resolution, int) else ord(resolution)
+                scale = 2.0 ** -(resolution & 0x7f) if resolution & 0x80 else 10.0 ** -resolution
+            option += 4 + (option_length + 3) // 4 * 4
+        return scale, snaplen
+
+    def _scale(self, interface):
+        if interface >= len(self.interfaces):
+            raise PcapError("Packet block for undeclared interface %d" % interface)
+        return self.interfaces[interface][0]
@@ -0,0 +1,293 @@
+"""
+Time index of the pcap files returned by Pcaps.get
+"""
+import bisect
+import mmap
+import numbers
+import os
+import struct
+import sys
+import time
+from array import array
+
+from sentrywire.exceptions import PcapError
+from sentrywire.pcap import GLOBAL_HEADER_LENGTH, RECORD_HEADER_LENGTH, Packet, PcapHeader
+
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"SWPCIDX1"
+# magic, flags, pcap size, pcap mtime, packet count, padded to keep the arrays 8 byte aligned
+INDEX_HEADER = struct.Struct("<8sB7xQdQ")
+FLAG_FILE_ORDER = 1
+
+
+class PcapIndex(object):
+    """
+    Sorted packet timestamps and offsets of a pcap file, kept in a sidecar file next to it
+
+    The sidecar holds two arrays of 64 bit integers: packet timestamps in nanoseconds and the file offsets of their
+    records. Both the sidecar and the pcap are memory mapped, so a time window is found by a binary search over the
+    mapped timestamps and only the records inside it are read. The sidecar is rebuilt when the pcap changes.
+    On python 2 and big endian hosts the arrays are read into memory instead, and on python 2 packets are copied out
+    of the mapped pcap.
+    """
+
+    def __init__(self, pcap_path, index_path=None, rebuild=False):
+        """Open the index of a pcap file, building it if it is missing or stale
+        Args:
+            pcap_path (str): pcap file to index
+            index_path (str): Optional, sidecar file. Defaults to pcap_path + ".idx"
+            rebuild (bool): Optional, build the sidecar again even if it is up to date
+        Raises:
+            PcapError: If pcap_path is not a pcap file or is truncated
+        """
+        self.pcap_path = pcap_path
+        self.index_path = index_path or pcap_path + INDEX_SUFFIX
+        self.header = None
+        self.in_file_order = True
+        self._maps = []
+        self._views = []
+        self._timestamps = ()
+        self._offsets = ()
+        self._pcap = b""
+
+        if rebuild or not self._load():
+            build_index(pcap_path, self.index_path)
+            if not self._load():
+                raise PcapError("Could not read the index of %s" % pcap_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    def close(self):
+        """Unmap the files. Packets returned by iter_packets must not be used afterwards"""
+        for view in (self._timestamps, self._offsets):
+            if isinstance(view, memoryview):
+                view.release()
+        for view in self._views:
+            view.release()
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:
+                # Packets are still referenced by the caller, the map is closed once they are collected
+                pass
+        self._views = []
+        self._maps = []
+        self._timestamps = ()
+        self._offsets = ()
+        self._pcap = b""
+
+    @property
+    def first_time(self):
+        """Seconds since the epoch of the earliest packet, or None if the pcap is empty"""
+        return self._timestamps[0] / 1e9 if len(self) else None
+
+    @property
+    def last_time(self):
+        """Seconds since the epoch of the latest packet, or None if the pcap is empty"""
+        return self._timestamps[-1] / 1e9 if len(self) else None
+
+    def bounds(self, begin_time=None, end_time=None):
+        """Positions in the index of the packets captured from begin_time up to, but not including, end_time
+        Args:
+            begin_time (datetime.datetime or float): Optional, datetime (read as local time) or seconds since the
+                                                     epoch. Defaults to the first packet
+            end_time (datetime.datetime or float): Optional, same as begin_time. Defaults to after the last packet
+        Returns:
+            (tuple): (first, last) with last excluded
+        """
+        first = 0 if begin_time is None else bisect.bisect_left(self._timestamps, _nanoseconds(begin_time))
+        last = len(self) if end_time is None else bisect.bisect_left(self._timestamps, _nanoseconds(end_time))
+        return first, max(first, last)
+
+    def iter_packets(self, begin_time=None, end_time=None):
+        """Read the packets of a time window, in time order
+        Args:
+            begin_time: Optional, see bounds
+            end_time: Optional, see bounds
+        Returns:
+            (generator of sentrywire.pcap.Packet): packets whose data is a memoryview into the mapped pcap (a copy
+                                                   on python 2). Copy it with bytes(packet.data) to keep it past
+                                                   close()
+        """
+        first, last = self.bounds(begin_time, end_time)
+        record = struct.Struct(self.header.endian + "IIII")
+        pcap = self._pcap
+        for position in range(first, last):
+            offset = self._offsets[position]
+            _, _, caplen, origlen = record.unpack_from(pcap, offset)
+            start = offset + RECORD_HEADER_LENGTH
+            yield Packet(self._timestamps[position] / 1e9, caplen, origlen, pcap[start:start + caplen])
+
+    def extract(self, output_path, begin_time=None, end_time=None, chunk_size=1024 * 1024):
+        """Write the packets of a time window to a new pcap file
+        When the pcap is in time order the window is one byte range of it, copied as is.
+        Args:
+            output_path (str): path of the new pcap file
+            begin_time: Optional, see bounds
+            end_time: Optional, see bounds
+            chunk_size (int): bytes copied at a time
+        Returns:
+            (int): number of packets written
+        """
+        first, last = self.bounds(begin_time, end_time)
+        pcap = self._pcap
+        with open(output_path, 'wb+') as output:
+            output.write(pcap[:GLOBAL_HEADER_LENGTH])
+            if first == last:
+                return 0
+            if self.in_file_order:
+                start = self._offsets[first]
+                stop = self._offsets[last] if last < len(self) else len(pcap)
+                for position in range(start, stop, chunk_size):
+                    output.write(pcap[position:min(position + chunk_size, stop)])
+            else:
+                record = struct.Struct(self.header.endian + "IIII")
+                for position in range(first, last):
+                    offset = self._offsets[position]
+                    caplen = record.unpack_from(pcap, offset)[2]
+                    output.write(pcap[offset:offset + RECORD_HEADER_LENGTH + caplen])
+        return last - first
+
+    def _load(self):
+        """Map the sidecar and the pcap
+        Returns:
+            (bool): False if the sidecar is missing, unreadable or older than the pcap
+        """
+        try:
+            stat = os.stat(self.pcap_path)
+            with open(self.index_path, 'rb') as index_file:
+                raw = index_file.read(INDEX_HEADER.size)
+                if len(raw) < INDEX_HEADER.size:
+                    return False
+                magic, flags, size, mtime, count = INDEX_HEADER.unpack(raw)
+                if (magic, size, mtime) != (INDEX_MAGIC, stat.st_size, stat.st_mtime):
+                    return False
+                if os.fstat(index_file.fileno()).st_size != INDEX_HEADER.size + 16 * count:
+                    return False
+                timestamps, offsets = self._map_arrays(index_file, count)
+        except (IOError, OSError, ValueError, struct.error):
+            self.close()
+            return False
+
+        self.in_file_order = bool(flags & FLAG_FILE_ORDER)
+        self._timestamps = timestamps
+        self._offsets = offsets
+        if stat.st_size:
+            with open(self.pcap_path, 'rb') as pcap_file:
+                self._pcap = self._map(pcap_file)
+            self.header = PcapHeader.parse(bytes(self._pcap[:GLOBAL_HEADER_LENGTH]))
+        else:
+            self.header = PcapHeader()
+        return True
+
+    def _map_arrays(self, index_file, count):
+        if not count:
+            return (), ()
+        end = INDEX_HEADER.size + 8 * count
+        if sys.byteorder == "little" and hasattr(memoryview, "cast"):
+            view = self._map(index_file)
+            return view[INDEX_HEADER.size:end].cast("q"), view[end:].cast("q")
+        # The sidecar is little endian and python 2 memoryviews cannot be cast, copies are used instead
+        index_file.seek(INDEX_HEADER.size)
+        values = struct.unpack("<%dq" % (2 * count), index_file.read(16 * count))
+        return values[:count], values[count:]
+
+    def _map(self, file_handler):
+        mapped = mmap.mmap(file_handler.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        try:
+            view = memoryview(mapped)
+        except TypeError:
+            # Python 2 maps have no buffer interface for memoryview, their slices are copies
+            return mapped
+        self._views.append(view)
+        return view
+
+
+def build_index(pcap_path, index_path=None):
+    """Write the time index sidecar of a pcap file
+    Args:
+        pcap_path (str): pcap file to index
+        index_path (str): Optional, sidecar file. Defaults to pcap_path + ".idx"
+    Returns:
+        (int): number of packets indexed
+    Raises:
+        PcapError: If pcap_path is not a pcap file or is truncated
+    """
+    index_path = index_path or pcap_path + INDEX_SUFFIX
+    stat = os.stat(pcap_path)
+    timestamps = _int64s()
+    offsets = _int64s()
+    in_file_order = True
+
+    if stat.st_size:
+        with open(pcap_path, 'rb') as pcap_file:
+            mapped = mmap.mmap(pcap_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header = PcapHeader.parse(mapped[:GLOBAL_HEADER_LENGTH])
+            unpack_from = struct.Struct(header.endian + "IIII").unpack_from
+            scale = 1 if header.nanosecond else 1000
+            size = len(mapped)
+            position = GLOBAL_HEADER_LENGTH
+            previous = -1
+            while position + RECORD_HEADER_LENGTH <= size:
+                ts_sec, ts_frac, caplen, _ = unpack_from(mapped, position)
+                timestamp = ts_sec * 1000000000 + ts_frac * scale
+                if timestamp < previous:
+                    in_file_order = False
+                previous = timestamp
+                timestamps.append(timestamp)
+                offsets.append(position)
+                position += RECORD_HEADER_LENGTH + caplen
+            if position != size:
+                raise PcapError("Truncated pcap record")
+        finally:
+            mapped.close()
+
+    if not in_file_order:
+        # Out of order captures are indexed in time order, ties keep their file order
+        order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+        timestamps = _int64s(timestamps[position] for position in order)
+        offsets = _int64s(offsets[position] for position in order)
+
+    # Write then rename, so readers never map a half written sidecar
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'wb') as index_file:
+        index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, FLAG_FILE_ORDER if in_file_order else 0, stat.st_size,
+                                           stat.st_mtime, len(timestamps)))
+        _write_int64s(index_file, timestamps)
+        _write_int64s(index_file, offsets)
+    getattr(os, "replace", os.rename)(tmp_path, index_path)
+    return len(timestamps)
+
+
+def _int64s(values=()):
+    """Sequence of 64 bit integers, an array where python has the q typecode and a list on python 2"""
+    try:
+        return array("q", values)
+    except ValueError:
+        return list(values)
+
+
+def _write_int64s(file_handler, values):
+    """Write 64 bit integers little endian, as the sidecar stores them"""
+    if not isinstance(values, array):
+        file_handler.write(struct.pack("<%dq" % len(values), *values))
+        return
+    if sys.byteorder != "little":
+        values.byteswap()
+    values.tofile(file_handler)
+
+
+def _nanoseconds(value):
+    """Nanoseconds since the epoch of a datetime (read as local time) or of a number of seconds"""
+    if isinstance(value, numbers.Real):
+        return int(round(value * 1e9))
+    return int(time.mktime(value.timetuple())) * 1000000000 + value.microsecond * 1000
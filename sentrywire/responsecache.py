@@ -0,0 +1,128 @@
+"""
+In-process cache of the answers to read-mostly GET requests
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import sentrywire.const
+
+# What is kept of an answer that is not json, a new response is built from it for every hit
+_StoredResponse = namedtuple("_StoredResponse", ("status_code", "headers", "content", "encoding", "url"))
+
+
+class ResponseCache(object):
+    """
+    Time limited, size bounded cache of GET answers by endpoint
+
+    Any POST, PUT or DELETE sent through the client drops the cached answers of its path and of the paths listed for
+    it in dependents, so a client always reads its own writes. Changes made by other clients or on the unit itself
+    are only seen once the TTL of the endpoint has run out.
+    """
+
+    def __init__(self, ttls=None, max_entries=sentrywire.const.CACHE_MAX_ENTRIES, dependents=None):
+        """Response cache
+        Args:
+            ttls (dict): Optional, seconds to keep the answers of each path e.g. {"/fmping": 5}.
+                         Defaults to sentrywire.const.CACHE_TTLS, paths not listed are not cached
+            max_entries (int): answers kept, the least recently used are dropped first
+            dependents (dict): Optional, cached paths to drop when a path is written to.
+                               Defaults to sentrywire.const.CACHE_DEPENDENTS
+        """
+        self.ttls = dict(sentrywire.const.CACHE_TTLS if ttls is None else ttls)
+        self.max_entries = max_entries
+        self.dependents = dict(sentrywire.const.CACHE_DEPENDENTS if dependents is None else dependents)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generations = {}
+
+    def ttl(self, path):
+        """Seconds the answers of path are kept, or None if they are not cached"""
+        return self.ttls.get(path)
+
+    def generation(self, path):
+        """Counter bumped by every invalidation of path, pass it to put"""
+        with self._lock:
+            return self._generations.get(path, 0)
+
+    def get(self, key):
+        """Look up an answer
+        Returns:
+            (bool, object): whether the answer was found, and a copy of it. Answers that are not json are returned
+                            as a new requests.Response with the body already read
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                return False, None
+            # Reinsert to mark it most recently used
+            del self._entries[key]
+            self._entries[key] = entry
+        if isinstance(value, _StoredResponse):
+            return True, _response(value)
+        return True, _copy(value)
+
+    def put(self, key, path, value, generation):
+        """Store an answer of path
+        The answer is dropped if path was invalidated since generation was read, since it may predate the write
+        """
+        ttl = self.ttls.get(path)
+        if ttl is None:
+            return
+        with self._lock:
+            if self._generations.get(path, 0) != generation:
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + ttl, _stored(value))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path):
+        """Drop the answers of path and of its dependents"""
+        paths = set((path,) + tuple(self.dependents.get(path, ())))
+        with self._lock:
+            for changed in paths:
+                self._generations[changed] = self._generations.get(changed, 0) + 1
+            for key in [key for key in self._entries if key[0] in paths]:
+                del self._entries[key]
+
+    def clear(self):
+        """Drop every answer"""
+        with self._lock:
+            self._entries.clear()
+
+
+def _copy(value):
+    """Callers get their own copy of json answers, so changing one does not change the cache"""
+    if isinstance(value, (dict, list)):
+        return copy.deepcopy(value)
+    return value
+
+
+def _stored(value):
+    """Cached form of an answer, a response is kept as its read body since its stream can only be consumed once"""
+    import requests
+
+    if isinstance(value, requests.Response):
+        return _StoredResponse(value.status_code, dict(value.headers), value.content, value.encoding, value.url)
+    return _copy(value)
+
+
+def _response(stored):
+    """A new response with the status, headers and body of a stored one"""
+    import requests
+    from requests.structures import CaseInsensitiveDict
+
+    response = requests.Response()
+    response.status_code = stored.status_code
+    response.headers = CaseInsensitiveDict(stored.headers)
+    response.encoding = stored.encoding
+    response.url = stored.url
+    response._content = stored.content
+    response._content_consumed = True
+    return response
@@ -0,0 +1,175 @@
+"""
+Retry policies for Sentrywire.http_request
+"""
+import random
+import threading
+import time
+
+IDEMPOTENT_METHODS = ("get", "head", "options", "put", "delete")
+TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RetryBudget(object):
+    """
+    Limits retries to a fraction of the requests sent by everything sharing the budget
+
+    Every request adds `ratio` of a token and every retry spends a whole one, with a trickle of `min_per_second`
+    tokens so a quiet client can still retry. When the unit is overloaded, retries stop at the budget instead of
+    multiplying the load.
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=1.0, max_tokens=100.0):
+        """Retry budget
+        Args:
+            ratio (float): retries allowed per request sent
+            min_per_second (float): retries allowed per second regardless of traffic
+            max_tokens (float): upper bound on saved up retries
+        """
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.time()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self):
+        """Record a request"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        """Take a retry from the budget
+        Returns:
+            (bool): False if the budget is spent
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RetryPolicy(object):
+    """
+    Decides whether and when a failed request is sent again
+
+    Requests are only retried when repeating them is safe: idempotent methods on any transient status or
+    connection error, and other methods (e.g. POST) only on statuses in non_idempotent_statuses, which the unit
+    sends before doing any work. Waits use full jitter, random between 0 and the exponential backoff, so clients
+    that failed together do not retry together. A Retry-After header from the unit replaces the backoff.
+    """
+
+    def __init__(self,
+                 max_retries=10,
+                 statuses=TRANSIENT_STATUSES,
+                 methods=IDEMPOTENT_METHODS,
+                 non_idempotent_statuses=(429,),
+                 retry_connection_errors=True,
+                 backoff_base=0.1,
+                 backoff_max=30.0,
+                 jitter=True,
+                 respect_retry_after=True,
+                 max_elapsed=None,
+                 budget=None):
+        """Retry policy
+        Args:
+            max_retries (int): retries per request, -1 to retry forever
+            statuses (tuple of int): HTTP statuses worth retrying
+            methods (tuple of str): lower case HTTP methods that are safe to repeat
+            non_idempotent_statuses (tuple of int): statuses on which every other method is also retried
+            retry_connection_errors (bool): retry idempotent methods when the connection fails or times out
+            backoff_base (float): seconds of the first backoff, doubled after each retry
+            backoff_max (float): upper bound in seconds for a single wait
+            jitter (bool): wait a random time between 0 and the backoff
+            respect_retry_after (bool): wait for the Retry-After header when the unit sends one
+            max_elapsed (float): Optional, seconds after which a request is not retried anymore
+            budget (RetryBudget): Optional, budget shared by every request using this policy
+        """
+        self.max_retries = max_retries
+        self.statuses = tuple(statuses)
+        self.methods = tuple(method.lower() for method in methods)
+        self.non_idempotent_statuses = tuple(non_idempotent_statuses)
+        self.retry_connection_errors = retry_connection_errors
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.respect_retry_after = respect_retry_after
+        self.max_elapsed = max_elapsed
+        self.budget = budget
+
+    def retryable(self, verb, status=None, connection_error=False):
+        """Whether a failure is worth retrying, ignoring retry counts and budgets"""
+        idempotent = verb.lower() in self.methods
+        if connection_error:
+            return self.retry_connection_errors and idempotent
+        if status not in self.statuses:
+            return False
+        return idempotent or status in self.non_idempotent_statuses
+
+    def backoff(self, attempt):
+        """Seconds to wait before retry number attempt + 1"""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def on_request(self):
+        """Called once for every new request, before any retry"""
+        if self.budget is not None:
+            self.budget.deposit()
+
+    def next_wait(self, verb, attempt, elapsed, status=None, retry_after=None, connection_error=False,
+                  max_retries=None):
+        """Decide on a retry
+        Args:
+            verb (str): HTTP method of the request
+            attempt (int): retries already made for this request
+            elapsed (float): seconds since the request was first sent
+            status (int): HTTP status of the failed attempt, if there was a response
+            retry_after (str): Retry-After header of the failed attempt, if any
+            connection_error (bool): the attempt failed without a response
+            max_retries (int): Optional, overrides the max_retries of the policy for this request
+        Returns:
+            (float): seconds to wait before retrying, or None to give up
+        """
+        if not self.retryable(verb, status, connection_error):
+            return None
+        max_retries = self.max_retries if max_retries is None else max_retries
+        if max_retries != -1 and attempt >= max_retries:
+            return None
+
+        wait_time = None
+        if retry_after and self.respect_retry_after:
+            wait_time = parse_retry_after(retry_after)
+        if wait_time is None:
+            wait_time = self.backoff(attempt)
+
+        if self.max_elapsed is not None and elapsed + wait_time > self.max_elapsed:
+            return None
+        if self.budget is not None and not self.budget.withdraw():
+            return None
+        return wait_time
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header, given either in seconds or as an HTTP date
+    Returns:
+        (float): seconds, or None if the header can not be read
+    """
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    import email.utils
+
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(parsed) - time.time())
@@ -0,0 +1,54 @@
+"""
+Collapses identical concurrent calls into one
+"""
+import copy
+import threading
+
+
+class SingleFlight(object):
+    """
+    Runs one call per key at a time, callers asking for a key already in flight wait for its result
+
+    Once the call returns the key is released, so later callers run a fresh call. This is not a cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function, *args, **kwargs):
+        """Run function, or wait for the call already running for key
+        Args:
+            key: hashable identity of the call
+            function (callable): called with args and kwargs when no call for key is running
+        Returns:
+            The result of the call. Callers that waited get a deep copy of dicts and lists, so one caller changing
+            the result does not change it for the others
+        Raises:
+            The exception raised by the call, in every caller
+        """
+        from concurrent.futures import Future
+
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            result = future.result()
+            if isinstance(result, (dict, list)):
+                result = copy.deepcopy(result)
+            return result
+
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
@@ -0,0 +1,103 @@
+"""
+Rest tokens shared between processes through a file
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import sentrywire.const
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class TokenStore(object):
+    """
+    File of rest tokens by unit, so short lived scripts reuse a token instead of logging in on every run
+
+    Reads and writes hold an exclusive lock on a side file, and the store is replaced in one rename, so processes
+    sharing it never see a partial write. The file holds live credentials and is created readable by its owner only.
+    """
+
+    def __init__(self, path=None, max_age=sentrywire.const.TOKEN_MAX_AGE):
+        """Token store
+        Args:
+            path (str): Optional, file holding the tokens. Defaults to ~/.sentrywire_tokens
+            max_age (float): seconds after which a saved token is not reused anymore
+        """
+        self.path = path or os.path.join(os.path.expanduser("~"), ".sentrywire_tokens")
+        self.max_age = max_age
+
+    def get(self, key, username=None):
+        """Saved token for a unit
+        Args:
+            key (str): unit the token was saved for, the client uses its api_url
+            username (str): Optional, only return a token saved by this user
+        Returns:
+            (str): the token, or None if there is no token younger than max_age
+        """
+        with self._locked():
+            entry = self._load().get(key)
+        if not entry or time.time() - entry.get("saved", 0) > self.max_age:
+            return None
+        if username is not None and entry.get("username") != username:
+            return None
+        return entry.get("rest_token")
+
+    def put(self, key, rest_token, username=None):
+        """Save the token of a unit"""
+        with self._locked():
+            tokens = self._load()
+            tokens[key] = {"rest_token": rest_token, "username": username, "saved": time.time()}
+            self._save(tokens)
+
+    def discard(self, key, rest_token=None):
+        """Forget the token of a unit
+        Args:
+            rest_token (str): Optional, only forget the saved token if it is this one
+        """
+        with self._locked():
+            tokens = self._load()
+            entry = tokens.get(key)
+            if entry is None or (rest_token is not None and entry.get("rest_token") != rest_token):
+                return
+            del tokens[key]
+            self._save(tokens)
+
+    def _load(self):
+        try:
+            with open(self.path) as token_file:
+                return json.load(token_file)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _save(self, tokens):
+        tmp_path = self.path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as token_file:
+            json.dump(tokens, token_file)
+        getattr(os, "replace", os.rename)(tmp_path, self.path)
+
+    @contextmanager
+    def _locked(self):
+        """Hold an exclusive lock shared by every process using the same path"""
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
@@ -1,8 +1,49 @@
-from .authentication import *
-from .search import *
-from .server import *
-from .federation import *
-from .idsrules import *
-from .activetriggers import *
-from .precapturefilter import *
-from .authorization import *
+import sys as _sys
+
+# Public names of each module. On Python 3.7+ a module is only imported when one of its names is first used
+_exports = {
+    "authentication": ("Authentication",),
+    "search": ("Search", "Objects", "Pcaps", "Logs"),
+    "watcher": ("SearchWatcher",),
+    "sharded": ("ShardedSearch", "split_window"),
+    "index": ("SearchIndex",),
+    "resultcache": ("ResultCache", "query_key"),
+    "incremental": ("IncrementalSearch",),
+    "server": ("Server", "Capture"),
+    "federation": ("Federation", "Policy", "Nodes", "Groups"),
+    "fanout": ("FanoutSearch",),
+    "idsrules": ("IDSRules",),
+    "activetriggers": ("ActiveTriggers",),
+    "precapturefilter": ("PrecaptureFilter",),
+    "authorization": ("Authorization", "Roles"),
+}
+_modules = dict((name, module) for module, names in _exports.items() for name in names)
+__all__ = sorted(_modules)
+
+if _sys.version_info >= (3, 7):
+    import importlib as _importlib
+
+    def __getattr__(name):
+        if name not in _modules:
+            raise AttributeError("module %r has no attribute %r" % (__name__, name))
+        value = getattr(_importlib.import_module("." + _modules[name], __name__), name)
+        globals()[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(globals()) | set(__all__))
+else:
+    from .authentication import *
+    from .search import *
+    from .watcher import *
+    from .sharded import *
+    from .index import *
+    from .resultcache import *
+    from .incremental import *
+    from .server import *
+    from .federation import *
+    from .fanout import *
+    from .idsrules import *
+    from .activetriggers import *
+    from .precapturefilter import *
+    from .authorization import *
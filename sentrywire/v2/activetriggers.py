@@ -72,6 +72,11 @@ class ActiveTriggers(EndpointHandler):
         params = {"rest_token": self.sw.rest_token,
                   "trigger_name": trigger_name}
         list_of_triggers = self.sw.http_get(self.path, params=params)
-        if not isinstance(list_of_triggers, list):
-            list_of_triggers = [list_of_triggers]
-        return list_of_triggers
+        return _as_list(list_of_triggers)
+
+
+def _as_list(list_of_triggers):
+    """The unit answers with the trigger itself when there is only one"""
+    if not isinstance(list_of_triggers, list):
+        list_of_triggers = [list_of_triggers]
+    return list_of_triggers
@@ -10,6 +10,7 @@ class Authentication(EndpointHandler):
 
     def login(self, username, password):
         """Create new rest token for current client
+        If the client has a token store holding a token of this user, that token is reused instead
         Args:
             username (str): Username for Sentrywire system
             password (str): Password for username in Sentrywire system
@@ -18,9 +19,17 @@ class Authentication(EndpointHandler):
         """
         post_data = {"username": username,
                      "password": password}
-        json = self.sw.http_post(self.path, post_data=post_data).json()
-        self.sw.rest_token = json["rest_token"]
-        return self.sw.rest_token
+        token_store = self.sw.token_store
+        # Hold the token lock so concurrent logins do not race each other
+        with self.sw._token_lock:
+            self.sw._credentials = (username, password)
+            rest_token = token_store.get(self.sw.api_url, username) if token_store is not None else None
+            if rest_token is None:
+                rest_token = self.sw.http_post(self.path, post_data=post_data).json()["rest_token"]
+                if token_store is not None:
+                    token_store.put(self.sw.api_url, rest_token, username)
+            self.sw.rest_token = rest_token
+            return rest_token
 
     def logout(self, rest_token=None):
         """Invalidate current rest_token
@@ -32,6 +41,10 @@ class Authentication(EndpointHandler):
             raise SentrywireException("No rest token to invalidate")
 
         params = {"rest_token": rest_token}
-        response = self.sw.http_put(self.path, params=params)
-        self.sw.rest_token = None
+        response = self.sw.http_put(self.path, params=params, relogin=False)
+        # Keep the token if another thread logged in again meanwhile
+        if self.sw._swap_token(rest_token, None):
+            self.sw._credentials = None
+        if self.sw.token_store is not None:
+            self.sw.token_store.discard(self.sw.api_url, rest_token)
         return response
@@ -1,4 +1,5 @@
 from sentrywire.base import EndpointHandler
+from sentrywire.lazy import LazyHandler
 
 
 class Roles(EndpointHandler):
@@ -83,8 +84,10 @@ class Roles(EndpointHandler):
 class Authorization(EndpointHandler):
     path = "/authorization"
 
+    # Created on first use
+    roles = LazyHandler("roles", "sentrywire.v2.authorization", "Roles")
+
     def __init__(self, sw):
         """Authorization handler
         """
-        self.roles = Roles(sw)
         super(Authorization, self).__init__(sw, self.path)
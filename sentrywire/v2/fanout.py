@@ -0,0 +1,96 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import sentrywire.const
+import sentrywire.pcap
+from sentrywire.base import SentrywireHandler
+from sentrywire.exceptions import NotFound
+
+
+class FanoutSearch(SentrywireHandler):
+    """
+    Runs one search on every node of a federation
+
+    The search is tracked by the shared poll loop of Search.watch, then every node is downloaded on its own thread,
+    so the total download time follows the slowest node instead of the sum of all nodes.
+    """
+
+    def __init__(self, sw):
+        """Federation fan-out search handler
+        """
+        super(FanoutSearch, self).__init__(sw)
+
+    def nodes(self):
+        """List the nodes of the federation
+        Returns:
+            (list of str): node names from the FMNodes of Server.status
+        """
+        status = self.sw.server.status()
+        return [node["nodename"] for node in status.get("FMNodes") or [] if node.get("nodename")]
+
+    def run(self, search_name, begin_time, end_time, dest_dir, search_filter=None, max_packets=1000, nodes=None,
+            timeout=None, workers=sentrywire.const.PCAP_WORKERS, merged_path=None, dedupe=False):
+        """Submit a search and collect its pcaps from every node
+        Args:
+            search_name (str): name of the search
+            begin_time (datetime.datetime): Search for packets after begin_time
+            end_time (datetime.datetime): Search for packets before end_time
+            dest_dir (str): directory to download to, each node gets its own sub directory
+            search_filter (str): Optional, see Search.create
+            max_packets (int): maximum number of packets to include in results
+            nodes (list of str): Optional, nodes to collect from. Defaults to every node in nodes()
+            timeout (float): Optional, seconds to wait for the search to complete before giving up on every node
+            workers (int): chunks downloaded at the same time per node
+            merged_path (str): Optional, also merge the pcaps of every node into this file in time order,
+                               see sentrywire.pcap.merge
+            dedupe (bool): Optional, drop packets found on more than one node from the merged file
+        Returns:
+            (dict): node name to the result for that node. A node that failed has its exception in "error"
+            Example
+            {
+                "sw152": {
+                    "search": "continuum_1635109402_72_hunt",
+                    "status": {...},
+                    "files": ["/tmp/hunt/sw152/continuum_1635109402_72_hunt_0.pcap"],
+                    "error": None
+                },
+                ...
+            }
+        """
+        search_token = self.sw.searches.create(search_name, begin_time, end_time, search_filter=search_filter,
+                                               max_packets=max_packets)["searchname"]
+        if nodes is None:
+            nodes = self.nodes()
+        completed = self.sw.searches.watch(search_token, timeout=timeout)
+
+        def collect(node):
+            result = {"search": search_token, "status": None, "files": [], "error": None}
+            try:
+                result["status"] = self._record(completed.result(), node, search_token)
+                try:
+                    paths = self.sw.searches.pcaps.get_all(node, search_token, os.path.join(dest_dir, node),
+                                                           workers=workers)
+                    result["files"] = list(paths.values())
+                except NotFound:
+                    # The node had no packets matching the search
+                    pass
+            except Exception as e:
+                result["error"] = e
+            return node, result
+
+        results = {}
+        if nodes:
+            with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+                results = dict(executor.map(collect, nodes))
+        if merged_path is not None:
+            sentrywire.pcap.merge([path for node in nodes for path in results[node]["files"]], merged_path,
+                                  dedupe=dedupe, chunk_size=self.sw.chunk_size)
+        return results
+
+    @staticmethod
+    def _record(records, node_name, search_token):
+        """Pick the completed search record of one node"""
+        for record in records:
+            if record.get("NodeName") == node_name:
+                return record
+        raise NotFound("Search %s did not complete on %s" % (search_token, node_name))
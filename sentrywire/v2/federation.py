@@ -1,4 +1,5 @@
 from sentrywire.base import EndpointHandler
+from sentrywire.lazy import LazyHandler
 
 
 class Policy(EndpointHandler):
@@ -10,7 +11,7 @@ class Policy(EndpointHandler):
         super(Policy, self).__init__(sw, self.path)
 
     def export(self):
-        """This is a HTTP POST request to the server’s /v2/exportpolicy endpoint to save FM policy info such as list
+        """This is a HTTP POST request to the server's /v2/exportpolicy endpoint to save FM policy info such as list
 of users, groups, nodes. This can be forwarded to federated nodes so that any such node is ready to be
 designated HA node.
 
@@ -144,10 +145,13 @@ class Federation(EndpointHandler):
     """
     path = "/"
 
+    # Sub-handlers are created on first use
+    groups = LazyHandler("groups", "sentrywire.v2.federation", "Groups")
+    nodes = LazyHandler("nodes", "sentrywire.v2.federation", "Nodes")
+    policies = LazyHandler("policies", "sentrywire.v2.federation", "Policy")
+    fanout = LazyHandler("fanout", "sentrywire.v2.fanout", "FanoutSearch")
+
     def __init__(self, sw):
         """Federation function handler
         """
-        self.groups = Groups(sw)
-        self.nodes = Nodes(sw)
-        self.policies = Policy(sw)
         super(Federation, self).__init__(sw, self.path)
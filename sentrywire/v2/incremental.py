@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import sentrywire.const
+from sentrywire.base import SentrywireHandler
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+STATE = "state.json"
+
+
+class IncrementalSearch(SentrywireHandler):
+    """
+    Keeps a rolling local copy of the packets matching a filter over a trailing window
+
+    Each update only searches the time since the previous update for the same filter, and stores that slice as its
+    own pcap. Slices that fall out of the window are deleted, so the store always covers the last `window` of time.
+    """
+
+    def __init__(self, sw, directory, window=timedelta(hours=1), capture_lag=sentrywire.const.INCREMENTAL_CAPTURE_LAG):
+        """Incremental search handler
+        Args:
+            directory (str): directory holding one store per filter, created if it does not exist
+            window (datetime.timedelta): trailing time span kept in each store
+            capture_lag (float): seconds behind now that updates stop at. Packets of the last seconds may not be
+                                 searchable yet, so a window reaching now would be recorded as covered without them
+        """
+        super(IncrementalSearch, self).__init__(sw)
+        self.directory = directory
+        self.window = window
+        self.capture_lag = timedelta(seconds=capture_lag)
+        self._lock = threading.Lock()
+        self._store_locks = {}
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def update(self, search_filter, max_packets=1000, node_name=None, end_time=None, search_name=None, timeout=None):
+        """Search the time since the last update of this filter and add it to its store
+        The slice search is deleted from the unit once its pcap is downloaded.
+        Args:
+            search_filter (str): see Search.create
+            max_packets (int): maximum number of packets to include in the new slice
+            node_name (str): Optional, node to download from. Defaults to every node the search completed on
+            end_time (datetime.datetime): Optional, end of the covered time, at most now minus capture_lag.
+                                          Defaults to now minus capture_lag
+            search_name (str): Optional, name of the slice search. Defaults to "incremental"
+            timeout (float): Optional, seconds to wait for the slice search to complete
+        Returns:
+            (list of str): pcap files of the slices now in the window, oldest first
+        """
+        latest = datetime.now() - self.capture_lag
+        end_time = min(end_time or latest, latest).replace(microsecond=0)
+        store = self._store(search_filter, max_packets, node_name)
+
+        with self._store_lock(store):
+            state = self._load(store)
+            begin_time = end_time - self.window
+            if state["covered_until"]:
+                # Search windows include their end second, the previous slice already has covered_until
+                begin_time = max(begin_time,
+                                 datetime.strptime(state["covered_until"], TIME_FORMAT) + timedelta(seconds=1))
+
+            if begin_time <= end_time:
+                search_token = self.sw.searches.create(search_name or "incremental", begin_time, end_time,
+                                                       search_filter=search_filter,
+                                                       max_packets=max_packets)["searchname"]
+                file_name = "%s_%s.pcap" % (begin_time.strftime("%Y%m%d%H%M%S"), end_time.strftime("%Y%m%d%H%M%S"))
+                try:
+                    self.sw.searches.sharded.get([search_token], os.path.join(store, file_name), node_name=node_name,
+                                                 timeout=timeout)
+                finally:
+                    self.sw.searches.delete(search_token)
+                state["slices"].append({"begin_time": begin_time.strftime(TIME_FORMAT),
+                                        "end_time": end_time.strftime(TIME_FORMAT),
+                                        "file": file_name})
+                state["covered_until"] = end_time.strftime(TIME_FORMAT)
+
+            self._expire(store, state, end_time - self.window)
+            self._save(store, state)
+            return [os.path.join(store, item["file"]) for item in state["slices"]]
+
+    def files(self, search_filter, max_packets=1000, node_name=None):
+        """List the pcap files of the slices currently stored for a filter, oldest first"""
+        store = self._store(search_filter, max_packets, node_name)
+        with self._store_lock(store):
+            state = self._load(store)
+        return [os.path.join(store, item["file"]) for item in state["slices"]]
+
+    def reset(self, search_filter, max_packets=1000, node_name=None):
+        """Drop the store of a filter, the next update searches the whole window again"""
+        store = self._store(search_filter, max_packets, node_name)
+        with self._store_lock(store):
+            state = self._load(store)
+            self._expire(store, state, datetime.max)
+            state["covered_until"] = None
+            self._save(store, state)
+
+    def _store_lock(self, store):
+        """Updates of different filters run in parallel, updates of the same filter one at a time"""
+        with self._lock:
+            return self._store_locks.setdefault(store, threading.Lock())
+
+    def _store(self, search_filter, max_packets, node_name):
+        key = json.dumps({"search_filter": " ".join((search_filter or "").split()),
+                          "max_packets": int(max_packets),
+                          "node_name": node_name}, sort_keys=True)
+        store = os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest())
+        if not os.path.isdir(store):
+            os.makedirs(store)
+        return store
+
+    @staticmethod
+    def _load(store):
+        try:
+            with open(os.path.join(store, STATE)) as state_file:
+                return json.load(state_file)
+        except (IOError, OSError, ValueError):
+            return {"covered_until": None, "slices": []}
+
+    @staticmethod
+    def _save(store, state):
+        # Write then rename, so a crash never leaves a half written state behind
+        tmp_path = os.path.join(store, STATE + ".tmp")
+        with open(tmp_path, "w") as state_file:
+            json.dump(state, state_file)
+        getattr(os, "replace", os.rename)(tmp_path, os.path.join(store, STATE))
+
+    @staticmethod
+    def _expire(store, state, oldest):
+        """Delete slices that ended before oldest"""
+        kept = []
+        for item in state["slices"]:
+            if datetime.strptime(item["end_time"], TIME_FORMAT) <= oldest:
+                try:
+                    os.remove(os.path.join(store, item["file"]))
+                except OSError:
+                    pass
+            else:
+                kept.append(item)
+        state["slices"] = kept
@@ -0,0 +1,259 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from sentrywire.base import SentrywireHandler
+from sentrywire.exceptions import NotFound
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    search_key TEXT PRIMARY KEY,
+    search_name TEXT NOT NULL,
+    node_name TEXT,
+    submitted REAL,
+    begin_time TEXT,
+    end_time TEXT,
+    search_filter TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS searches_name ON searches (search_name);
+CREATE INDEX IF NOT EXISTS searches_node ON searches (node_name);
+CREATE INDEX IF NOT EXISTS searches_submitted ON searches (submitted);
+CREATE INDEX IF NOT EXISTS searches_window ON searches (begin_time, end_time);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _submitted_seconds(record):
+    """SubmittedTime is sent in seconds by some units and milliseconds by others"""
+    try:
+        submitted = float(record.get("SubmittedTime"))
+    except (TypeError, ValueError):
+        return None
+    if submitted > 1e11:
+        submitted /= 1000.0
+    return submitted
+
+
+class SearchIndex(SentrywireHandler):
+    """
+    Local SQLite index of the completed searches of a unit
+
+    sync() only pulls the searches submitted after the newest one already indexed, by asking for a growing number
+    of the most recent completed searches instead of the whole list. Lookups are answered from the local database.
+    """
+
+    def __init__(self, sw, path, page_size=100):
+        """Completed search index
+        Args:
+            path (str): SQLite database file, created if it does not exist. Use one file per unit
+            page_size (int): completed searches requested by the first round of an incremental sync
+        """
+        super(SearchIndex, self).__init__(sw)
+        self.path = path
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.create_function("REGEXP", 2, _regexp)
+        self._db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @property
+    def high_water(self):
+        """SubmittedTime in seconds from which the next sync looks for new searches, or None if nothing has been synced
+        This is the newest indexed search, or the oldest search that was still pending during the last sync"""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM sync_state WHERE key = 'high_water'").fetchone()
+        return float(row[0]) if row else None
+
+    def sync(self, full=False):
+        """Add newly completed searches to the index
+        A search that was still pending during a sync is looked for again by the following syncs until it completes,
+        even when searches submitted after it completed first. The high water mark is also held at the oldest
+        SubmittedTime of those searches when the unit reports it.
+        Args:
+            full (bool): Optional, fetch the whole completed list and drop searches no longer on the unit
+        Returns:
+            (int): number of searches added or updated
+        """
+        # Read before the completed list, so a search finishing in between is in one of the two
+        pending = self._pending()
+        high_water = None if full else self.high_water
+        if high_water is None:
+            records = self.sw.searches.completed() or []
+            return self._store(records, pending, replace=True)
+
+        # Searches pending at the last sync that have finished since, whatever their SubmittedTime
+        waiting = set(self._state("pending") or []) - set(record.get("SearchName") for record in pending)
+        waiting -= self._indexed(waiting)
+
+        count = self.page_size
+        while True:
+            records = self.sw.searches.completed(count=count) or []
+            if len(records) < count:
+                # Got everything the unit has
+                break
+            submitted = [_submitted_seconds(record) for record in records]
+            if None in submitted or submitted[0] < submitted[-1]:
+                # Not newest first, so a partial list can not be trusted to hold every new search
+                records = self.sw.searches.completed() or []
+                break
+            if submitted[-1] <= high_water and waiting <= set(record.get("SearchName") for record in records):
+                # The page reaches back to searches that are already indexed
+                break
+            count *= 2
+
+        records = [record for record in records
+                   if (_submitted_seconds(record) or 0) >= high_water or record.get("SearchName") in waiting]
+        return self._store(records, pending)
+
+    def _pending(self):
+        try:
+            pending = self.sw.searches.pending()
+        except NotFound:
+            return []
+        return [record for record in pending if isinstance(record, dict)] if isinstance(pending, list) else []
+
+    def _state(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _indexed(self, names):
+        if not names:
+            return set()
+        with self._lock:
+            rows = self._db.execute("SELECT search_name FROM searches WHERE search_name IN (%s)" %
+                                    ", ".join("?" * len(names)), list(names)).fetchall()
+        return set(row[0] for row in rows)
+
+    def _store(self, records, pending, replace=False):
+        rows = []
+        for record in records:
+            name = record.get("SearchName")
+            if not name:
+                continue
+            node = record.get("NodeName")
+            rows.append((record.get("SearchKey") or "%s%s" % (name, node or ""), name, node,
+                         _submitted_seconds(record), record.get("Begintime"), record.get("Endtime"),
+                         record.get("SearchFilter"), json.dumps(record)))
+        pending_times = [_submitted_seconds(record) for record in pending]
+        pending_times = [submitted for submitted in pending_times if submitted is not None]
+
+        with self._lock:
+            with self._db:
+                if replace:
+                    self._db.execute("DELETE FROM searches")
+                self._db.executemany("INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                high_water = self._db.execute("SELECT MAX(submitted) FROM searches").fetchone()[0]
+                if high_water is not None and pending_times:
+                    # Not past a search that can still complete
+                    high_water = min(high_water, min(pending_times))
+                if high_water is not None:
+                    self._db.execute("INSERT OR REPLACE INTO sync_state VALUES ('high_water', ?)", (str(high_water),))
+                self._db.execute("INSERT OR REPLACE INTO sync_state VALUES ('pending', ?)",
+                                 (json.dumps(sorted(set(record.get("SearchName") for record in pending
+                                                        if record.get("SearchName")))),))
+        return len(rows)
+
+    def find(self, pattern=None, node_name=None, begin_time=None, end_time=None, search_filter=None,
+             submitted_after=None, submitted_before=None, limit=None):
+        """Query the index
+        Args:
+            pattern (str): Optional, regex matched against the search name e.g. ".*continuum.*"
+            node_name (str): Optional, only searches from this node
+            begin_time (datetime.datetime): Optional, only searches whose window ends after begin_time
+            end_time (datetime.datetime): Optional, only searches whose window starts before end_time
+            search_filter (str): Optional, only searches whose filter contains this text
+            submitted_after (datetime.datetime or float): Optional, only searches submitted after this time
+            submitted_before (datetime.datetime or float): Optional, only searches submitted before this time
+            limit (int): Optional, maximum number of searches returned
+        Returns:
+            (list of dict): completed search records as returned by Search.completed, newest first
+        """
+        clauses = []
+        args = []
+        if pattern is not None:
+            clauses.append("search_name REGEXP ?")
+            args.append(pattern)
+        if node_name is not None:
+            clauses.append("node_name = ?")
+            args.append(node_name)
+        if begin_time is not None:
+            clauses.append("end_time >= ?")
+            args.append(begin_time.strftime(TIME_FORMAT))
+        if end_time is not None:
+            clauses.append("begin_time <= ?")
+            args.append(end_time.strftime(TIME_FORMAT))
+        if search_filter is not None:
+            clauses.append("instr(search_filter, ?) > 0")
+            args.append(search_filter)
+        if submitted_after is not None:
+            clauses.append("submitted >= ?")
+            args.append(_timestamp(submitted_after))
+        if submitted_before is not None:
+            clauses.append("submitted <= ?")
+            args.append(_timestamp(submitted_before))
+
+        query = "SELECT record FROM searches"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY submitted DESC"
+        if limit is not None:
+            query += " LIMIT %d" % int(limit)
+
+        with self._lock:
+            rows = self._db.execute(query, args).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def delete(self, search_name):
+        """Delete a search from the unit and from the index
+        Returns:
+            (Dict): response of Search.delete
+        """
+        response = self.sw.searches.delete(search_name)
+        self.forget(search_name)
+        return response
+
+    def forget(self, search_name):
+        """Remove a search from the index only"""
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM searches WHERE search_name = ?", (search_name,))
+
+
+def _regexp(pattern, value):
+    return value is not None and _compile(pattern).search(value) is not None
+
+
+_patterns = {}
+
+
+def _compile(pattern):
+    compiled = _patterns.get(pattern)
+    if compiled is None:
+        compiled = _patterns[pattern] = re.compile(pattern)
+    return compiled
+
+
+def _timestamp(value):
+    """Seconds since the epoch of a datetime (read as local time) or of a number of seconds"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return time.mktime(value.timetuple()) + value.microsecond / 1e6
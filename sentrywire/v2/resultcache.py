@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+import sentrywire.const
+from sentrywire.base import SentrywireHandler
+from sentrywire.exceptions import NotFound
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+MANIFEST = "manifest.json"
+# Prefix of the directories results are downloaded to before they are renamed into the cache
+WORK_PREFIX = ".tmp_"
+
+
+def query_key(search_filter, begin_time, end_time, max_packets, node_name=None):
+    """Content address of a search query
+    The filter is compared with runs of whitespace collapsed, and times at the one second resolution the unit uses.
+    Returns:
+        (str): sha256 hex digest of the canonical query
+    """
+    canonical = json.dumps({
+        "search_filter": " ".join((search_filter or "").split()),
+        "begin_time": begin_time.strftime(TIME_FORMAT),
+        "end_time": end_time.strftime(TIME_FORMAT),
+        "max_packets": int(max_packets),
+        "node_name": node_name
+    }, sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache(SentrywireHandler):
+    """
+    On-disk cache of search results, keyed by the query that produced them
+
+    Only windows that ended capture_lag seconds before the cache was asked are stored, since later packets, or
+    packets the unit has not written to disk yet, could still change the result of an open window. The least recently used results are removed once the cache grows past max_bytes.
+    """
+
+    def __init__(self, sw, directory, max_bytes=sentrywire.const.RESULT_CACHE_MAX_BYTES,
+                 capture_lag=sentrywire.const.INCREMENTAL_CAPTURE_LAG):
+        """Search result cache
+        Args:
+            directory (str): directory holding the cached results, created if it does not exist
+            max_bytes (int): size the cache is trimmed to after each new result
+            capture_lag (float): seconds after its end a window is still treated as open
+        """
+        super(ResultCache, self).__init__(sw)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.capture_lag = timedelta(seconds=capture_lag)
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def get(self, search_filter, begin_time, end_time, max_packets=1000, node_name=None):
+        """Look up a cached result without contacting the unit
+        Returns:
+            (dict): manifest of the cached result, see run, or None
+        """
+        entry = os.path.join(self.directory, query_key(search_filter, begin_time, end_time, max_packets, node_name))
+        manifest_path = os.path.join(entry, MANIFEST)
+        try:
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (IOError, OSError, ValueError):
+            return None
+        # The manifest modification time is the last use, for eviction
+        os.utime(manifest_path, None)
+        return self._absolute(entry, manifest)
+
+    def run(self, search_name, begin_time, end_time, search_filter=None, max_packets=1000, node_name=None,
+            kinds=("pcaps",), timeout=None):
+        """Return the result of a search from the cache, running and caching it on a miss
+        The search run on a miss is deleted from the unit once its results are downloaded.
+        Args:
+            search_name (str): name used if the search has to be run
+            begin_time (datetime.datetime): Search for packets after begin_time
+            end_time (datetime.datetime): Search for packets before end_time
+            search_filter (str): Optional, see Search.create
+            max_packets (int): maximum number of packets to include in results
+            node_name (str): Optional, node to download from. Defaults to every node the search completed on
+            kinds (tuple of str): results to download, any of "pcaps", "objects" and "logs"
+            timeout (float): Optional, seconds to wait for the search to complete
+        Returns:
+            (dict): paths of the cached files, from every node. Treat them as read only, they are shared by every
+                    caller. A window that has not ended capture_lag seconds ago is not cached, its files are put in a new temporary
+                    directory for the caller to remove
+            Example
+            {
+                "search": "continuum_1635109402_72_test",
+                "nodes": ["sw152"],
+                "pcaps": ["/cache/3f1c.../sw152/pcaps/continuum_1635109402_72_test_0.pcap"],
+                "objects": ["/cache/3f1c.../sw152/objects.zip"],
+                "logs": []
+            }
+        Raises:
+            NotFound: If a node answered with a message instead of the objects or logs of the search
+        """
+        cached = self.get(search_filter, begin_time, end_time, max_packets, node_name)
+        if cached is not None and all(kind in cached for kind in kinds):
+            return cached
+
+        search_token = self.sw.searches.create(search_name, begin_time, end_time, search_filter=search_filter,
+                                               max_packets=max_packets)["searchname"]
+        try:
+            records = self.sw.searches.watch(search_token).result(timeout)
+            if node_name is not None:
+                nodes = [node_name]
+            else:
+                nodes = []
+                for record in records:
+                    if record["NodeName"] not in nodes:
+                        nodes.append(record["NodeName"])
+            if not nodes:
+                raise NotFound("Search %s did not complete on any node" % search_token)
+
+            if end_time >= datetime.now() - self.capture_lag:
+                # The window is still open, so the result is not reusable and is left to the caller
+                work_dir = tempfile.mkdtemp(prefix="sentrywire_")
+                return self._absolute(work_dir, self._download(search_token, nodes, work_dir, kinds))
+
+            work_dir = tempfile.mkdtemp(prefix=WORK_PREFIX, dir=self.directory)
+            try:
+                manifest = self._download(search_token, nodes, work_dir, kinds)
+            except Exception:
+                shutil.rmtree(work_dir, ignore_errors=True)
+                raise
+        finally:
+            self.sw.searches.delete(search_token)
+
+        entry = os.path.join(self.directory, query_key(search_filter, begin_time, end_time, max_packets, node_name))
+        with open(os.path.join(work_dir, MANIFEST), "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        with self._lock:
+            if os.path.isdir(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+            os.rename(work_dir, entry)
+            self._evict(keep=entry)
+        return self._absolute(entry, manifest)
+
+    def _download(self, search_token, nodes, work_dir, kinds):
+        """Download the results of a completed search from each of its nodes into work_dir/<node>
+        Returns:
+            (dict): manifest with paths relative to work_dir
+        Raises:
+            NotFound: If a node answered with a message instead of the objects or logs
+        """
+        manifest = {"search": search_token, "nodes": nodes, "size": 0}
+        for kind in kinds:
+            manifest[kind] = []
+        for node in nodes:
+            node_dir = os.path.join(work_dir, node)
+            if not os.path.isdir(node_dir):
+                os.makedirs(node_dir)
+            if "pcaps" in kinds:
+                try:
+                    paths = self.sw.searches.pcaps.get_all(node, search_token, os.path.join(node_dir, "pcaps"))
+                    manifest["pcaps"].extend(os.path.relpath(path, work_dir) for path in paths.values())
+                except NotFound:
+                    # The node had no packets matching the search
+                    pass
+            if "objects" in kinds:
+                objects_path = os.path.join(node_dir, "objects.zip")
+                message = self.sw.searches.objects.get(node, search_token, objects_path)
+                if message is not None:
+                    raise NotFound("Objects of %s were not returned by %s: %s" % (search_token, node, message))
+                manifest["objects"].append(os.path.relpath(objects_path, work_dir))
+            if "logs" in kinds:
+                logs_path = os.path.join(node_dir, "logs")
+                try:
+                    message = self.sw.searches.logs.get(node, search_token, logs_path)
+                except NotFound:
+                    # The node has no logs for the search
+                    continue
+                if message is not None:
+                    raise NotFound("Logs of %s were not returned by %s: %s" % (search_token, node, message))
+                manifest["logs"].append(os.path.relpath(logs_path, work_dir))
+        manifest["size"] = _tree_size(work_dir)
+        return manifest
+
+    @staticmethod
+    def _absolute(entry, manifest):
+        result = dict(manifest)
+        for kind in ("pcaps", "objects", "logs"):
+            if kind in result:
+                result[kind] = [os.path.join(entry, path) for path in result[kind]]
+        return result
+
+    def _evict(self, keep=None):
+        """Remove the least recently used results until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.startswith(WORK_PREFIX):
+                # A result still being written, its manifest may exist before it is renamed into place
+                continue
+            entry = os.path.join(self.directory, name)
+            manifest_path = os.path.join(entry, MANIFEST)
+            try:
+                with open(manifest_path) as manifest_file:
+                    size = json.load(manifest_file)["size"]
+                entries.append((os.path.getmtime(manifest_path), size, entry))
+            except (IOError, OSError, ValueError, KeyError):
+                continue
+            total += size
+
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """Remove every cached result"""
+        with self._lock:
+            for name in os.listdir(self.directory):
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+
+def _tree_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
@@ -1,20 +1,34 @@
-import io
-import zipfile
-from json import loads
-
-from sentrywire.exceptions import SentrywireException, NotFound
+import numbers
+import os
+from collections import OrderedDict
+import time
+
+import sentrywire.const
+from sentrywire.const import DATA_LANE
+from sentrywire.exceptions import SentrywireException, NotFound, InvalidParameters, InvalidAuthentication, PcapError
 from sentrywire.base import EndpointHandler
+from sentrywire.lazy import LazyHandler
+
+# Types of the chunk indices listed in chunklist.json
+try:
+    _TEXT_TYPES = (basestring,)
+except NameError:
+    _TEXT_TYPES = (str,)
 
 
 class Search(EndpointHandler):
     path = "/fmsearch"
 
+    # Sub-handlers are created on first use
+    objects = LazyHandler("objects", "sentrywire.v2.search", "Objects")
+    pcaps = LazyHandler("pcaps", "sentrywire.v2.search", "Pcaps")
+    logs = LazyHandler("logs", "sentrywire.v2.search", "Logs")
+    watcher = LazyHandler("watcher", "sentrywire.v2.watcher", "SearchWatcher")
+    sharded = LazyHandler("sharded", "sentrywire.v2.sharded", "ShardedSearch")
+
     def __init__(self, sw):
         """HTTP POST request to the /v2/fmsearch endpoint to start a new search.
         """
-        self.objects = Objects(sw)
-        self.pcaps = Pcaps(sw)
-        self.logs = Logs(sw)
         super(Search, self).__init__(sw, self.path)
 
     def create(self, search_name, begin_time, end_time, search_filter=None, max_packets=1000):
@@ -176,6 +190,29 @@ class Search(EndpointHandler):
         response = self.sw.http_get(self.path + "/completed", params=params)
         return response
 
+    def watch(self, search_name, callback=None, timeout=None):
+        """Wait for a search to complete without polling its status
+        All watched searches share the poll loop of self.watcher, see SearchWatcher
+        Args:
+            search_name (str): search token, as returned by create
+            callback (callable): Optional, called as callback(search_name, records) once the search completes
+            timeout (float): Optional, seconds after which the future fails with concurrent.futures.TimeoutError
+        Returns:
+            (concurrent.futures.Future): resolves to the list of completed search records, one per node
+            Example
+            [
+                {
+                    'SearchKey': 'continuum_1635109402_72_test_get_pcap_listsw152',
+                    'SearchName': 'continuum_1635109402_72_test_get_pcap_list',
+                    'SubmittedTime': '1635109416091',
+                    'MaxChunk': '0',
+                    'NodeName': 'sw152',
+                    ...
+                }
+            ]
+        """
+        return self.watcher.watch(search_name, callback=callback, timeout=timeout)
+
 
 class Objects(EndpointHandler):
     path = "/fmsearch/data"
@@ -185,17 +222,16 @@ class Objects(EndpointHandler):
         """
         super(Objects, self).__init__(sw, self.path)
 
-    def list(self,  node_name, search_token, file_path):
+    def list(self,  node_name, search_token, file_path, chunk_size=None):
         """Get the object list from a search
         Args:
             search_token (str): search token
             node_name (str): node to retrieve search from
             file_path (str): path to zip file destination
+            chunk_size (int): Optional, bytes written at a time. Defaults to the client chunk_size
         Returns:
             (None): Downloads file to file_path
         """
-        file_handler = open(file_path, 'wb+')
-
         params = {
             "rest_token": self.sw.rest_token,
             "searchname": search_token,
@@ -203,26 +239,20 @@ class Objects(EndpointHandler):
             "nodename": node_name
         }
 
-        response = self.sw.http_get(self.path, params=params)
-
-        if isinstance(response, dict):
-            file_handler.close()
-            return response
+        return self.sw.http_download(self.path, file_path, chunk_size=chunk_size, params=params)
 
-        file_handler.write(response.content)
-        file_handler.close()
-
-    def get(self,  node_name, search_token, file_path):
-        """Get the object list from a search
+    def get(self,  node_name, search_token, file_path, chunk_size=None, resume=False, checksum=None):
+        """Get the objects from a search
         Args:
             search_token (str): search token
             node_name (str): node to retrieve search from
             file_path (str): path to zip file destination
+            chunk_size (int): Optional, bytes written at a time. Defaults to the client chunk_size
+            resume (bool): Optional, continue a partial file at file_path instead of downloading it again
+            checksum (str): Optional, expected sha256 hex digest of the complete file
         Returns:
             (None): Downloads file to file_path
         """
-        file_handler = open(file_path, 'wb+')
-
         params = {
             "rest_token": self.sw.rest_token,
             "searchname": search_token,
@@ -230,14 +260,8 @@ class Objects(EndpointHandler):
             "nodename": node_name
         }
 
-        response = self.sw.http_get(self.path, params=params)
-
-        if isinstance(response, dict):
-            file_handler.close()
-            return response
-
-        file_handler.write(response.content)
-        file_handler.close()
+        return self.sw.http_download(self.path, file_path, chunk_size=chunk_size, resume=resume, checksum=checksum,
+                                     params=params)
 
 
 class Pcaps(EndpointHandler):
@@ -261,32 +285,24 @@ class Pcaps(EndpointHandler):
             "nodename": node_name
         }
 
-        response = self.sw.http_get(self.path, params=params)
-
-        try:
-            json_response = response.json()
-            if "Exist" in json_response["msg"]:
-                raise NotFound("No PCAPs found")
-            return json_response
-        except NotFound as e:
-            raise e
-        except:
-            pass
-
-        # This should not be a permanent inclusion, but for now it is.
-        try:  # Plenty of things can go wrong here
-            with zipfile.ZipFile(io.BytesIO(response.content)) as zip_file:
-                for filename in zip_file.namelist():
-                    if filename == "chunklist.json":
-                        # read the file
-                        with zip_file.open(filename) as f:
-                            return loads(f.read())
-        except:
-            raise SentrywireException("Error in server response")
-
-    def get(self, node_name, search_name, index, file_path):
-        file_handler = open(file_path, 'wb+')
+        response = self.sw.http_get(self.path, params=params, raw=True)
+        return _chunk_list(response.content)
 
+    def get(self, node_name, search_name, index, file_path, chunk_size=None, resume=False, checksum=None):
+        """Download one pcap chunk of a search
+        Args:
+            node_name (str): node from which to retrieve search data
+            search_name (str): search token
+            index (str): chunk to download, as listed by list()
+            file_path (str): path to pcap file destination
+            chunk_size (int): Optional, bytes written at a time. Defaults to the client chunk_size
+            resume (bool): Optional, continue a partial file at file_path instead of downloading it again
+            checksum (str): Optional, expected sha256 hex digest of the complete file
+        Returns:
+            (None): Downloads file to file_path
+        Raises:
+            NotFound: If the unit answered with a message instead of the chunk
+        """
         params = {
             "rest_token": self.sw.rest_token,
             "searchname": search_name,
@@ -294,17 +310,207 @@ class Pcaps(EndpointHandler):
             "nodename": node_name
         }
 
-        response = self.sw.http_get(self.path, params=params)
+        response = self.sw.http_download(self.path, file_path, chunk_size=chunk_size, resume=resume,
+                                         checksum=checksum, params=params)
 
-        if not response:
+        if response is not None:
             raise NotFound("PCAP not found")
 
-        if isinstance(response, dict):
-            file_handler.close()
-            return response
+    def iter_packets(self, node_name=None, search_name=None, index=None, file_path=None, chunk_size=None,
+                     linktypes=None):
+        """Parse the packets of a pcap chunk while it is downloaded, without writing it to disk
+        Packets are memoryview slices of the received chunks, see sentrywire.pcap.iter_packets. Copy the data of
+        the packets you keep with bytes(packet.data), the views are only as long lived as the chunk they point into.
+        Args:
+            node_name (str): node from which to retrieve search data
+            search_name (str): search token
+            index (str): chunk to parse, as listed by list()
+            file_path (str): Optional, parse this already downloaded pcap or pcapng file instead
+            chunk_size (int): Optional, bytes read at a time. Defaults to the client chunk_size
+            linktypes (list): Optional, the link type of the chunk is appended to it, see sentrywire.pcap.iter_packets
+        Returns:
+            (generator of sentrywire.pcap.Packet): (timestamp, caplen, origlen, data) of each packet
+        Raises:
+            NotFound: If the unit answered with a message instead of the chunk
+            PcapError: If the chunk is not a pcap or pcapng capture, or is truncated
+        """
+        from sentrywire.pcap import iter_packets
+
+        chunk_size = chunk_size or self.sw.chunk_size
+        if file_path is not None:
+            for packet in iter_packets(file_path, chunk_size, linktypes):
+                yield packet
+            return
 
-        file_handler.write(response.content)
-        file_handler.close()
+        params = {
+            "rest_token": self.sw.rest_token,
+            "searchname": search_name,
+            "type": index,
+            "nodename": node_name
+        }
+        # The data lane slot is held until the generator is exhausted or closed
+        with self.sw._lane_slot(DATA_LANE):
+            result = self.sw.http_request("get", self.path, params=params, stream=True, lane=DATA_LANE)
+            try:
+                if result.headers.get("Content-Type", None) == "application/json":
+                    try:
+                        message = result.json()
+                    except Exception:
+                        raise SentrywireException("Failed to parse the server message")
+                    raise NotFound("Chunk %s was not returned: %s" % (index, message))
+                for packet in iter_packets(result.iter_content(chunk_size=chunk_size), linktypes=linktypes):
+                    yield packet
+            finally:
+                result.close()
+
+    def flows(self, node_name, search_name, indices=None, batch_size=sentrywire.const.FLOW_BATCH_SIZE):
+        """Summarize the packets of a search into 5-tuple flows while its chunks are downloaded
+        Requires the numpy library, see sentrywire.flows.summarize
+        Args:
+            node_name (str): node from which to retrieve search data
+            search_name (str): search token
+            indices (list): Optional, chunks to summarize. Defaults to every chunk in list()
+            batch_size (int): Optional, packets decoded at a time
+        Returns:
+            (numpy.ndarray): one row per flow with fields src, dst, proto, sport, dport, packets, bytes, first, last
+        Raises:
+            PcapError: If the chunks do not all have the same link type
+        """
+        from itertools import chain
+        from sentrywire.flows import LINKTYPE_ETHERNET, summarize
+
+        if indices is None:
+            indices = [_chunk_index(entry) for entry in self.list(node_name, search_name)]
+        linktypes = []
+
+        def read():
+            for index in indices:
+                for packet in self.iter_packets(node_name, search_name, index, linktypes=linktypes):
+                    if linktypes and linktypes[-1] != linktypes[0]:
+                        raise PcapError("Chunks of %s have link types %d and %d" % (search_name, linktypes[0],
+                                                                                    linktypes[-1]))
+                    yield packet
+
+        # The link type is known once the header of the first chunk is read, before the first packet
+        packets = read()
+        first = next(packets, None)
+        if first is not None:
+            packets = chain([first], packets)
+        return summarize(packets, linktype=linktypes[0] if linktypes else LINKTYPE_ETHERNET, batch_size=batch_size)
+
+    def get_all(self, node_name, search_name, dest_dir, workers=sentrywire.const.PCAP_WORKERS, retries=3,
+                indices=None, progress=None, chunk_size=None, resume=False):
+        """Download every pcap chunk of a search in parallel
+        Chunks are fetched by a bounded thread pool sharing the client session, and each failed chunk is retried on
+        its own without restarting the others.
+        Args:
+            node_name (str): node from which to retrieve search data
+            search_name (str): search token
+            dest_dir (str): directory to write the chunks to, created if it does not exist
+            workers (int): Optional, number of chunks downloaded at the same time
+            retries (int): Optional, number of times a failed chunk is retried
+            indices (list): Optional, chunks to download. Defaults to every chunk in list()
+            progress (callable): Optional, called as progress(index, done, total) after each chunk is written
+            chunk_size (int): Optional, bytes written at a time. Defaults to the client chunk_size
+            resume (bool): Optional, continue chunks already partially present in dest_dir. Retries always resume
+        Returns:
+            (OrderedDict): chunk index to downloaded file path, in chunk order
+            Example:
+                {
+                    "0": "/tmp/continuum_1635109402_72_test_get_pcap_0.pcap",
+                    "1": "/tmp/continuum_1635109402_72_test_get_pcap_1.pcap"
+                }
+        Raises:
+            SentrywireException: If any chunk still failed after its retries, once all other chunks are done
+        """
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        if indices is None:
+            indices = [_chunk_index(entry) for entry in self.list(node_name, search_name)]
+        if not os.path.isdir(dest_dir):
+            os.makedirs(dest_dir)
+
+        paths = {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for index in indices:
+                file_path = os.path.join(dest_dir, "%s_%s.pcap" % (search_name, index))
+                future = executor.submit(self._get_with_retries, node_name, search_name, index, file_path,
+                                         retries, chunk_size, resume)
+                futures[future] = (index, file_path)
+
+            for future in as_completed(futures):
+                index, file_path = futures[future]
+                try:
+                    future.result()
+                    paths[index] = file_path
+                except Exception as e:
+                    errors[index] = e
+                if progress is not None:
+                    progress(index, len(paths) + len(errors), len(futures))
+
+        if errors:
+            raise SentrywireException("Failed to download chunks: %s" %
+                                      ", ".join("%s (%s)" % (index, e) for index, e in sorted(errors.items())))
+        return OrderedDict((index, paths[index]) for index in indices)
+
+    def _get_with_retries(self, node_name, search_name, index, file_path, retries, chunk_size, resume):
+        attempt = 0
+        while True:
+            try:
+                self.get(node_name, search_name, index, file_path, chunk_size=chunk_size, resume=resume or attempt > 0)
+                return file_path
+            except (InvalidParameters, InvalidAuthentication, NotFound):
+                raise
+            except (SentrywireException, IOError):
+                if attempt >= retries:
+                    raise
+                time.sleep(2 ** attempt * 0.1)
+                attempt += 1
+
+
+def _chunk_list(content):
+    """Read the body of a PcapList answer, a json message or a zip holding chunklist.json
+    Raises:
+        NotFound: If the search has no pcaps
+        SentrywireException: If the body is neither
+    """
+    # Only needed here, so they are not imported with the client
+    import io
+    import zipfile
+    from json import loads
+
+    try:
+        json_response = loads(content.decode("utf-8"))
+        if "Exist" in json_response["msg"]:
+            raise NotFound("No PCAPs found")
+        return json_response
+    except NotFound as e:
+        raise e
+    except:
+        pass
+
+    # This should not be a permanent inclusion, but for now it is.
+    try:  # Plenty of things can go wrong here
+        with zipfile.ZipFile(io.BytesIO(content)) as zip_file:
+            for filename in zip_file.namelist():
+                if filename == "chunklist.json":
+                    # read the file
+                    with zip_file.open(filename) as f:
+                        return loads(f.read().decode("utf-8"))
+    except:
+        raise SentrywireException("Error in server response")
+
+
+def _chunk_index(entry):
+    """Return the index to pass to Pcaps.get for an entry of chunklist.json, which lists the chunk indices
+    Raises:
+        SentrywireException: If the entry is not a chunk index
+    """
+    if isinstance(entry, bool) or not isinstance(entry, _TEXT_TYPES + (numbers.Integral,)):
+        raise SentrywireException("Unrecognised chunklist entry: %r" % (entry,))
+    return str(entry)
 
 
 class Logs(EndpointHandler):
@@ -315,21 +521,17 @@ class Logs(EndpointHandler):
         """
         super(Logs, self).__init__(sw, self.path)
 
-    def get(self, node_name, search_name, file_path):
-        """Create new rest token for current client
+    def get(self, node_name, search_name, file_path, chunk_size=None, resume=False):
+        """Download the log data of a search
         Args:
             search_name (str): Name of the search to retrieve logs from
             node_name (str): Name of node to retrieve logs from
             file_path (str): Path to put downloaded file
+            chunk_size (int): Optional, bytes written at a time. Defaults to the client chunk_size
+            resume (bool): Optional, continue a partial file at file_path instead of downloading it again
         Returns:
-            (Dict): json response as a python dictionary
-            Example:
-                {
-                  "searchname": "continuum_1631377579_1_rest2"
-                }
+            (None): Downloads file to file_path, or the json message if the server sent one instead
         """
-        file_handler = open(file_path, 'wb+')
-
         params = {
             "rest_token": self.sw.rest_token,
             "searchname": search_name,
@@ -337,15 +539,9 @@ class Logs(EndpointHandler):
             "nodename": node_name
         }
 
-        response = self.sw.http_get(self.path, params=params)
+        response = self.sw.http_download(self.path, file_path, chunk_size=chunk_size, resume=resume, params=params)
 
-        if "Exist" in response:
-            file_handler.close()
+        if isinstance(response, dict) and "Exist" in response:
             raise NotFound("Log not found")
 
-        if isinstance(response, dict):
-            file_handler.close()
-            return response
-
-        file_handler.write(response.content)
-        file_handler.close()
+        return response
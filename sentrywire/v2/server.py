@@ -1,5 +1,5 @@
 from sentrywire.base import EndpointHandler
-from json import loads
+from sentrywire.lazy import LazyHandler
 
 
 class Capture(EndpointHandler):
@@ -44,10 +44,12 @@ class Capture(EndpointHandler):
 class Server(EndpointHandler):
     path = "/fmping"
 
+    # Created on first use
+    capture = LazyHandler("capture", "sentrywire.v2.server", "Capture")
+
     def __init__(self, sw):
         """Server status function handler
         """
-        self.capture = Capture(sw)
         super(Server, self).__init__(sw, self.path)
 
     def status(self):
@@ -128,10 +130,17 @@ class Server(EndpointHandler):
         """
         params = {"rest_token": self.sw.rest_token}
         list_of_statuses = self.sw.http_get(self.path, params=params)
-        try:
-            # Bug in current version that returns strings of json within json rather than nested json
-            for item in ["ServerInfo", "FMNodes", "Groups"]:
-                list_of_statuses[item] = loads(list_of_statuses[item])
-        except:
-            pass
-        return list_of_statuses
+        return _decode_status(list_of_statuses)
+
+
+def _decode_status(list_of_statuses):
+    """Parse the parts of a server status the unit sends as json strings"""
+    from json import loads
+
+    try:
+        # Bug in current version that returns strings of json within json rather than nested json
+        for item in ["ServerInfo", "FMNodes", "Groups"]:
+            list_of_statuses[item] = loads(list_of_statuses[item])
+    except:
+        pass
+    return list_of_statuses
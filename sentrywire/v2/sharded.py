@@ -0,0 +1,150 @@
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import sentrywire.const
+import sentrywire.pcap
+from sentrywire.base import SentrywireHandler
+from sentrywire.exceptions import NotFound, TooManyRequests
+from sentrywire.retry import RetryPolicy
+
+
+def split_window(begin_time, end_time, shards):
+    """Split [begin_time, end_time] into consecutive sub-windows on whole second boundaries
+    The unit searches whole seconds and includes both ends of a window, so each sub-window ends one second before
+    the next one begins and no second is searched twice.
+    Args:
+        begin_time (datetime.datetime): start of the window
+        end_time (datetime.datetime): end of the window
+        shards (int): maximum number of sub-windows
+    Returns:
+        (list of tuple): (begin_time, end_time) of each sub-window, in time order
+    """
+    if end_time <= begin_time:
+        raise ValueError("end_time must be after begin_time")
+    begin_time = begin_time.replace(microsecond=0)
+    seconds = int((end_time - begin_time).total_seconds())
+    shards = max(1, min(shards, seconds))
+    bounds = [begin_time + (end_time - begin_time) * i // shards for i in range(shards)]
+    bounds = [bound.replace(microsecond=0) for bound in bounds] + [end_time]
+    return [(bounds[i], bounds[i + 1] - timedelta(seconds=1)) for i in range(shards - 1)] + [(bounds[-2], end_time)]
+
+
+class ShardedSearch(SentrywireHandler):
+    """
+    Runs one search as several searches over consecutive slices of the time window
+
+    The slices are submitted concurrently so the unit can spread them over its search workers, then their pcaps are
+    downloaded and joined in time order into a single file.
+    """
+
+    def __init__(self, sw):
+        """Sharded search handler
+        """
+        super(ShardedSearch, self).__init__(sw)
+        # Jittered backoff between submissions refused with TooManyRequests. A full unit frees its search workers
+        # in seconds, so the waits start longer than those of request retries
+        self.retry_policy = RetryPolicy(backoff_base=1.0)
+
+    def create(self, search_name, begin_time, end_time, search_filter=None, max_packets=1000, shards=4,
+               max_concurrent=sentrywire.const.SHARD_SUBMIT_CONCURRENCY, retries=5):
+        """Submit one search per time slice
+        Args:
+            search_name (str): base name, each slice is named <search_name>_<n>
+            begin_time (datetime.datetime): Search for packets after begin_time
+            end_time (datetime.datetime): Search for packets before end_time
+            search_filter (str): Optional, see Search.create
+            max_packets (int): maximum number of packets to include in the results of each slice
+            shards (int): number of slices
+            max_concurrent (int): searches submitted at the same time
+            retries (int): times a slice is resubmitted while the unit answers TooManyRequests
+        Returns:
+            (list of str): search tokens of the slices, in time order
+        """
+        windows = split_window(begin_time, end_time, shards)
+
+        def submit(n):
+            window_begin, window_end = windows[n]
+            attempt = 0
+            while True:
+                try:
+                    response = self.sw.searches.create("%s_%d" % (search_name, n), window_begin, window_end,
+                                                       search_filter=search_filter, max_packets=max_packets)
+                    return response["searchname"]
+                except TooManyRequests:
+                    # The unit is full, wait for some of its searches to finish
+                    if attempt >= retries:
+                        raise
+                    time.sleep(self.retry_policy.backoff(attempt))
+                    attempt += 1
+
+        with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+            return list(executor.map(submit, range(len(windows))))
+
+    def get(self, search_names, file_path, node_name=None, timeout=None, workers=sentrywire.const.PCAP_WORKERS,
+            dedupe=False):
+        """Wait for the slices of a sharded search and join their pcaps into one file
+        Args:
+            search_names (list of str): search tokens returned by create, in time order
+            file_path (str): path of the joined pcap file
+            node_name (str): Optional, node to download from. Defaults to every node each slice completed on
+            timeout (float): Optional, maximum number of seconds to wait for each slice
+            workers (int): chunks downloaded at the same time
+            dedupe (bool): Optional, merge the chunks by timestamp and drop packets returned twice,
+                           see sentrywire.pcap.merge. By default the chunks of a single node are concatenated, and
+                           those of several nodes merged in time order
+        Returns:
+            (None): Writes the joined pcap to file_path
+        """
+        completed = self.sw.searches.watcher.wait(search_names, timeout=timeout)
+
+        chunk_dir = tempfile.mkdtemp(prefix="sentrywire_")
+        try:
+            chunk_paths = []
+            all_nodes = set()
+            for name in search_names:
+                if node_name is not None:
+                    nodes = [node_name]
+                else:
+                    nodes = []
+                    for record in completed[name]:
+                        if record["NodeName"] not in nodes:
+                            nodes.append(record["NodeName"])
+                    if not nodes:
+                        raise NotFound("Search %s did not complete on any node" % name)
+                all_nodes.update(nodes)
+                for node in nodes:
+                    try:
+                        paths = self.sw.searches.pcaps.get_all(node, name, os.path.join(chunk_dir, node),
+                                                               workers=workers)
+                    except NotFound:
+                        # No packets matched in this slice on this node
+                        continue
+                    chunk_paths.extend(paths.values())
+
+            if dedupe or len(all_nodes) > 1:
+                sentrywire.pcap.merge(chunk_paths, file_path, dedupe=dedupe, chunk_size=self.sw.chunk_size)
+            else:
+                sentrywire.pcap.concatenate(chunk_paths, file_path, chunk_size=self.sw.chunk_size)
+        finally:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+
+    def run(self, search_name, begin_time, end_time, file_path, search_filter=None, max_packets=1000, shards=4,
+            node_name=None, timeout=None, delete=False, dedupe=False):
+        """Run a sharded search and write its merged pcap to file_path
+        See create and get for the arguments
+        Args:
+            delete (bool): Optional, delete the slice searches from the unit once downloaded
+        Returns:
+            (list of str): search tokens of the slices, in time order
+        """
+        search_names = self.create(search_name, begin_time, end_time, search_filter=search_filter,
+                                   max_packets=max_packets, shards=shards)
+        self.get(search_names, file_path, node_name=node_name, timeout=timeout, dedupe=dedupe)
+        if delete:
+            for name in search_names:
+                self.sw.searches.delete(name)
+        return search_names
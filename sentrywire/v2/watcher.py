@@ -0,0 +1,206 @@
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+import sentrywire.const
+from sentrywire.base import SentrywireHandler
+from sentrywire.exceptions import NotFound, InvalidAuthentication, InvalidParameters
+
+
+class SearchWatcher(SentrywireHandler):
+    """
+    Tracks many searches with a single poll loop
+
+    Every poll takes one snapshot of the pending searches, and only fetches the completed searches when a watched
+    search has just left the pending list. Searches that left it without being found in the completed list, such as
+    unknown names, are looked up again in a snapshot of the completed searches at most every max_interval. The
+    interval between polls grows while nothing changes and drops back to min_interval as soon as a search completes.
+    """
+
+    def __init__(self, sw,
+                 min_interval=sentrywire.const.WATCH_MIN_INTERVAL,
+                 max_interval=sentrywire.const.WATCH_MAX_INTERVAL,
+                 backoff=2.0):
+        """Search watcher
+        Args:
+            min_interval (float): Seconds between polls while searches are completing
+            max_interval (float): Upper bound in seconds for the poll interval
+            backoff (float): Factor the interval grows by after each poll with no completed search
+        """
+        super(SearchWatcher, self).__init__(sw)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+
+        self._futures = {}
+        self._deadlines = {}
+        # Last snapshot of the completed searches, and the watched searches already seen out of the pending list
+        self._completed = {}
+        self._completed_at = None
+        self._left = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def watch(self, search_name, callback=None, timeout=None):
+        """Start tracking a search, starting the poll loop if needed
+        Args:
+            search_name (str): search token, as returned by Search.create
+            callback (callable): Optional, called as callback(search_name, records) once the search completes
+            timeout (float): Optional, seconds after which the search is no longer tracked and its future fails
+                             with concurrent.futures.TimeoutError, e.g. for a name the unit never lists
+        Returns:
+            (concurrent.futures.Future): resolves to the list of completed search records for search_name, one per
+                                         node that ran it
+        """
+        with self._lock:
+            future = self._futures.get(search_name)
+            if future is None:
+                future = Future()
+                self._futures[search_name] = future
+            if timeout is not None:
+                deadline = time.time() + timeout
+                self._deadlines[search_name] = min(deadline, self._deadlines.get(search_name, deadline))
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name="sentrywire-search-watcher")
+                self._thread.daemon = True
+                self._thread.start()
+
+        if callback is not None:
+            def notify(done):
+                if not done.cancelled() and done.exception() is None:
+                    callback(search_name, done.result())
+            future.add_done_callback(notify)
+
+        # A new search should be looked at quickly, even if the loop has backed off
+        self.interval = self.min_interval
+        self._wakeup.set()
+        return future
+
+    def unwatch(self, search_name):
+        """Stop tracking a search and cancel its future"""
+        with self._lock:
+            future = self._futures.pop(search_name, None)
+            self._deadlines.pop(search_name, None)
+        if future is not None:
+            future.cancel()
+
+    def wait(self, search_names, timeout=None):
+        """Block until every search in search_names has completed
+        Args:
+            search_names (list of str): search tokens
+            timeout (float): Optional, maximum number of seconds to wait for each search
+        Returns:
+            (dict): search name to the list of completed search records
+        Raises:
+            concurrent.futures.TimeoutError: If a search did not complete in time
+        """
+        futures = dict((name, self.watch(name, timeout=timeout)) for name in search_names)
+        return dict((name, future.result(timeout)) for name, future in futures.items())
+
+    def stop(self):
+        """Stop the poll loop. Searches still being watched keep their futures and resume on the next watch()"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def poll(self):
+        """Take one snapshot of the unit and resolve every watched search that has completed
+        Returns:
+            (list of str): names of the searches that completed during this poll
+        """
+        self._expire()
+        with self._lock:
+            watched = [name for name, future in self._futures.items() if not future.done()]
+            self._left &= set(watched)
+        if not watched:
+            return []
+
+        try:
+            pending = set(item.get("SearchName") for item in self.sw.searches.pending())
+        except NotFound:
+            pending = set()
+
+        candidates = [name for name in watched if name not in pending]
+        if not candidates:
+            return []
+
+        missing = [name for name in candidates if name not in self._completed]
+        stale = self._completed_at is None or time.time() - self._completed_at >= self.max_interval
+        if any(name not in self._left for name in missing) or (missing and stale):
+            completed = {}
+            for item in self.sw.searches.completed():
+                for key in set((item.get("SearchName"), item.get("SearchKey"))):
+                    if key:
+                        completed.setdefault(key, []).append(item)
+            self._completed = completed
+            self._completed_at = time.time()
+        self._left.update(candidates)
+
+        finished = []
+        for name in candidates:
+            if name in self._completed:
+                with self._lock:
+                    future = self._futures.pop(name, None)
+                    self._deadlines.pop(name, None)
+                self._left.discard(name)
+                if future is not None and future.set_running_or_notify_cancel():
+                    future.set_result(self._completed[name])
+                    finished.append(name)
+        return finished
+
+    def _expire(self):
+        """Fail the futures of the searches whose timeout has passed"""
+        now = time.time()
+        expired = []
+        with self._lock:
+            for name, deadline in list(self._deadlines.items()):
+                if deadline <= now:
+                    del self._deadlines[name]
+                    future = self._futures.pop(name, None)
+                    if future is not None:
+                        expired.append((name, future))
+        for name, future in expired:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(TimeoutError("Search %s did not complete in time" % name))
+
+    def _run(self):
+        while not self._stopped.is_set():
+            with self._lock:
+                if not self._futures:
+                    self._thread = None
+                    return
+            try:
+                if self.poll():
+                    self.interval = self.min_interval
+                else:
+                    self.interval = min(self.interval * self.backoff, self.max_interval)
+            except (InvalidAuthentication, InvalidParameters) as e:
+                # Polling can not recover from these, so hand them to everyone waiting
+                with self._lock:
+                    futures, self._futures = self._futures, {}
+                    self._deadlines = {}
+                for future in futures.values():
+                    if future.set_running_or_notify_cancel():
+                        future.set_exception(e)
+            except Exception:
+                self.interval = min(self.interval * self.backoff, self.max_interval)
+
+            interval = self.interval
+            with self._lock:
+                if self._deadlines:
+                    # Wake up in time to fail the next search that times out
+                    interval = max(0, min(interval, min(self._deadlines.values()) - time.time()))
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
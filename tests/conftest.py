@@ -0,0 +1,6 @@
+import sys
+
+collect_ignore = []
+if sys.version_info < (3, 7):
+    # The asyncio client and its tests need async syntax and asyncio.run
+    collect_ignore.append("test_aio.py")
@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import ssl
+import zipfile
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from sentrywire.aio import AsyncSentrywire
+from sentrywire.exceptions import IntegrityError, NotFound
+from sentrywire.v2 import search
+
+BODY = b"0123456789" * 10
+
+
+def unit_app(requests):
+    """Answers of a unit, recording the path, type and Range header of each request"""
+
+    async def data(request):
+        kind = request.query["type"]
+        requests.append((request.path, kind, request.headers.get("Range")))
+        if kind == "PcapList":
+            zipped = io.BytesIO()
+            with zipfile.ZipFile(zipped, "w") as zip_file:
+                zip_file.writestr("chunklist.json", json.dumps(["0", "1"]))
+            return web.Response(body=zipped.getvalue(), content_type="application/zip")
+        if kind == "missing":
+            return web.json_response({"msg": "Search does not Exist"})
+        body = BODY if kind == "0" else b"x" * len(BODY)
+        offset = int(request.headers.get("Range", "bytes=0-")[6:-1])
+        if offset >= len(body):
+            return web.Response(status=416)
+        if not offset:
+            return web.Response(body=body, content_type="application/octet-stream")
+        return web.Response(status=206, body=body[offset:], content_type="application/octet-stream",
+                            headers={"Content-Range": "bytes %d-%d/%d" % (offset, len(body) - 1, len(body))})
+
+    async def create(request):
+        requests.append((request.path, (await request.json())["search_name"], None))
+        return web.json_response({"searchname": "token_1"})
+
+    async def triggers(request):
+        return web.json_response({"trigger_name": "only"})
+
+    async def ping(request):
+        return web.json_response({"ServerInfo": json.dumps({"NodeName": "sw1"}), "FMNodes": "[]", "Groups": "[]"})
+
+    app = web.Application()
+    app.router.add_get("/v2/fmsearch/data", data)
+    app.router.add_post("/v2/fmsearch", create)
+    app.router.add_get("/v2/activetriggers", triggers)
+    app.router.add_get("/v2/fmping", ping)
+    return app
+
+
+def with_unit(test):
+    """Run test(sw, requests, ...) against a local unit"""
+
+    async def run(*args):
+        requests = []
+        async with TestServer(unit_app(requests)) as server:
+            sw = AsyncSentrywire("unit", rest_token="token")
+            sw._url = str(server.make_url("/v2"))
+            try:
+                await test(sw, requests, *args)
+            finally:
+                await sw.close()
+
+    return lambda *args: asyncio.run(run(*args))
+
+
+def test_ssl_verify_as_requests_reads_verify(tmp_path):
+    assert AsyncSentrywire("unit")._ssl_context() is None
+    assert AsyncSentrywire("unit", ssl_verify=False)._ssl_context() is False
+
+    certifi = pytest.importorskip("certifi")
+    context = AsyncSentrywire("unit", ssl_verify=certifi.where())._ssl_context()
+    assert isinstance(context, ssl.SSLContext)
+    assert context.verify_mode == ssl.CERT_REQUIRED
+    assert context.cert_store_stats()["x509_ca"] > 0
+    assert isinstance(AsyncSentrywire("unit", ssl_verify=str(tmp_path))._ssl_context(), ssl.SSLContext)
+
+
+def test_handlers_are_those_of_the_blocking_client():
+    sw = AsyncSentrywire("unit")
+    assert isinstance(sw.searches, search.Search)
+    assert isinstance(sw.searches.pcaps, search.Pcaps)
+    assert isinstance(sw.searches.objects, search.Objects)
+    assert sw.searches.watch is None and sw.searches.pcaps.get_all is None
+
+
+@with_unit
+async def test_inherited_and_rewritten_methods(sw, requests):
+    from datetime import datetime
+
+    assert await sw.searches.create("hunt", datetime(2022, 1, 1), datetime(2022, 1, 1, 1)) == {"searchname": "token_1"}
+    assert await sw.activetriggers.list() == [{"trigger_name": "only"}]
+    assert (await sw.server.status())["ServerInfo"] == {"NodeName": "sw1"}
+    assert await sw.searches.pcaps.list("sw1", "token_1") == ["0", "1"]
+    with pytest.raises(NotFound):
+        await sw.searches.pcaps.get("sw1", "token_1", "missing", os.devnull)
+
+
+def download_test(test):
+    def wrapped(tmp_path):
+        with_unit(test)(str(tmp_path / "0.pcap"))
+    wrapped.__name__ = test.__name__
+    return wrapped
+
+
+@download_test
+async def test_download_resumes_with_a_range(sw, requests, file_path):
+    with open(file_path, "wb") as chunk_file:
+        chunk_file.write(BODY[:40])
+    await sw.searches.pcaps.get("sw1", "token_1", "0", file_path, chunk_size=7, resume=True,
+                                checksum=hashlib.sha256(BODY).hexdigest())
+    assert requests == [("/v2/fmsearch/data", "0", "bytes=40-")]
+    with open(file_path, "rb") as chunk_file:
+        assert chunk_file.read() == BODY
+
+
+@download_test
+async def test_complete_file_is_kept_on_416(sw, requests, file_path):
+    with open(file_path, "wb") as chunk_file:
+        chunk_file.write(BODY)
+    await sw.searches.pcaps.get("sw1", "token_1", "0", file_path, resume=True,
+                                checksum=hashlib.sha256(BODY).hexdigest())
+    assert requests == [("/v2/fmsearch/data", "0", "bytes=100-")]
+
+
+@download_test
+async def test_stale_file_is_downloaded_again_on_416(sw, requests, file_path):
+    with open(file_path, "wb") as chunk_file:
+        chunk_file.write(b"y" * 200)
+    await sw.searches.pcaps.get("sw1", "token_1", "0", file_path, resume=True)
+    assert [request[2] for request in requests] == ["bytes=200-", None]
+    with open(file_path, "rb") as chunk_file:
+        assert chunk_file.read() == BODY
+
+
+@download_test
+async def test_checksum_mismatch_removes_the_file(sw, requests, file_path):
+    with pytest.raises(IntegrityError):
+        await sw.searches.pcaps.get("sw1", "token_1", "1", file_path, checksum=hashlib.sha256(BODY).hexdigest())
+    assert not os.path.exists(file_path)
@@ -0,0 +1,125 @@
+import struct
+
+import pytest
+
+from sentrywire.bpf import compile_filter, filter_pcap
+from sentrywire.exceptions import BpfError
+from sentrywire.pcap import iter_packets
+
+MAC = b"\x00\x11\x22\x33\x44\x55"
+
+
+def ether(ethertype, body, vlan=None):
+    header = b"\xff" * 6 + MAC
+    if vlan is not None:
+        header += struct.pack("!HH", 0x8100, vlan)
+    return header + struct.pack("!H", ethertype) + body
+
+
+def ipv4(proto, body, src=b"\x0a\x00\x00\x01", dst=b"\xc0\xa8\x01\x02", fragment=0):
+    return struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(body), 0, fragment, 64, proto, 0, src, dst) + body
+
+
+def tcp(sport, dport, flags, payload=b""):
+    return struct.pack("!HHIIBBHHH", sport, dport, 0, 0, 0x50, flags, 0, 0, 0) + payload
+
+
+def udp(sport, dport, payload=b""):
+    return struct.pack("!HHHH", sport, dport, 8 + len(payload), 0) + payload
+
+
+V6_SRC = b"\0" * 15 + b"\x01"
+V6_DST = b"\xfe\x80" + b"\0" * 13 + b"\x02"
+
+PACKETS = {
+    "http": ether(0x0800, ipv4(6, tcp(12345, 8081, 0x18, b"HTTP/1.1 200 OK"))),
+    "rst": ether(0x0800, ipv4(6, tcp(443, 5000, 0x04))),
+    "dns": ether(0x0800, ipv4(17, udp(5353, 53, b"q"), src=b"\x08\x08\x08\x08")),
+    "dns_reply": ether(0x0800, ipv4(17, udp(53, 5353), src=b"\x0a\x00\x00\x03", dst=b"\x0a\x00\x00\x01")),
+    "ipv6": ether(0x86dd, struct.pack("!IHBB", 0x60000000, 20, 6, 64) + V6_SRC + V6_DST + tcp(80, 443, 0x02)),
+    "arp": ether(0x0806, b"\0" * 28),
+    "fragment": ether(0x0800, ipv4(17, udp(53, 53), fragment=5)),
+    "icmp": ether(0x0800, ipv4(1, b"\x08\x00" + b"\0" * 6)),
+    "vlan": ether(0x0800, ipv4(17, udp(1, 2), src=b"\x0a\x00\x00\x07"), vlan=100),
+    "who_has": ether(0x0806, struct.pack("!HHBBH", 1, 0x0800, 6, 4, 1) + MAC + b"\x0a\x00\x00\x09" +
+                     b"\0" * 6 + b"\x0a\x00\x00\x0a"),
+}
+ALL = set(PACKETS)
+
+CASES = [
+    ("", ALL),
+    ("tcp or udp", {"http", "rst", "dns", "dns_reply", "ipv6", "fragment"}),
+    ("(tcp[20:4] = 0x48545450) and (not port 80 and not port 8080)", {"http"}),
+    ("tcp[tcpflags] = tcp-rst", {"rst"}),
+    ("tcp[tcpflags] & tcp-syn != 0", {"ipv6"}),
+    ("tcp[((tcp[12] & 0xf0) >> 2):4] = 0x48545450", {"http"}),
+    ("port 53", {"dns", "dns_reply"}),
+    ("udp dst port 53 and src host 8.8.8.8", {"dns"}),
+    ("host 10.0.0.1 and not 192.168.1.2", {"dns_reply"}),
+    ("src net 10.0.0.0/8", {"http", "rst", "dns_reply", "fragment", "icmp", "who_has"}),
+    ("net 8", {"dns"}),
+    ("net 192.168.0.0 mask 255.255.0.0 and port 443 or 5000", {"rst"}),
+    ("ip6 and dst host fe80::2", {"ipv6"}),
+    ("net fe80::/10", {"ipv6"}),
+    ("arp", {"arp", "who_has"}),
+    ("ether proto arp", {"arp", "who_has"}),
+    ("ip proto \\tcp", {"http", "rst"}),
+    ("icmp[icmptype] = icmp-echo", {"icmp"}),
+    ("ether src 00:11:22:33:44:55 and icmp", {"icmp"}),
+    ("portrange 5000-5353", {"rst", "dns", "dns_reply"}),
+    ("tcp src or dst port 443", {"rst", "ipv6"}),
+    ("less 60", {"rst", "dns", "dns_reply", "arp", "icmp", "fragment", "vlan", "who_has"}),
+    ("len >= 60 and greater 60", {"http", "ipv6"}),
+    ("ip[2:2] - 20 > 20", {"http"}),
+    # and and or have the same precedence and group from the left
+    ("udp or tcp and port 80", {"ipv6"}),
+    ("udp or tcp and port 53", {"dns", "dns_reply"}),
+    ("host 10.0.0.3 or host 10.0.0.1 and port 80", set()),
+    ("host 10.0.0.3 or host 10.0.0.1 and port 53", {"dns_reply"}),
+    ("tcp and port 443 or icmp", {"rst", "ipv6", "icmp"}),
+    ("icmp or tcp and port 443", {"rst", "ipv6"}),
+    ("not udp and not arp or port 53", ALL - {"arp", "fragment", "who_has"}),
+    ("icmp or (tcp and port 443)", {"rst", "ipv6", "icmp"}),
+    # Tagged frames only match after a vlan keyword, which moves the following primitives past the tag
+    ("udp and port 2", set()),
+    ("vlan and udp and port 2", {"vlan"}),
+    ("vlan 100 and src host 10.0.0.7", {"vlan"}),
+    ("vlan 200 and udp", set()),
+    ("vlan and ip[9] = 17", {"vlan"}),
+    ("vlan", {"vlan"}),
+    # ARP sender and target protocol addresses
+    ("arp host 10.0.0.9", {"who_has"}),
+    ("arp src host 10.0.0.9 and arp dst host 10.0.0.10", {"who_has"}),
+    ("arp dst host 10.0.0.9", set()),
+    ("host 10.0.0.10", {"who_has"}),
+    ("ip host 10.0.0.10", set()),
+    ("rarp host 10.0.0.9", set()),
+]
+
+
+@pytest.mark.parametrize("expression, expected", CASES)
+def test_filter(expression, expected):
+    matcher = compile_filter(expression)
+    assert set(name for name, data in PACKETS.items() if matcher(data)) == expected
+
+
+@pytest.mark.parametrize("expression", ["port", "tcp[1:3] = 1", "host example.com", "(tcp", "foo bar"])
+def test_invalid_filter(expression):
+    with pytest.raises(BpfError):
+        compile_filter(expression)
+
+
+def test_compiled_filters_are_cached():
+    assert compile_filter("port 53") is compile_filter(" port   53 ")
+
+
+def test_filter_pcap(tmp_path):
+    capture = tmp_path / "in.pcap"
+    with open(str(capture), "wb") as pcap:
+        pcap.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for n, data in enumerate(PACKETS.values()):
+            pcap.write(struct.pack("<IIII", 1000 + n, 0, len(data), len(data)) + data)
+    output = str(tmp_path / "out.pcap")
+    assert filter_pcap(str(capture), output, "udp and port 53") == 2
+    assert sorted(bytes(bytearray(packet.data)) for packet in iter_packets(output)) == sorted(
+        [PACKETS["dns"], PACKETS["dns_reply"]])
@@ -0,0 +1,188 @@
+import hashlib
+import io
+import os
+import threading
+import time
+
+import pytest
+import requests
+
+from sentrywire.client import Sentrywire
+from sentrywire.const import CONTROL_LANE
+from sentrywire.exceptions import IntegrityError, RangeNotSatisfiable, SentrywireException
+from sentrywire.tokenstore import TokenStore
+
+
+class FakeResult(object):
+    content = b"{}"
+
+    def close(self):
+        pass
+
+
+def test_warmup_respects_the_lane_limit():
+    sw = Sentrywire("unit", rest_token="token", lane_limits={CONTROL_LANE: 2})
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def http_request(verb, path, **kwargs):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        return FakeResult()
+
+    sw.http_request = http_request
+    assert sw.warmup(6) == 6
+    assert in_flight[1] <= 2
+
+
+def test_warmup_of_no_connections():
+    sw = Sentrywire("unit", rest_token="token")
+    sw.http_request = None
+    assert sw.warmup(0) == 0
+    assert sw.warmup(-1) == 0
+
+
+class FakeLogin(object):
+    def __init__(self, rest_token):
+        self.rest_token = rest_token
+
+    def json(self):
+        return {"rest_token": self.rest_token}
+
+
+def test_login_and_logout_swap_the_token():
+    sw = Sentrywire("unit")
+    sw.http_post = lambda path, post_data=None, **kwargs: FakeLogin("token1")
+    sw.http_put = lambda path, params=None, **kwargs: {"message": "logged out"}
+
+    assert sw.authentication.login("user", "password") == "token1"
+    assert sw.rest_token == "token1" and sw._rest_token == "token1"
+    assert sw._credentials == ("user", "password")
+
+    sw.authentication.logout()
+    assert sw.rest_token is None
+    assert sw._credentials is None
+
+
+def test_rejected_stored_token_is_discarded_without_credentials(tmp_path):
+    store = TokenStore(str(tmp_path / "tokens"))
+    sw = Sentrywire("unit", token_store=store)
+    store.put(sw._url, "stored")
+    sw = Sentrywire("unit", token_store=store)
+    assert sw.rest_token == "stored"
+
+    assert sw._relogin("stored") is None
+    assert store.get(sw._url) is None
+
+
+BODY = b"0123456789" * 10
+
+
+class FakeSession(requests.Session):
+    """Answers requests with canned responses, recording the Range header of each"""
+
+    def __init__(self, answers):
+        super(FakeSession, self).__init__()
+        self.answers = list(answers)
+        self.ranges = []
+
+    def send(self, request, **kwargs):
+        self.ranges.append(request.headers.get("Range"))
+        status_code, headers, body = self.answers.pop(0)
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers.update(headers)
+        response.raw = io.BytesIO(body)
+        response.request = request
+        return response
+
+
+def partial(offset, body=BODY):
+    return 206, {"Content-Range": "bytes %d-%d/%d" % (offset, len(body) - 1, len(body))}, body[offset:]
+
+
+def full(body=BODY):
+    return 200, {"Content-Length": str(len(body))}, body
+
+
+def download(tmp_path, answers, prefix=None, **kwargs):
+    file_path = str(tmp_path / "chunk.pcap")
+    if prefix is not None:
+        with open(file_path, "wb") as chunk_file:
+            chunk_file.write(prefix)
+    session = FakeSession(answers)
+    sw = Sentrywire("unit", rest_token="token", data_session=session, retry_transient_errors=False)
+    sw.http_download("/fmsearch/download", file_path, chunk_size=7, **kwargs)
+    return session, file_path
+
+
+def read(file_path):
+    with open(file_path, "rb") as chunk_file:
+        return chunk_file.read()
+
+
+def test_download_resumes_with_a_range(tmp_path):
+    checksum = hashlib.sha256(BODY).hexdigest()
+    session, file_path = download(tmp_path, [partial(40)], prefix=BODY[:40], resume=True, checksum=checksum)
+    assert session.ranges == ["bytes=40-"]
+    assert read(file_path) == BODY
+
+
+def test_download_starts_over_when_the_range_is_ignored(tmp_path):
+    session, file_path = download(tmp_path, [full()], prefix=b"stale", resume=True)
+    assert session.ranges == ["bytes=5-"]
+    assert read(file_path) == BODY
+
+
+def test_download_without_resume_overwrites(tmp_path):
+    session, file_path = download(tmp_path, [full()], prefix=BODY[:40])
+    assert session.ranges == [None]
+    assert read(file_path) == BODY
+
+
+def test_complete_file_is_kept_on_416(tmp_path):
+    checksum = hashlib.sha256(BODY).hexdigest()
+    session, file_path = download(tmp_path, [(416, {}, b"")], prefix=BODY, resume=True, checksum=checksum)
+    assert session.ranges == ["bytes=100-"]
+    assert read(file_path) == BODY
+
+
+def test_stale_file_is_downloaded_again_on_416(tmp_path):
+    checksum = hashlib.sha256(BODY).hexdigest()
+    session, file_path = download(tmp_path, [(416, {}, b""), full()], prefix=b"x" * 200, resume=True,
+                                  checksum=checksum)
+    assert session.ranges == ["bytes=200-", None]
+    assert read(file_path) == BODY
+
+
+def test_416_without_checksum_is_downloaded_again(tmp_path):
+    session, file_path = download(tmp_path, [(416, {}, b""), full()], prefix=BODY, resume=True)
+    assert session.ranges == ["bytes=100-", None]
+    assert read(file_path) == BODY
+
+
+def test_416_of_a_fresh_download_is_raised(tmp_path):
+    with pytest.raises(RangeNotSatisfiable):
+        download(tmp_path, [(416, {}, b"")])
+
+
+def test_download_rejects_a_resume_from_another_offset(tmp_path):
+    with pytest.raises(SentrywireException):
+        download(tmp_path, [partial(30)], prefix=BODY[:40], resume=True)
+    assert read(str(tmp_path / "chunk.pcap")) == BODY[:40]
+
+
+def test_short_download_is_an_integrity_error(tmp_path):
+    with pytest.raises(IntegrityError):
+        download(tmp_path, [(200, {"Content-Length": "200"}, BODY)])
+
+
+def test_checksum_mismatch_removes_the_file(tmp_path):
+    checksum = hashlib.sha256(BODY).hexdigest()
+    with pytest.raises(IntegrityError):
+        download(tmp_path, [partial(40)], prefix=b"x" * 40, resume=True, checksum=checksum)
+    assert not os.path.exists(str(tmp_path / "chunk.pcap"))
@@ -0,0 +1,66 @@
+from concurrent.futures import Future, TimeoutError
+
+from sentrywire.exceptions import NotFound
+from sentrywire.v2.fanout import FanoutSearch
+
+
+class FakeSearches(object):
+    def __init__(self, records):
+        self.records = records
+        self.watched = []
+        self.pcaps = FakePcaps()
+
+    def create(self, search_name, begin_time, end_time, search_filter=None, max_packets=1000):
+        return {"searchname": "token_" + search_name}
+
+    def status(self, node_name, search_name):
+        raise AssertionError("fanout should not poll the status of each node")
+
+    def watch(self, search_name, callback=None, timeout=None):
+        self.watched.append((search_name, timeout))
+        future = Future()
+        if isinstance(self.records, Exception):
+            future.set_exception(self.records)
+        else:
+            future.set_result(self.records)
+        return future
+
+
+class FakePcaps(object):
+    def get_all(self, node_name, search_name, dest_dir, workers=None):
+        if node_name == "empty":
+            raise NotFound("No pcaps found")
+        return {"0": "%s/%s_0.pcap" % (dest_dir, search_name)}
+
+
+class FakeClient(object):
+    def __init__(self, records):
+        self.searches = FakeSearches(records)
+
+
+def test_search_is_watched_once_for_every_node():
+    records = [{"SearchName": "token_hunt", "NodeName": node} for node in ("sw1", "sw2", "empty")]
+    sw = FakeClient(records)
+    results = FanoutSearch(sw).run("hunt", None, None, "/tmp/hunt", nodes=["sw1", "sw2", "empty"], timeout=30)
+
+    assert sw.searches.watched == [("token_hunt", 30)]
+    assert results["sw1"] == {"search": "token_hunt", "status": records[0],
+                              "files": ["/tmp/hunt/sw1/token_hunt_0.pcap"], "error": None}
+    assert results["sw2"]["status"] is records[1]
+    assert results["empty"]["files"] == [] and results["empty"]["error"] is None
+
+
+def test_node_missing_from_the_completed_records_fails():
+    sw = FakeClient([{"SearchName": "token_hunt", "NodeName": "sw1"}])
+    results = FanoutSearch(sw).run("hunt", None, None, "/tmp/hunt", nodes=["sw1", "sw2"])
+
+    assert results["sw1"]["error"] is None
+    assert isinstance(results["sw2"]["error"], NotFound)
+    assert results["sw2"]["files"] == []
+
+
+def test_timeout_of_the_watch_reaches_every_node():
+    error = TimeoutError("Search token_hunt did not complete in time")
+    results = FanoutSearch(FakeClient(error)).run("hunt", None, None, "/tmp/hunt", nodes=["sw1", "sw2"], timeout=1)
+
+    assert [results[node]["error"] for node in ("sw1", "sw2")] == [error, error]
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from sentrywire.v2.incremental import IncrementalSearch
+
+
+class FakeSharded(object):
+    def get(self, search_names, file_path, node_name=None, timeout=None):
+        with open(file_path, "wb") as pcap_file:
+            pcap_file.write(b"")
+
+
+class FakeSearches(object):
+    def __init__(self):
+        self.sharded = FakeSharded()
+        self.windows = []
+        self.deleted = []
+
+    def create(self, search_name, begin_time, end_time, search_filter=None, max_packets=1000):
+        self.windows.append((begin_time, end_time))
+        return {"searchname": "token_%d" % len(self.windows)}
+
+    def delete(self, search_token):
+        self.deleted.append(search_token)
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.searches = FakeSearches()
+
+
+def test_update_stops_before_now_and_deletes_slices(tmp_path):
+    sw = FakeClient()
+    rolling = IncrementalSearch(sw, str(tmp_path), window=timedelta(minutes=10), capture_lag=30)
+    before = datetime.now()
+    rolling.update("port 53")
+    rolling.update("port 53", end_time=datetime.now() + timedelta(minutes=5))
+
+    assert sw.searches.deleted == ["token_%d" % n for n in range(1, len(sw.searches.windows) + 1)]
+    for begin_time, end_time in sw.searches.windows:
+        assert end_time <= datetime.now() - timedelta(seconds=30)
+    assert sw.searches.windows[0][1] >= (before - timedelta(seconds=31)).replace(microsecond=0)
+
+
+def test_slices_do_not_share_a_second(tmp_path):
+    sw = FakeClient()
+    rolling = IncrementalSearch(sw, str(tmp_path), window=timedelta(minutes=10), capture_lag=30)
+    end = (datetime.now() - timedelta(minutes=5)).replace(microsecond=0)
+    rolling.update("port 53", end_time=end)
+    rolling.update("port 53", end_time=end)
+    rolling.update("port 53", end_time=end + timedelta(seconds=1))
+    rolling.update("port 53", end_time=end + timedelta(minutes=1))
+
+    assert sw.searches.windows[1:] == [(end + timedelta(seconds=1), end + timedelta(seconds=1)),
+                                       (end + timedelta(seconds=2), end + timedelta(minutes=1))]
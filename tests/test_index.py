@@ -0,0 +1,77 @@
+from sentrywire.exceptions import NotFound
+from sentrywire.v2.index import SearchIndex
+
+
+class FakeSearches(object):
+    def __init__(self):
+        self.pending_records = []
+        self.completed_records = []
+
+    def pending(self, count=0):
+        if not self.pending_records:
+            raise NotFound("No pending searches found")
+        return list(self.pending_records)
+
+    def completed(self, count=0):
+        records = sorted(self.completed_records, key=lambda record: -int(record["SubmittedTime"]))
+        return records[:count] if count else records
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.searches = FakeSearches()
+
+
+def record(name, submitted, status=None):
+    result = {"SearchName": name, "NodeName": "sw1", "SubmittedTime": str(submitted)}
+    if status:
+        result["SearchStatus"] = status
+    return result
+
+
+def names(index):
+    return sorted(found["SearchName"] for found in index.find())
+
+
+def check_late_completion(tmp_path, pending_has_time):
+    sw = FakeClient()
+    index = SearchIndex(sw, str(tmp_path / "index.sqlite"), page_size=2)
+    sw.searches.completed_records = [record("old_%d" % n, 1000 + n) for n in range(5)]
+    slow = record("slow", 2000, "Pending")
+    if not pending_has_time:
+        del slow["SubmittedTime"]
+    sw.searches.pending_records = [slow]
+    index.sync()
+
+    # A newer search completes first, then the slow one, after a sync in between
+    sw.searches.completed_records.append(record("newer", 3000))
+    index.sync()
+    sw.searches.pending_records = []
+    sw.searches.completed_records.append(record("slow", 2000))
+    sw.searches.completed_records.extend(record("later_%d" % n, 4000 + n) for n in range(4))
+    index.sync()
+
+    assert "slow" in names(index)
+    assert len(names(index)) == 11
+    index.close()
+
+
+def test_search_pending_during_sync_is_indexed_when_it_completes(tmp_path):
+    check_late_completion(tmp_path, pending_has_time=True)
+
+
+def test_pending_search_without_submitted_time_is_indexed_when_it_completes(tmp_path):
+    check_late_completion(tmp_path, pending_has_time=False)
+
+
+def test_high_water_held_at_oldest_pending_search(tmp_path):
+    sw = FakeClient()
+    index = SearchIndex(sw, str(tmp_path / "index.sqlite"))
+    sw.searches.completed_records = [record("done", 3000)]
+    sw.searches.pending_records = [record("running", 2000, "Pending")]
+    index.sync()
+    assert index.high_water == 2000
+    sw.searches.pending_records = []
+    index.sync()
+    assert index.high_water == 3000
+    index.close()
@@ -0,0 +1,114 @@
+import threading
+
+import pytest
+
+from sentrywire import limiter
+from sentrywire.limiter import ConcurrencyLimiter
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(limiter.time, "time", clock.time)
+    return clock
+
+
+def fill(limit):
+    """Take every slot of the limiter, so the limit is what holds requests back"""
+    return [limit.acquire() for _ in range(limit.limit)]
+
+
+def test_limit_grows_by_about_one_per_round_trip_when_saturated(clock):
+    limit = ConcurrencyLimiter(initial=4, maximum=10, min_latency=1.0)
+    in_flight = fill(limit)
+    # Each response while every slot is taken adds 1 / limit
+    for _ in range(5):
+        clock.now += 0.01
+        limit.release(in_flight.pop(0))
+        in_flight.append(limit.acquire())
+    assert limit.limit == 5 and limit.in_flight == 4
+
+
+def test_limit_does_not_grow_when_not_saturated(clock):
+    limit = ConcurrencyLimiter(initial=4, min_latency=1.0)
+    for _ in range(20):
+        limit.release(limit.acquire())
+    assert limit.limit == 4
+
+
+def test_limit_stays_within_its_bounds(clock):
+    limit = ConcurrencyLimiter(initial=2, minimum=2, maximum=3, min_latency=1.0)
+    for _ in range(10):
+        for started in fill(limit):
+            limit.release(started)
+    assert limit.limit == 3
+
+    for _ in range(10):
+        clock.now += 1
+        limit.release(limit.acquire(), overloaded=True)
+    assert limit.limit == 2
+
+
+def test_overload_cuts_the_limit_once_per_episode(clock):
+    limit = ConcurrencyLimiter(initial=16, decrease=0.5)
+    in_flight = fill(limit)
+    clock.now += 1
+    for started in in_flight:
+        limit.release(started, overloaded=True)
+    # Requests sent before the cut do not cut it again
+    assert limit.limit == 8
+
+    clock.now += 1
+    limit.release(limit.acquire(), overloaded=True)
+    assert limit.limit == 4
+
+
+def test_slow_responses_count_as_overload(clock):
+    limit = ConcurrencyLimiter(initial=8, latency_tolerance=2.0, min_latency=0.05)
+    for _ in range(5):
+        started = limit.acquire()
+        clock.now += 0.1
+        limit.release(started, key="/ping")
+    assert limit.limit == 8
+
+    started = limit.acquire()
+    clock.now += 2.0
+    limit.release(started, key="/ping")
+    assert limit.limit == 4
+
+
+def test_latency_is_compared_per_key(clock):
+    limit = ConcurrencyLimiter(initial=8, min_latency=0.05)
+    started = limit.acquire()
+    clock.now += 0.1
+    limit.release(started, key="/ping")
+
+    started = limit.acquire()
+    clock.now += 5.0
+    limit.release(started, key="/fmsearch")
+    assert limit.limit == 8
+
+
+def test_acquire_waits_for_a_free_slot():
+    limit = ConcurrencyLimiter(initial=1, min_latency=60)
+    started = limit.acquire()
+    acquired = threading.Event()
+
+    def waiter():
+        limit.release(limit.acquire())
+        acquired.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    assert not acquired.wait(0.05)
+    limit.release(started)
+    assert acquired.wait(5)
+    thread.join()
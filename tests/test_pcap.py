@@ -0,0 +1,110 @@
+import struct
+
+import pytest
+
+from sentrywire.exceptions import PcapError
+from sentrywire.pcap import (BLOCK_ENHANCED_PACKET, BLOCK_INTERFACE, BLOCK_PACKET, BLOCK_SECTION_HEADER,
+                             BYTE_ORDER_MAGIC, Packet, PcapHeader, iter_packets, merge)
+
+PAYLOADS = [bytes(bytearray(range(n, n + 10 + n))) for n in range(6)]
+
+
+def pcap(payloads=PAYLOADS):
+    records = [struct.pack("<IIII", 1000 + n, 500000, len(data), len(data)) + data
+               for n, data in enumerate(payloads)]
+    return PcapHeader().pack() + b"".join(records)
+
+
+def block(block_type, body):
+    body += b"\0" * (-len(body) % 4)
+    length = len(body) + 12
+    return struct.pack("<II", block_type, length) + body + struct.pack("<I", length)
+
+
+def pcapng(payloads=PAYLOADS, caplen=None, block_type=BLOCK_ENHANCED_PACKET):
+    blocks = [block(BLOCK_SECTION_HEADER, struct.pack("<IHHq", BYTE_ORDER_MAGIC, 1, 0, -1)),
+              block(BLOCK_INTERFACE, struct.pack("<HHI", 1, 0, 65535))]
+    for n, data in enumerate(payloads):
+        timestamp = (1000 + n) * 1000000 + 500000
+        blocks.append(block(block_type, struct.pack("<IIIII", 0, timestamp >> 32, timestamp & 0xffffffff,
+                                                    len(data) if caplen is None else caplen, len(data)) + data))
+    return b"".join(blocks)
+
+
+def chunks(data, size):
+    return [data[n:n + size] for n in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("capture", [pcap, pcapng])
+@pytest.mark.parametrize("size", [1, 3, 7, 16, 25, 64, 4096])
+def test_iter_packets_across_chunk_boundaries(capture, size):
+    packets = list(iter_packets(chunks(capture(), size)))
+    assert [packet.data.tobytes() for packet in packets] == PAYLOADS
+    assert [packet.timestamp for packet in packets] == [1000.5 + n for n in range(6)]
+    assert [packet.caplen for packet in packets] == [len(data) for data in PAYLOADS]
+
+
+@pytest.mark.skipif(not hasattr(memoryview(b""), "obj"), reason="memoryview.obj needs python 3")
+def test_only_split_records_are_copied():
+    data = pcap()
+    split = len(data) // 2
+    first, second = data[:split], data[split:]
+    packets = list(iter_packets([first, second]))
+
+    # The record cut in two is copied, the later ones are views of the second chunk
+    assert packets[-1].data.obj is second
+    assert packets[0].data.obj is first
+
+
+def test_iter_packets_opens_text_paths(tmp_path):
+    path = tmp_path / "capture.pcap"
+    path.write_bytes(pcap())
+    # A unicode path on python 2 is a path too, not a file object
+    for source in (str(path), u"%s" % path):
+        assert [packet.data.tobytes() for packet in iter_packets(source, chunk_size=7)] == PAYLOADS
+
+
+def test_truncated_capture():
+    with pytest.raises(PcapError):
+        list(iter_packets([pcap()[:-3]]))
+
+
+@pytest.mark.parametrize("block_type", [BLOCK_ENHANCED_PACKET, BLOCK_PACKET])
+def test_packet_longer_than_its_block(block_type):
+    with pytest.raises(PcapError):
+        list(iter_packets([pcapng(caplen=4096, block_type=block_type)]))
+
+
+def test_packet_is_a_named_tuple():
+    packet = Packet(1.0, 1, 1, b"x")
+    assert packet.timestamp == 1.0 and packet[3] == b"x"
+    assert "captured packet" in Packet.__doc__
+    with pytest.raises(AttributeError):
+        packet.extra = None
+
+
+def write_pcap(path, records, header=None):
+    header = header or PcapHeader()
+    with open(path, "wb") as pcap_file:
+        pcap_file.write(header.pack())
+        for ts_sec, ts_frac, data in records:
+            pcap_file.write(struct.pack(header.endian + "IIII", ts_sec, ts_frac, len(data), len(data)) + data)
+
+
+def test_merge_orders_by_time_and_keeps_input_order_on_ties(tmp_path):
+    first, second, output = (str(tmp_path / name) for name in ("a.pcap", "b.pcap", "merged.pcap"))
+    write_pcap(first, [(1, 0, b"a1"), (3, 0, b"z3"), (5, 0, b"a5")])
+    write_pcap(second, [(2, 0, b"b2"), (3, 0, b"a3"), (4, 0, b"b4")])
+
+    assert merge([first, second], output) == 6
+    assert [packet.data.tobytes() for packet in iter_packets(output)] == [b"a1", b"b2", b"z3", b"a3", b"b4", b"a5"]
+
+
+def test_merge_dedupe_and_resolution(tmp_path):
+    first, second, output = (str(tmp_path / name) for name in ("a.pcap", "b.pcap", "merged.pcap"))
+    write_pcap(first, [(1, 500000, b"x"), (2, 0, b"y")])
+    write_pcap(second, [(1, 500000000, b"x"), (2, 0, b"z")], PcapHeader(endian=">", nanosecond=True))
+
+    assert merge([first, second], output, dedupe=True) == 3
+    packets = list(iter_packets(output))
+    assert [(packet.timestamp, packet.data.tobytes()) for packet in packets] == [(1.5, b"x"), (2.0, b"y"), (2.0, b"z")]
@@ -0,0 +1,105 @@
+import struct
+
+import pytest
+
+from sentrywire.exceptions import PcapError
+from sentrywire.pcap import PcapHeader, iter_packets
+from sentrywire import pcapindex
+from sentrywire.pcapindex import PcapIndex, build_index
+
+
+def write_pcap(path, records, header=None):
+    header = header or PcapHeader()
+    with open(path, "wb") as pcap_file:
+        pcap_file.write(header.pack())
+        for ts_sec, data in records:
+            pcap_file.write(struct.pack(header.endian + "IIII", ts_sec, 0, len(data), len(data)) + data)
+
+
+def payloads(path):
+    return [bytes(bytearray(packet.data)) for packet in iter_packets(path)]
+
+
+IN_ORDER = [(1000, b"a"), (1001, b"b"), (1001, b"c"), (1003, b"d")]
+OUT_OF_ORDER = [(1003, b"d"), (1000, b"a"), (1001, b"b"), (1000, b"e")]
+
+
+def test_build_index_counts_the_packets(tmp_path):
+    path = str(tmp_path / "chunk.pcap")
+    write_pcap(path, IN_ORDER)
+    assert build_index(path) == 4
+
+    with PcapIndex(path) as index:
+        assert len(index) == 4
+        assert index.in_file_order
+        assert (index.first_time, index.last_time) == (1000.0, 1003.0)
+
+
+def test_truncated_pcap(tmp_path):
+    path = str(tmp_path / "chunk.pcap")
+    write_pcap(path, IN_ORDER)
+    with open(path, "ab") as pcap_file:
+        pcap_file.write(b"\0" * 5)
+    with pytest.raises(PcapError):
+        build_index(path)
+
+
+def test_bounds_include_begin_and_exclude_end(tmp_path):
+    path = str(tmp_path / "chunk.pcap")
+    write_pcap(path, IN_ORDER)
+    with PcapIndex(path) as index:
+        assert index.bounds() == (0, 4)
+        assert index.bounds(1001, 1003) == (1, 3)
+        assert index.bounds(1001.5) == (3, 4)
+        assert index.bounds(1004, 1000) == (4, 4)
+        assert [bytes(bytearray(packet.data)) for packet in index.iter_packets(1001, 1002)] == [b"b", b"c"]
+
+
+def test_extract_in_order_copies_the_window(tmp_path):
+    path, output = str(tmp_path / "chunk.pcap"), str(tmp_path / "window.pcap")
+    write_pcap(path, IN_ORDER)
+    with PcapIndex(path) as index:
+        assert index.extract(output, 1001, 1003, chunk_size=7) == 2
+        assert index.extract(str(tmp_path / "empty.pcap"), 2000) == 0
+    assert payloads(output) == [b"b", b"c"]
+    assert payloads(str(tmp_path / "empty.pcap")) == []
+
+
+def test_extract_out_of_order_sorts_by_time(tmp_path):
+    path, output = str(tmp_path / "chunk.pcap"), str(tmp_path / "window.pcap")
+    write_pcap(path, OUT_OF_ORDER)
+    with PcapIndex(path) as index:
+        assert not index.in_file_order
+        assert index.extract(output, 1000, 1002) == 3
+    # Packets with the same timestamp keep their file order
+    assert payloads(output) == [b"a", b"e", b"b"]
+
+
+def test_big_endian_pcap(tmp_path):
+    path, output = str(tmp_path / "chunk.pcap"), str(tmp_path / "window.pcap")
+    write_pcap(path, OUT_OF_ORDER, PcapHeader(endian=">"))
+    with PcapIndex(path) as index:
+        assert index.extract(output, 1001) == 2
+    assert payloads(output) == [b"b", b"d"]
+
+
+def test_sidecar_is_read_without_mapping_on_big_endian_hosts(tmp_path, monkeypatch):
+    path = str(tmp_path / "chunk.pcap")
+    write_pcap(path, OUT_OF_ORDER)
+    build_index(path)
+
+    monkeypatch.setattr(pcapindex.sys, "byteorder", "big")
+    with PcapIndex(path) as index:
+        assert isinstance(index._timestamps, tuple)
+        assert index.bounds(1000, 1001) == (0, 2)
+        assert [bytes(bytearray(packet.data)) for packet in index.iter_packets()] == [b"a", b"e", b"b", b"d"]
+
+
+def test_stale_sidecar_is_rebuilt(tmp_path):
+    path = str(tmp_path / "chunk.pcap")
+    write_pcap(path, IN_ORDER)
+    build_index(path)
+    write_pcap(path, IN_ORDER[:2])
+
+    with PcapIndex(path) as index:
+        assert len(index) == 2
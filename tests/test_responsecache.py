@@ -0,0 +1,106 @@
+import pytest
+import requests
+
+from sentrywire import responsecache
+from sentrywire.responsecache import ResponseCache
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(responsecache.time, "time", clock.time)
+    return clock
+
+
+def key(path, query=""):
+    return (path, False, query)
+
+
+def test_answers_expire_after_the_ttl_of_their_path(clock):
+    cache = ResponseCache(ttls={"/fmping": 5})
+    cache.put(key("/fmping"), "/fmping", {"nodes": []}, cache.generation("/fmping"))
+
+    clock.now += 5
+    assert cache.get(key("/fmping")) == (True, {"nodes": []})
+    clock.now += 0.1
+    assert cache.get(key("/fmping")) == (False, None)
+
+
+def test_paths_without_a_ttl_are_not_cached(clock):
+    cache = ResponseCache(ttls={"/fmping": 5})
+    assert cache.ttl("/fmsearch") is None
+    cache.put(key("/fmsearch"), "/fmsearch", {}, cache.generation("/fmsearch"))
+    assert cache.get(key("/fmsearch")) == (False, None)
+
+
+def test_callers_get_their_own_copy(clock):
+    cache = ResponseCache(ttls={"/fmping": 5})
+    answer = {"nodes": ["sw1"]}
+    cache.put(key("/fmping"), "/fmping", answer, cache.generation("/fmping"))
+    answer["nodes"].append("sw2")
+
+    _, first = cache.get(key("/fmping"))
+    first["nodes"].append("sw3")
+    assert cache.get(key("/fmping")) == (True, {"nodes": ["sw1"]})
+
+
+def test_invalidation_drops_the_path_and_its_dependents(clock):
+    cache = ResponseCache(ttls={"/fmping": 5, "/fmgroup": 60}, dependents={"/fmgroup": ("/fmping",)})
+    for path in ("/fmping", "/fmgroup"):
+        cache.put(key(path, "a"), path, path, cache.generation(path))
+        cache.put(key(path, "b"), path, path, cache.generation(path))
+
+    cache.invalidate("/fmping")
+    assert cache.get(key("/fmping", "a")) == (False, None)
+    assert cache.get(key("/fmgroup", "a")) == (True, "/fmgroup")
+
+    cache.invalidate("/fmgroup")
+    assert [cache.get(key(path, query))[0] for path in ("/fmping", "/fmgroup") for query in "ab"] == [False] * 4
+
+
+def test_answer_read_before_an_invalidation_is_not_stored(clock):
+    cache = ResponseCache(ttls={"/fmgroup": 60}, dependents={"/fmnode": ("/fmgroup",)})
+    generation = cache.generation("/fmgroup")
+    # A write lands while the GET is in flight
+    cache.invalidate("/fmnode")
+    assert cache.generation("/fmgroup") == generation + 1
+
+    cache.put(key("/fmgroup"), "/fmgroup", {"groups": ["old"]}, generation)
+    assert cache.get(key("/fmgroup")) == (False, None)
+    cache.put(key("/fmgroup"), "/fmgroup", {"groups": ["new"]}, cache.generation("/fmgroup"))
+    assert cache.get(key("/fmgroup")) == (True, {"groups": ["new"]})
+
+
+def test_least_recently_used_answers_are_dropped_first(clock):
+    cache = ResponseCache(ttls={"/fmping": 5}, max_entries=2)
+    for query in "abc":
+        if query == "c":
+            cache.get(key("/fmping", "a"))
+        cache.put(key("/fmping", query), "/fmping", query, 0)
+    assert [cache.get(key("/fmping", query))[0] for query in "abc"] == [True, False, True]
+
+
+def test_responses_are_cached_as_their_body(clock):
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["Content-Type"] = "text/plain"
+    response.encoding = "utf-8"
+    response._content = b'{"rules": 3}'
+    cache = ResponseCache(ttls={"/idsruleset": 60})
+    cache.put(key("/idsruleset"), "/idsruleset", response, 0)
+
+    _, first = cache.get(key("/idsruleset"))
+    _, second = cache.get(key("/idsruleset"))
+    assert first is not second and first is not response
+    assert first.json() == {"rules": 3}
+    assert b"".join(first.iter_content(4)) == b'{"rules": 3}'
+    assert second.text == u'{"rules": 3}' and second.headers["content-type"] == "text/plain"
+    assert second.status_code == 200
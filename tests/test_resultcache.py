@@ -0,0 +1,114 @@
+import json
+import os
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import pytest
+
+from sentrywire.exceptions import NotFound
+from sentrywire.v2.resultcache import MANIFEST, ResultCache
+
+BEGIN = datetime(2022, 2, 15, 18)
+END = datetime(2022, 2, 15, 19)
+
+
+class FakePcaps(object):
+    def get_all(self, node_name, search_name, dest_dir, **kwargs):
+        os.makedirs(dest_dir)
+        path = os.path.join(dest_dir, "%s_0.pcap" % search_name)
+        with open(path, "wb") as pcap_file:
+            pcap_file.write(node_name.encode("ascii"))
+        return {"0": path}
+
+
+class FakeObjects(object):
+    def __init__(self):
+        self.message = None
+
+    def get(self, node_name, search_token, file_path):
+        if self.message is not None:
+            return self.message
+        with open(file_path, "wb") as objects_file:
+            objects_file.write(b"zip")
+
+
+class FakeLogs(object):
+    def get(self, node_name, search_name, file_path):
+        if node_name == "sw2":
+            raise NotFound("Log not found")
+        with open(file_path, "wb") as logs_file:
+            logs_file.write(b"log")
+
+
+class FakeSearches(object):
+    def __init__(self):
+        self.pcaps = FakePcaps()
+        self.objects = FakeObjects()
+        self.logs = FakeLogs()
+        self.created = []
+        self.deleted = []
+
+    def create(self, search_name, begin_time, end_time, search_filter=None, max_packets=1000):
+        self.created.append(search_name)
+        return {"searchname": "token_%s" % search_name}
+
+    def watch(self, search_name):
+        future = Future()
+        future.set_result([{"SearchName": search_name, "NodeName": node} for node in ("sw1", "sw2")])
+        return future
+
+    def delete(self, search_token):
+        self.deleted.append(search_token)
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.searches = FakeSearches()
+
+
+def test_results_of_every_node_are_cached_and_the_search_deleted(tmp_path):
+    sw = FakeClient()
+    cache = ResultCache(sw, str(tmp_path))
+    result = cache.run("hunt", BEGIN, END, kinds=("pcaps", "objects", "logs"))
+
+    assert result["nodes"] == ["sw1", "sw2"]
+    assert [open(path, "rb").read() for path in result["pcaps"]] == [b"sw1", b"sw2"]
+    assert len(result["objects"]) == 2
+    assert [os.path.basename(os.path.dirname(path)) for path in result["logs"]] == ["sw1"]
+    assert sw.searches.deleted == ["token_hunt"]
+
+    assert cache.run("hunt", BEGIN, END, kinds=("pcaps", "objects")) == result
+    assert sw.searches.created == ["hunt"]
+
+
+def test_message_instead_of_results_is_not_cached(tmp_path):
+    sw = FakeClient()
+    sw.searches.objects.message = {"message": "Search not found"}
+    cache = ResultCache(sw, str(tmp_path))
+    with pytest.raises(NotFound):
+        cache.run("hunt", BEGIN, END, kinds=("pcaps", "objects"))
+
+    assert cache.get(None, BEGIN, END) is None
+    assert os.listdir(str(tmp_path)) == []
+    assert sw.searches.deleted == ["token_hunt"]
+
+
+def test_eviction_skips_results_being_written(tmp_path):
+    cache = ResultCache(FakeClient(), str(tmp_path), max_bytes=0)
+    work_dir = tmp_path / ".tmp_pending"
+    work_dir.mkdir()
+    with open(str(work_dir / MANIFEST), "w") as manifest_file:
+        json.dump({"search": "pending", "size": 10}, manifest_file)
+
+    cache.run("hunt", BEGIN, END)
+    assert (work_dir / MANIFEST).exists()
+
+
+def test_window_within_the_capture_lag_is_not_cached(tmp_path):
+    cache = ResultCache(FakeClient(), str(tmp_path / "cache"), capture_lag=30)
+    end = datetime.now() - timedelta(seconds=5)
+    result = cache.run("hunt", end - timedelta(minutes=1), end)
+
+    assert not result["pcaps"][0].startswith(str(tmp_path))
+    assert cache.get(None, end - timedelta(minutes=1), end) is None
+    assert os.listdir(str(tmp_path / "cache")) == []
@@ -0,0 +1,103 @@
+from email.utils import formatdate
+
+import pytest
+
+from sentrywire import retry
+from sentrywire.retry import RetryBudget, RetryPolicy, parse_retry_after
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(retry.time, "time", clock.time)
+    return clock
+
+
+def test_backoff_uses_full_jitter(monkeypatch):
+    bounds = []
+    monkeypatch.setattr(retry.random, "uniform", lambda low, high: bounds.append((low, high)) or high / 2)
+    policy = RetryPolicy(backoff_base=0.5, backoff_max=3.0)
+
+    assert [policy.backoff(attempt) for attempt in range(4)] == [0.25, 0.5, 1.0, 1.5]
+    assert bounds == [(0, 0.5), (0, 1.0), (0, 2.0), (0, 3.0)]
+
+
+def test_backoff_without_jitter_is_exponential():
+    policy = RetryPolicy(backoff_base=0.5, backoff_max=3.0, jitter=False)
+    assert [policy.backoff(attempt) for attempt in range(4)] == [0.5, 1.0, 2.0, 3.0]
+
+
+def test_only_safe_failures_are_retried():
+    policy = RetryPolicy(jitter=False)
+    assert policy.next_wait("GET", 0, 0, status=503) == 0.1
+    assert policy.next_wait("GET", 0, 0, status=404) is None
+    assert policy.next_wait("POST", 0, 0, status=503) is None
+    assert policy.next_wait("POST", 0, 0, status=429) == 0.1
+    assert policy.next_wait("GET", 0, 0, connection_error=True) == 0.1
+    assert policy.next_wait("POST", 0, 0, connection_error=True) is None
+
+
+def test_retries_stop_after_max_retries():
+    policy = RetryPolicy(max_retries=2, jitter=False)
+    assert policy.next_wait("GET", 1, 0, status=503) is not None
+    assert policy.next_wait("GET", 2, 0, status=503) is None
+    assert policy.next_wait("GET", 2, 0, status=503, max_retries=3) is not None
+    assert RetryPolicy(max_retries=-1).next_wait("GET", 1000, 0, status=503) is not None
+
+
+def test_retry_after_replaces_the_backoff(clock):
+    policy = RetryPolicy(jitter=False)
+    assert policy.next_wait("GET", 0, 0, status=503, retry_after="7") == 7.0
+    assert policy.next_wait("GET", 0, 0, status=503, retry_after=formatdate(clock.now + 30)) == 30.0
+    # An unreadable header falls back to the backoff
+    assert policy.next_wait("GET", 0, 0, status=503, retry_after="soon") == 0.1
+    assert RetryPolicy(jitter=False, respect_retry_after=False).next_wait("GET", 0, 0, status=503,
+                                                                       retry_after="7") == 0.1
+
+
+def test_parse_retry_after(clock):
+    assert parse_retry_after("2.5") == 2.5
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after(formatdate(clock.now - 60)) == 0.0
+    assert parse_retry_after("soon") is None
+
+
+def test_waits_past_max_elapsed_give_up():
+    policy = RetryPolicy(jitter=False, max_elapsed=10)
+    assert policy.next_wait("GET", 0, 5, status=503, retry_after="5") == 5.0
+    assert policy.next_wait("GET", 0, 5, status=503, retry_after="6") is None
+
+
+def test_retries_stop_when_the_budget_is_spent(clock):
+    budget = RetryBudget(ratio=0.5, min_per_second=1.0, max_tokens=2.0)
+    policy = RetryPolicy(jitter=False, budget=budget)
+
+    assert policy.next_wait("GET", 0, 0, status=503) is not None
+    assert policy.next_wait("GET", 0, 0, status=503) is not None
+    assert policy.next_wait("GET", 0, 0, status=503) is None
+
+    # Two requests earn one retry
+    policy.on_request()
+    assert policy.next_wait("GET", 0, 0, status=503) is None
+    policy.on_request()
+    assert policy.next_wait("GET", 0, 0, status=503) is not None
+    assert policy.next_wait("GET", 0, 0, status=503) is None
+
+    # And time trickles more in, up to max_tokens
+    clock.now += 60
+    assert [budget.withdraw() for _ in range(3)] == [True, True, False]
+
+
+def test_spent_budget_does_not_consume_a_retry_that_is_not_allowed(clock):
+    budget = RetryBudget(max_tokens=1.0)
+    policy = RetryPolicy(budget=budget)
+    assert policy.next_wait("GET", 0, 0, status=404) is None
+    assert budget.withdraw()
@@ -0,0 +1,122 @@
+import struct
+from contextlib import contextmanager
+
+import pytest
+
+from sentrywire.exceptions import NotFound, PcapError, SentrywireException
+from sentrywire.pcap import PcapHeader
+from sentrywire.v2.search import Pcaps
+
+
+class FakeClient(object):
+    rest_token = "token"
+    chunk_size = 1024
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.downloads = 0
+
+    def http_download(self, path, file_path, **kwargs):
+        self.downloads += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        if answer is None:
+            with open(file_path, "wb") as pcap_file:
+                pcap_file.write(b"pcap")
+        return answer
+
+
+def test_get_raises_not_found_on_a_message(tmp_path):
+    pcaps = Pcaps(FakeClient([{"message": "Search not found"}]))
+    with pytest.raises(NotFound):
+        pcaps.get("sw1", "search", "0", str(tmp_path / "0.pcap"))
+
+
+def test_get_all_does_not_retry_a_message(tmp_path):
+    sw = FakeClient([{"message": "Search not found"}])
+    with pytest.raises(SentrywireException):
+        Pcaps(sw).get_all("sw1", "search", str(tmp_path), indices=["0"], retries=3)
+    assert sw.downloads == 1
+
+
+def test_get_all_retries_failed_chunks(tmp_path):
+    sw = FakeClient([IOError("reset"), None])
+    paths = Pcaps(sw).get_all("sw1", "search", str(tmp_path), indices=["0"], retries=3)
+    assert list(paths) == ["0"]
+    assert sw.downloads == 2
+
+
+class ListedPcaps(Pcaps):
+    def __init__(self, sw, entries):
+        super(ListedPcaps, self).__init__(sw)
+        self.entries = entries
+
+    def list(self, node_name, search_token):
+        return self.entries
+
+
+def test_get_all_reads_the_listed_indices(tmp_path):
+    sw = FakeClient([None, None])
+    paths = ListedPcaps(sw, ["0", 1]).get_all("sw1", "search", str(tmp_path))
+    assert list(paths) == ["0", "1"]
+
+
+def test_get_all_reads_text_and_long_indices(tmp_path):
+    sw = FakeClient([None, None])
+    paths = ListedPcaps(sw, [u"0", 2 ** 64]).get_all("sw1", "search", str(tmp_path))
+    assert sorted(paths) == ["0", str(2 ** 64)]
+
+
+def test_get_all_rejects_unknown_chunklist_entries(tmp_path):
+    pcaps = ListedPcaps(FakeClient([]), [{"chunk": "0"}])
+    with pytest.raises(SentrywireException):
+        pcaps.get_all("sw1", "search", str(tmp_path))
+
+
+class StreamedResult(object):
+    headers = {"Content-Type": "application/octet-stream"}
+
+    def __init__(self, data):
+        self.data = data
+
+    def iter_content(self, chunk_size):
+        return [self.data[n:n + chunk_size] for n in range(0, len(self.data), chunk_size)]
+
+    def close(self):
+        pass
+
+
+class StreamingClient(FakeClient):
+    def __init__(self, chunks):
+        super(StreamingClient, self).__init__([])
+        self.chunks = chunks
+
+    @contextmanager
+    def _lane_slot(self, lane):
+        yield
+
+    def http_request(self, verb, path, params=None, **kwargs):
+        return StreamedResult(self.chunks[params["type"]])
+
+
+def raw_ip_pcap(linktype, count):
+    packet = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 28, 0, 0, 64, 17, 0, b"\x0a\x00\x00\x01", b"\x0a\x00\x00\x02")
+    packet += struct.pack("!HHHH", 1000, 53, 8, 0)
+    records = [struct.pack("<IIII", 1000 + n, 0, len(packet), len(packet)) + packet for n in range(count)]
+    return PcapHeader(linktype=linktype).pack() + b"".join(records)
+
+
+def test_flows_use_the_link_type_of_the_chunks():
+    pytest.importorskip("numpy")
+    sw = StreamingClient({"0": raw_ip_pcap(101, 2), "1": raw_ip_pcap(101, 3)})
+    flows = Pcaps(sw).flows("sw1", "search", indices=["0", "1"])
+    assert [(row["src"], row["dst"], row["sport"], row["dport"], row["packets"]) for row in flows] == [
+        ("10.0.0.1", "10.0.0.2", 1000, 53, 5)]
+
+
+def test_flows_reject_mixed_link_types():
+    pytest.importorskip("numpy")
+    sw = StreamingClient({"0": raw_ip_pcap(101, 2), "1": raw_ip_pcap(1, 3)})
+    with pytest.raises(PcapError):
+        Pcaps(sw).flows("sw1", "search", indices=["0", "1"])
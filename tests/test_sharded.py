@@ -0,0 +1,99 @@
+import os
+import struct
+from datetime import datetime, timedelta
+
+import pytest
+
+from sentrywire.exceptions import TooManyRequests
+from sentrywire.pcap import PcapHeader, iter_packets
+from sentrywire.v2 import sharded
+from sentrywire.v2.sharded import ShardedSearch, split_window
+
+
+def write_pcap(path, timestamps):
+    with open(path, "wb") as pcap_file:
+        pcap_file.write(PcapHeader().pack())
+        for timestamp in timestamps:
+            pcap_file.write(struct.pack("<IIII", timestamp, 0, 1, 1) + b"x")
+
+
+class FakePcaps(object):
+    def __init__(self):
+        self.downloads = []
+
+    def get_all(self, node_name, search_name, dest_dir, workers=None):
+        self.downloads.append((search_name, node_name))
+        if not os.path.isdir(dest_dir):
+            os.makedirs(dest_dir)
+        path = os.path.join(dest_dir, "%s_0.pcap" % search_name)
+        write_pcap(path, [1000 if node_name == "sw1" else 1001, 1002])
+        return {"0": path}
+
+
+class FakeWatcher(object):
+    def wait(self, search_names, timeout=None):
+        return dict((name, [{"NodeName": "sw1"}, {"NodeName": "sw2"}]) for name in search_names)
+
+
+class FakeSearches(object):
+    def __init__(self):
+        self.pcaps = FakePcaps()
+        self.watcher = FakeWatcher()
+        self.full = 0
+
+    def create(self, search_name, begin_time, end_time, search_filter=None, max_packets=1000):
+        if self.full:
+            self.full -= 1
+            raise TooManyRequests("Too many searches")
+        return {"searchname": search_name}
+
+
+class FakeClient(object):
+    chunk_size = 1024
+
+    def __init__(self):
+        self.searches = FakeSearches()
+
+
+def test_split_window_slices_do_not_share_a_second():
+    begin = datetime(2022, 2, 15, 18, 0, 0, 500000)
+    end = datetime(2022, 2, 15, 18, 0, 10)
+    windows = split_window(begin, end, 4)
+
+    assert windows[0][0] == begin.replace(microsecond=0)
+    assert windows[-1][1] == end
+    for (_, previous_end), (next_begin, _) in zip(windows, windows[1:]):
+        assert next_begin - previous_end == timedelta(seconds=1)
+    for window_begin, window_end in windows:
+        assert window_begin <= window_end
+
+
+def test_get_downloads_every_node(tmp_path):
+    sw = FakeClient()
+    output = str(tmp_path / "joined.pcap")
+    ShardedSearch(sw).get(["slice_0", "slice_1"], output)
+
+    assert sorted(sw.searches.pcaps.downloads) == [("slice_0", "sw1"), ("slice_0", "sw2"),
+                                                   ("slice_1", "sw1"), ("slice_1", "sw2")]
+    timestamps = [packet.timestamp for packet in iter_packets(output)]
+    assert timestamps == sorted(timestamps) and len(timestamps) == 8
+
+
+def test_create_backs_off_with_jitter(monkeypatch):
+    sw = FakeClient()
+    sw.searches.full = 2
+    waits = []
+    monkeypatch.setattr(sharded.time, "sleep", waits.append)
+    search = ShardedSearch(sw)
+    search.retry_policy.backoff = lambda attempt: attempt + 0.5
+
+    assert search.create("hunt", datetime(2022, 1, 1), datetime(2022, 1, 1, 1), shards=1) == ["hunt_0"]
+    assert waits == [0.5, 1.5]
+
+
+def test_create_gives_up_after_retries(monkeypatch):
+    sw = FakeClient()
+    sw.searches.full = 3
+    monkeypatch.setattr(sharded.time, "sleep", lambda seconds: None)
+    with pytest.raises(TooManyRequests):
+        ShardedSearch(sw).create("hunt", datetime(2022, 1, 1), datetime(2022, 1, 1, 1), shards=1, retries=2)
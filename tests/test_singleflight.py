@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from sentrywire.singleflight import SingleFlight
+
+
+class Call(object):
+    """Call that blocks until released, counting how many times it ran"""
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.entered.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def run_concurrently(flight, call, waiters=3):
+    """Run call through flight in one thread, then in waiters more while it is in flight"""
+    outcomes = []
+    lock = threading.Lock()
+
+    def caller():
+        try:
+            outcome = flight.do("key", call)
+        except Exception as error:
+            outcome = error
+        with lock:
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=caller)]
+    threads[0].start()
+    assert call.entered.wait(5)
+    threads.extend(threading.Thread(target=caller) for _ in range(waiters))
+    for thread in threads[1:]:
+        thread.start()
+    # Let the waiters reach the call in flight before it returns
+    time.sleep(0.1)
+    call.release.set()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def test_concurrent_callers_share_one_call():
+    call = Call(result={"nodes": ["sw1"]})
+    outcomes = run_concurrently(SingleFlight(), call)
+
+    assert call.calls == 1
+    assert outcomes == [{"nodes": ["sw1"]}] * 4
+
+
+def test_waiters_get_a_copy_of_the_result():
+    call = Call(result={"nodes": ["sw1"]})
+    outcomes = run_concurrently(SingleFlight(), call)
+
+    assert len(set(id(outcome) for outcome in outcomes)) == 4
+    assert len(set(id(outcome["nodes"]) for outcome in outcomes)) == 4
+    outcomes[0]["nodes"].append("sw2")
+    assert outcomes[1] == {"nodes": ["sw1"]}
+
+
+def test_exception_reaches_every_caller():
+    error = ValueError("unit unreachable")
+    call = Call(error=error)
+    outcomes = run_concurrently(SingleFlight(), call)
+
+    assert call.calls == 1
+    assert outcomes == [error] * 4
+
+
+def test_key_is_released_after_the_call():
+    flight = SingleFlight()
+    results = iter([1, 2])
+    assert flight.do("key", lambda: next(results)) == 1
+    assert flight.do("key", lambda: next(results)) == 2
+
+    with pytest.raises(KeyError):
+        flight.do("key", {}.__getitem__, "missing")
+    assert flight.do("key", lambda: 3) == 3
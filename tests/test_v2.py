@@ -0,0 +1,11 @@
+import sentrywire.v2
+
+
+def test_module_namespace_does_not_leak_imports():
+    names = dir(sentrywire.v2)
+    assert "sys" not in names and "importlib" not in names
+    assert set(sentrywire.v2.__all__) <= set(names)
+
+
+def test_names_are_imported_on_first_use():
+    assert sentrywire.v2.ShardedSearch.__name__ == "ShardedSearch"
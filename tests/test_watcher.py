@@ -0,0 +1,67 @@
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from sentrywire.exceptions import NotFound
+from sentrywire.v2.watcher import SearchWatcher
+
+
+class FakeSearches(object):
+    def __init__(self):
+        self.pending_names = []
+        self.completed_names = []
+        self.completed_calls = 0
+
+    def pending(self):
+        if not self.pending_names:
+            raise NotFound("No pending searches found")
+        return [{"SearchName": name} for name in self.pending_names]
+
+    def completed(self):
+        self.completed_calls += 1
+        return [{"SearchName": name, "NodeName": "sw1"} for name in self.completed_names]
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.searches = FakeSearches()
+
+
+def stopped_watcher(sw, *names):
+    watcher = SearchWatcher(sw, min_interval=100, max_interval=100)
+    futures = [watcher.watch(name) for name in names]
+    watcher.stop()
+    return watcher, futures
+
+
+def test_unknown_names_do_not_fetch_completed_every_poll():
+    sw = FakeClient()
+    watcher, _ = stopped_watcher(sw, "ghost")
+    watcher.poll()
+    calls = sw.searches.completed_calls
+    for _ in range(5):
+        watcher.poll()
+    assert sw.searches.completed_calls == calls
+
+
+def test_search_leaving_pending_is_looked_up():
+    sw = FakeClient()
+    sw.searches.pending_names = ["slow"]
+    watcher, (ghost, slow) = stopped_watcher(sw, "ghost", "slow")
+    watcher.poll()
+    watcher.poll()
+
+    sw.searches.pending_names = []
+    sw.searches.completed_names = ["slow"]
+    assert watcher.poll() == ["slow"]
+    assert slow.result(0) == [{"SearchName": "slow", "NodeName": "sw1"}]
+    assert not ghost.done()
+
+
+def test_watch_timeout_fails_the_future():
+    sw = FakeClient()
+    watcher = SearchWatcher(sw, min_interval=0.01, max_interval=0.05)
+    future = watcher.watch("ghost", timeout=0.1)
+    with pytest.raises(TimeoutError):
+        future.result(5)
+    watcher.stop()